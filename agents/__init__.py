@@ -1,6 +1,19 @@
 from base import Agent
+from functools import lru_cache
+from importlib import import_module
 from typing import List, Dict, Any
 
+
+@lru_cache(maxsize=None)
+def load_agent_class(module_name: str, class_name: str) -> type:
+    """
+    Imports an agent class of the `agents` package, as named in the `agents` entries of game.cfg. Classes are looked up
+    once per process.
+    :param module_name: module of the agents package, e.g. "student_agent"
+    :param class_name: e.g. "MyACMEAgent"
+    """
+    return getattr(import_module("agents." + module_name), class_name)
+
 """
 #### AGENT PARENT CLASSES
 """
@@ -24,6 +37,16 @@ class HouseOwnerAgent(Agent):
 
         return budget_dict
 
+    def notify_item_feasibility(self, feasibility: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Function called once, before the auction phase starts, with the result of the feasibility analysis of
+        every construction item
+        :param feasibility: dict mapping each construction item to its `budget`, `min_cost` among the specialized
+        companies, number of `eligible_bidders`, budget `slack` and `feasible` flag
+        :return:
+        """
+        pass
+
     def propose_item_budget(self, auction_item: str, auction_round: int) -> float:
         """
         Function called during the auction phase, when the owner agent has to announce a new price for a new
@@ -58,6 +81,34 @@ class HouseOwnerAgent(Agent):
         """
         raise NotImplementedError("Must be implemented by student")
 
+    def expected_partner_responses(self, negotiation_item: str, partner_agent: str,
+                                   negotiation_round: int) -> List[float]:
+        """
+        Function called in speculative mode (`speculative_offers` in game.cfg), after the owner offer of a round,
+        while the partner agent is deciding its response.
+        :param negotiation_item:
+        :param partner_agent:
+        :param negotiation_round: the round of the owner offer the partner responds to
+        :return: the responses the owner expects from the partner, for which its offer of the next round is prepared
+        with `speculate_negotiation_offer` (none by default)
+        """
+        return []
+
+    def speculate_negotiation_offer(self, negotiation_item: str, partner_agent: str, negotiation_round: int,
+                                    expected_response: float) -> None:
+        """
+        Function called in speculative mode, in a worker thread while the partner agent is deciding, to prepare the
+        offer of `negotiation_round` in case the partner responds `expected_response`. It must not change the
+        negotiation state of the agent: `provide_negotiation_offer` uses the prepared offer if the actual response
+        matches the expected one, and discards it otherwise.
+        :param negotiation_item:
+        :param partner_agent:
+        :param negotiation_round: the round of the prepared offer
+        :param expected_response: one of the `expected_partner_responses`
+        :return:
+        """
+        pass
+
     def notify_partner_response(self, response_msg: "NegotiationMessage") -> None:
         """
         Function called to notify the owner of a response from a company agent, in response to his current offer within
@@ -140,3 +191,13 @@ class CompanyAgent(Agent):
         """
         pass
 
+    def notify_reply_discarded(self, message: Any) -> None:
+        """
+        Function called through the message bus when the agent answered a message after `reply_timeout`: the
+        environment used the default reply (no bid, no concession) instead, so the agent should forget what it recorded
+        when it answered. Called before the agent handles its next message.
+        :param message: the `AuctionAnnouncement` or `NegotiationMessage` that was answered too late
+        :return:
+        """
+        pass
+
@@ -0,0 +1,132 @@
+"""
+Decoding and validation of the JSON responses of the LLM.
+
+Every LLM decision is a JSON object with a "reasoning" and one decision field, which depends on the role and the
+stage of the decision (`DECISION_FIELDS`). The responses are decoded with `decode_response`, which repairs the usual
+malformed outputs (a JSON object wrapped in a ```json fenced code block or in prose, trailing commas, a list holding
+the object), and the decision is read with the precompiled schema of its (role, stage), which accepts the decision
+in the common wrong types (numbers given as strings such as "1,250.50" or "$900", booleans given as "yes" / "true"):
+
+    llm_response = decode_response(response_text)
+    offer = OWNER_NEGOTIATION.decision(llm_response)  # None when the agent must use its fallback
+"""
+import json
+import math
+import re
+from typing import Any, Callable, Dict, Optional, Tuple
+
+OWNER = "ACME"
+COMPANY = "Company"
+
+# field of the LLM response holding the decision, per (role, stage)
+DECISION_FIELDS = {
+    (OWNER, "Auction"): "proposed_budget",
+    (COMPANY, "Auction"): "decision_to_bid",
+    (OWNER, "Negotiation"): "negotiation_offer",
+    (COMPANY, "Negotiation"): "counter_offer",
+}
+
+_FENCED_BLOCK = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_NUMBER_STRING = re.compile(r"\s*[$€£]?\s*([-+]?(?:\d{1,3}(?:,\d{3})+|\d*)(?:\.\d*)?)\s*(?:USD|EUR)?\s*", re.IGNORECASE)
+_BOOLEAN_STRINGS = {"true": True, "yes": True, "false": False, "no": False}
+
+_decoder = json.JSONDecoder()
+
+
+class ResponseDecodeError(ValueError):
+    """
+    Raised when an LLM response holds no JSON object, even after repairs
+    """
+    pass
+
+
+def _to_number(value: Any) -> Optional[float]:
+    if isinstance(value, str):
+        match = _NUMBER_STRING.fullmatch(value)
+        if match is None or not any(char.isdigit() for char in match.group(1)):
+            return None
+        value = float(match.group(1).replace(",", ""))
+    elif isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _to_boolean(value: Any) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return _BOOLEAN_STRINGS.get(value.strip().lower())
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    return None
+
+
+class ResponseSchema(object):
+    """
+    Decision field of the responses of one (role, stage) and the conversion of its value
+    """
+    __slots__ = ("field", "convert")
+
+    def __init__(self, field: str, convert: Callable[[Any], Any]):
+        self.field = field
+        self.convert = convert
+
+    def decision(self, response: Dict[str, Any]) -> Any:
+        """
+        :return: the decision of the response converted to its type, None if the response is an error or its decision
+        is missing or cannot be converted (the agent then uses its fallback)
+        """
+        if "error" in response:
+            return None
+        value = response.get(self.field)
+        return None if value is None else self.convert(value)
+
+
+RESPONSE_SCHEMAS: Dict[Tuple[str, str], ResponseSchema] = {
+    key: ResponseSchema(field, _to_boolean if field == "decision_to_bid" else _to_number)
+    for key, field in DECISION_FIELDS.items()
+}
+
+OWNER_AUCTION = RESPONSE_SCHEMAS[(OWNER, "Auction")]
+COMPANY_AUCTION = RESPONSE_SCHEMAS[(COMPANY, "Auction")]
+OWNER_NEGOTIATION = RESPONSE_SCHEMAS[(OWNER, "Negotiation")]
+COMPANY_NEGOTIATION = RESPONSE_SCHEMAS[(COMPANY, "Negotiation")]
+
+
+def _repair(text: str) -> Any:
+    fenced = _FENCED_BLOCK.search(text)
+    if fenced is not None:
+        text = fenced.group(1)
+
+    start = text.find("{")
+    if start < 0:
+        return None
+    text = text[start:]
+    for candidate in (text, _TRAILING_COMMA.sub(r"\1", text)):
+        try:
+            # raw_decode ignores whatever follows the object
+            return _decoder.raw_decode(candidate)[0]
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def decode_response(text: str) -> Dict[str, Any]:
+    """
+    Decodes the JSON object of an LLM response, repairing it if it is not plain JSON
+    :raise ResponseDecodeError: if the response holds no JSON object
+    """
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError as e:
+        value = _repair(text)
+        if value is None:
+            raise ResponseDecodeError(str(e)) from e
+
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        value = value[0]
+    if not isinstance(value, dict):
+        raise ResponseDecodeError("expected a JSON object, got %s" % type(value).__name__)
+    return value
@@ -0,0 +1,169 @@
+"""
+Price memory of the house owner, kept across games.
+
+For every construction item the memory keeps the auction clearing price (the owner offer that got the first bids)
+and the negotiated price of the contract, as means decayed over time: an observation weighs half as much after
+`half_life_days`, so that the memory follows a market that moves. Items whose observations all faded away are
+forgotten, and at most `max_items` items are kept (the least recently observed ones are dropped first).
+
+The memory is a JSON file shared by the games of a project, given to `MyACMEAgent` through the `price_memory` option
+of its game.cfg entry. Observations are merged into the current content of the file when it is saved, so that
+consecutive and concurrent games (tournament workers) add up instead of overwriting each other. Saves hold an
+exclusive lock on a "<path>.lock" file next to the memory, so that two concurrent merges do not lose each other's
+observations (on platforms without `fcntl`, concurrent games must use separate files).
+
+    memory = PriceMemory.load("price_memory.json")
+    memory.observe("structural design", AUCTION_PRICE, 3951.5)
+    memory.estimate("structural design", AUCTION_PRICE)
+    memory.save()
+"""
+import contextlib
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+PRICE_MEMORY_FORMAT_VERSION = 1
+
+AUCTION_PRICE = "auction"
+NEGOTIATED_PRICE = "negotiated"
+
+DEFAULT_HALF_LIFE_DAYS = 30.0
+DEFAULT_MAX_ITEMS = 1000
+
+# decayed weight below which an observation is forgotten (~ 6 half-lives for a single observation)
+MIN_WEIGHT = 0.02
+
+SECONDS_PER_DAY = 86400.0
+
+
+class PriceMemory(object):
+    """
+    Time-decayed mean prices per item and kind of price (AUCTION_PRICE, NEGOTIATED_PRICE)
+    """
+
+    def __init__(self, path: Optional[str] = None, half_life_days: float = DEFAULT_HALF_LIFE_DAYS,
+                 max_items: int = DEFAULT_MAX_ITEMS):
+        """
+        :param path: file the memory is saved to, the memory only lives in this process if None
+        """
+        self.path = path
+        self.half_life = half_life_days * SECONDS_PER_DAY
+        self.max_items = max_items
+        # item -> kind -> [mean price, weight, time of the last observation]
+        self.items: Dict[str, Dict[str, List[float]]] = {}
+        self._pending: List[Tuple[str, str, float, float]] = []
+
+    @staticmethod
+    def load(path: str, half_life_days: float = DEFAULT_HALF_LIFE_DAYS,
+             max_items: int = DEFAULT_MAX_ITEMS) -> "PriceMemory":
+        """
+        :return: the memory saved in the file, an empty memory if the file does not exist yet
+        """
+        memory = PriceMemory(path, half_life_days, max_items)
+        memory.items = memory._read()
+        return memory
+
+    def _read(self) -> Dict[str, Dict[str, List[float]]]:
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+
+        with open(self.path) as f:
+            data = json.load(f)
+        if data.get("version") != PRICE_MEMORY_FORMAT_VERSION:
+            raise ValueError("Unsupported price memory format in %s" % self.path)
+        return data["items"]
+
+    def _decayed_weight(self, weight: float, since: float, now: float) -> float:
+        return weight * 0.5 ** (max(now - since, 0.0) / self.half_life)
+
+    def _add(self, items: Dict[str, Dict[str, List[float]]], item: str, kind: str, price: float, now: float) -> None:
+        entry = items.setdefault(item, {})
+        if kind in entry:
+            mean, weight, updated = entry[kind]
+            weight = self._decayed_weight(weight, updated, now)
+            entry[kind] = [(mean * weight + price) / (weight + 1.0), weight + 1.0, now]
+        else:
+            entry[kind] = [price, 1.0, now]
+        # dicts keep the insertion order: the last item is the most recently observed one
+        items[item] = items.pop(item)
+
+    def observe(self, item: str, kind: str, price: float, now: Optional[float] = None) -> None:
+        """
+        Adds a price of a game to the memory; it is written to the file by the next `save`
+        """
+        now = time.time() if now is None else now
+        self._add(self.items, item, kind, price, now)
+        self._pending.append((item, kind, price, now))
+
+    def estimate(self, item: str, kind: str, now: Optional[float] = None) -> Optional[float]:
+        """
+        :return: the decayed mean price of the item, None if it was never observed or its observations faded away
+        """
+        observed = self.items.get(item, {}).get(kind)
+        if observed is None:
+            return None
+
+        now = time.time() if now is None else now
+        return observed[0] if self._decayed_weight(observed[1], observed[2], now) >= MIN_WEIGHT else None
+
+    def _prune(self, items: Dict[str, Dict[str, List[float]]], now: float) -> Dict[str, Dict[str, List[float]]]:
+        pruned = {}
+        for item, entry in items.items():
+            kept = {kind: observed for kind, observed in entry.items()
+                    if self._decayed_weight(observed[1], observed[2], now) >= MIN_WEIGHT}
+            if kept:
+                pruned[item] = kept
+        # keep the most recently observed items
+        return dict(list(pruned.items())[-self.max_items:]) if self.max_items > 0 else {}
+
+    def save(self) -> None:
+        """
+        Merges the observations made since the last save into the file, and reloads the merged memory
+        """
+        if self.path is None:
+            self.items = self._prune(self.items, time.time())
+            self._pending = []
+            return
+
+        with self._locked():
+            items = self._read()
+            for item, kind, price, observed_at in self._pending:
+                self._add(items, item, kind, price, observed_at)
+            items = self._prune(items, time.time())
+
+            # written to a temporary file first, so that concurrent games never read a partial memory
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_file = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": PRICE_MEMORY_FORMAT_VERSION, "items": items}, f)
+            os.replace(tmp_file, self.path)
+
+        self.items = items
+        self._pending = []
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        """
+        Holds an exclusive lock on the lock file of the memory, from the read to the replacement of the file. The lock
+        file is never replaced, unlike the memory file, so that every process locks the same file.
+        """
+        if fcntl is None:
+            yield
+            return
+
+        with open(self.path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        return len(self.items)
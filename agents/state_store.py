@@ -0,0 +1,118 @@
+"""
+Bounded storage of the per-item state of agents.
+
+Agents that stay alive across many games or projects (reusable environments, agent hosts) would otherwise keep the
+state of every item they ever saw. A `BoundedStateStore` is a dict that keeps at most `max_entries` entries: reading
+or writing an entry makes it the most recently used one, and the least recently used entry is evicted when the
+store is full. Entries leave the store through `archive` once their item is settled, or through `archive_all` at the
+end of a game; evicted and archived entries are passed to the archival hook, if any, so that they can be kept for
+analysis outside of the agent memory. Stores can be used from several threads at the same time, e.g. by the item
+threads of `simultaneous_items` games:
+
+    store = BoundedStateStore(max_entries=1000, archive_hook=JsonlArchive("agent_state.jsonl", "ACME"))
+    store["structural design"] = 3951.5
+    store.archive("structural design")
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, MutableMapping, Optional
+
+DEFAULT_MAX_ENTRIES = 10000
+
+# archive_hook(store name, key, value)
+ArchiveHook = Callable[[str, Hashable, Any], None]
+
+
+class BoundedStateStore(MutableMapping):
+    """
+    Dict of at most `max_entries` entries, evicting the least recently used entry into the archival hook
+    """
+
+    def __init__(self, name: str, max_entries: int = DEFAULT_MAX_ENTRIES, archive_hook: Optional[ArchiveHook] = None):
+        """
+        :param name: name of the store, given to the archival hook with every entry
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.archive_hook = archive_hook
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key: Hashable) -> Any:
+        with self._lock:
+            value = self._entries[key]
+            self._entries.move_to_end(key)
+            return value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted_key, evicted_value = self._entries.popitem(last=False)
+                self.evictions += 1
+                self._archive(evicted_key, evicted_value)
+
+    def __delitem__(self, key: Hashable) -> None:
+        with self._lock:
+            del self._entries[key]
+
+    def __contains__(self, key: object) -> bool:
+        # membership tests do not count as a use
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[Hashable]:
+        # over a copy of the keys, which other threads may change meanwhile
+        with self._lock:
+            return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        with self._lock:
+            return "BoundedStateStore(%r, %r)" % (self.name, dict(self._entries))
+
+    def _archive(self, key: Hashable, value: Any) -> None:
+        if self.archive_hook is not None:
+            self.archive_hook(self.name, key, value)
+
+    def archive(self, key: Hashable) -> None:
+        """
+        Removes an entry that is not needed anymore, passing it to the archival hook
+        """
+        with self._lock:
+            if key in self._entries:
+                self._archive(key, self._entries.pop(key))
+
+    def archive_all(self) -> None:
+        """
+        Removes all the entries, passing them to the archival hook (at the end of a game)
+        """
+        with self._lock:
+            while self._entries:
+                self._archive(*self._entries.popitem(last=False))
+
+    def clear(self) -> None:
+        # faster than the one-by-one removal of MutableMapping.clear
+        with self._lock:
+            self._entries.clear()
+
+
+class JsonlArchive(object):
+    """
+    Archival hook appending the archived entries of an agent to a JSON lines file, one entry per line
+    """
+
+    def __init__(self, path: str, agent_name: str):
+        self.path = path
+        self.agent_name = agent_name
+        self._lock = threading.Lock()
+
+    def __call__(self, store_name: str, key: Hashable, value: Any) -> None:
+        record: Dict[str, Any] = {"agent": self.agent_name, "store": store_name, "key": key, "value": value}
+        line = json.dumps(record, default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
@@ -1,12 +1,21 @@
 import json
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional, Tuple
 
 from dotenv import load_dotenv
 import google.generativeai as genai
 
 from agents import HouseOwnerAgent, CompanyAgent 
-from communication import NegotiationMessage   
+from communication import NegotiationMessage, AuctionAnnouncement
+from agents.surrogate_policy import SurrogatePolicy
+from agents.state_store import BoundedStateStore, JsonlArchive, DEFAULT_MAX_ENTRIES
+from agents.price_memory import PriceMemory, AUCTION_PRICE, NEGOTIATED_PRICE, DEFAULT_HALF_LIFE_DAYS, DEFAULT_MAX_ITEMS
+from agents.llm_response import (DECISION_FIELDS, decode_response, ResponseDecodeError, OWNER_AUCTION,
+                                 COMPANY_AUCTION, OWNER_NEGOTIATION, COMPANY_NEGOTIATION)
+from token_accounting import TokenLedger, estimate_tokens, response_usage
 
 
 # --- Load Environment Variables ---
@@ -19,17 +28,61 @@ if GEMINI_API_KEY:
 else:
     print("WARNING: GEMINI_API_KEY not found in .env file. LLM calls will be skipped, and agents will use fallback logic.")
 
+# --- Share of the remembered clearing price of an item (price memory) the owner opens its auction at ---
+REMEMBERED_PRICE_OPENING = 0.95
+
+# --- Share of the budget slack (budget - lowest contractor cost) kept above the lowest cost in auction offers ---
+MIN_COST_SLACK_MARGIN = 0.25
+
+GEMINI_MODEL_NAME = 'gemini-2.5-flash-preview-05-20'
+
+# --- Min. confidence of the surrogate policy for its decision to be used instead of calling the LLM ---
+DEFAULT_SURROGATE_THRESHOLD = 0.8
+
+# --- Max. number of LLM calls that can be pending at the same time when agents have a decision deadline ---
+LLM_DEADLINE_WORKERS = 32
+
+# --- Timeout of the Gemini request of a decision with a deadline, in deadlines: a late answer is still logged until
+# then, and a hung request gives its worker thread back instead of holding it forever ---
+LLM_REQUEST_TIMEOUT_DEADLINES = 2.0
+
+# --- Max. number of expected partner responses the owner prepares its next offer for, in speculative mode ---
+DEFAULT_SPECULATIVE_CANDIDATES = 2
+
+# --- Max. gap between the actual and the expected partner response for a prepared offer to be used, as a share of the
+# actual response ---
+DEFAULT_SPECULATION_TOLERANCE = 0.01
+
+# --- Min. increase of an owner offer over its previous one, and gap below which the stub backend settles ---
+MIN_OFFER_INCREMENT = 0.01
+SETTLE_GAP = 0.01
+
+# --- Decision backends (llm_backend option): Gemini, or a deterministic stub for benchmarks without API calls ---
+GEMINI_BACKEND = "gemini"
+STUB_BACKEND = "stub"
+
 # --- Global Log for Prompts and Responses ---
 llm_interactions_log = []
 
+# --- Global Token Usage of the LLM Calls ---
+token_ledger = TokenLedger(GEMINI_MODEL_NAME)
+
+# --- Worker Threads for LLM Calls with a Decision Deadline ---
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_DEADLINE_WORKERS, thread_name_prefix="llm")
+
 # --- Gemini LLM Call Function ---
-def call_gemini_llm(agent_name: str, agent_role: str, interaction_stage: str, item_name: str, round_num: int, system_prompt: str, user_prompt: str):
+def call_gemini_llm(agent_name: str, agent_role: str, interaction_stage: str, item_name: str, round_num: int, system_prompt: str, user_prompt: str,
+                    deadline: Optional[float] = None, context: Optional[Dict[str, Any]] = None, backend: str = GEMINI_BACKEND,
+                    speculative: bool = False):
     """
     Makes a call to the Gemini LLM and returns the parsed JSON response.
-    Logs the interaction.
+    Logs the interaction, with the structured inputs of the decision (context) if given.
+    If a deadline (in seconds) is given and the LLM does not answer in time, an error response is returned right away
+    so that the agent uses its fallback logic. The late answer is still logged when it arrives, marked with "late".
+    The request itself times out after LLM_REQUEST_TIMEOUT_DEADLINES deadlines.
+    With the stub backend, the response is computed from the context by `stub_llm_response` instead.
+    Speculative calls (decisions prepared before it is known whether they are needed) are logged with "speculative".
     """
-    global llm_interactions_log
-    
     log_entry = {
         "agent_name": agent_name,
         "agent_role": agent_role,
@@ -40,6 +93,40 @@ def call_gemini_llm(agent_name: str, agent_role: str, interaction_stage: str, it
         "user_prompt": user_prompt,
         "llm_response": None
     }
+    if context is not None:
+        log_entry["context"] = context
+    if speculative:
+        log_entry["speculative"] = True
+
+    if backend == STUB_BACKEND:
+        log_entry["backend"] = STUB_BACKEND
+        log_entry["llm_response"] = stub_llm_response(agent_role, interaction_stage, context or {})
+        llm_interactions_log.append(log_entry)
+        return log_entry["llm_response"]
+
+    if deadline is None or not GEMINI_API_KEY:
+        return _call_gemini_llm(log_entry)
+
+    future = _llm_executor.submit(_call_gemini_llm, log_entry, deadline * LLM_REQUEST_TIMEOUT_DEADLINES)
+    try:
+        return future.result(timeout=deadline)
+    except FutureTimeoutError:
+        print(f"LLM DEADLINE EXCEEDED ({deadline}s) for {agent_name} ({agent_role}), Item: {item_name}, Round: {round_num}. Using fallback.")
+
+        def mark_late(_):
+            log_entry["late"] = True
+            log_entry["deadline"] = deadline
+        future.add_done_callback(mark_late)
+
+        return {"reasoning": f"LLM did not answer within the {deadline}s decision deadline.", "error": "Decision deadline exceeded"}
+
+
+def _call_gemini_llm(log_entry: Dict[str, Any], request_timeout: Optional[float] = None) -> Dict[str, Any]:
+    global llm_interactions_log
+
+    agent_name, agent_role = log_entry["agent_name"], log_entry["agent_role"]
+    interaction_stage, item_name, round_num = log_entry["interaction_stage"], log_entry["item_name"], log_entry["round_num"]
+    system_prompt, user_prompt = log_entry["system_prompt"], log_entry["user_prompt"]
 
     if not GEMINI_API_KEY:
         print(f"LLM SKIPPED (NO API KEY) for {agent_name} ({agent_role}), Item: {item_name}, Round: {round_num}")
@@ -56,10 +143,12 @@ def call_gemini_llm(agent_name: str, agent_role: str, interaction_stage: str, it
         llm_interactions_log.append(log_entry)
         return error_response
 
+    response = None
+    response_text = ""
     try:
         print(f"Calling Gemini for {agent_name} ({agent_role}), Item: {item_name}, Round: {round_num}...")
         model = genai.GenerativeModel(
-            model_name='gemini-2.5-flash-preview-05-20',
+            model_name=GEMINI_MODEL_NAME,
             generation_config={
                 "temperature": 0.0,
                 "response_mime_type": "application/json"
@@ -67,7 +156,10 @@ def call_gemini_llm(agent_name: str, agent_role: str, interaction_stage: str, it
             system_instruction=system_prompt
         )
         
-        response = model.generate_content(user_prompt)
+        if request_timeout is None:
+            response = model.generate_content(user_prompt)
+        else:
+            response = model.generate_content(user_prompt, request_options={"timeout": request_timeout})
         
         response_text = ""
         if response.parts:
@@ -84,10 +176,10 @@ def call_gemini_llm(agent_name: str, agent_role: str, interaction_stage: str, it
                  raise ValueError("LLM returned empty or unreadable response content.")
 
 
-        parsed_json = json.loads(response_text)
-        print(f"LLM RESPONSE (Actual for {agent_name}):\n{json.dumps(parsed_json, indent=2)}")
+        parsed_json = decode_response(response_text)
+        print(f"LLM RESPONSE (Actual for {agent_name}): {response_text}")
 
-    except json.JSONDecodeError as e:
+    except ResponseDecodeError as e:
         print(f"Error decoding JSON from LLM response for {agent_name}: {e}")
         raw_text = response_text if 'response_text' in locals() else "Raw response text not available."
         print(f"LLM raw response text was: {raw_text}")
@@ -103,22 +195,176 @@ def call_gemini_llm(agent_name: str, agent_role: str, interaction_stage: str, it
         #     except: pass # Ignore if can't get response text
         parsed_json = {"reasoning": f"Error in LLM call: {e}", "error": str(e)}
 
+    # --- Token accounting: usage reported by the API, estimated from the text otherwise ---
+    usage = response_usage(response) if response is not None else None
+    estimated = usage is None
+    if estimated:
+        usage = (estimate_tokens(system_prompt) + estimate_tokens(user_prompt), estimate_tokens(response_text))
+    log_entry["usage"] = {"input_tokens": usage[0], "output_tokens": usage[1], "estimated": estimated}
+    token_ledger.record(agent_name, interaction_stage, item_name, usage[0], usage[1], estimated)
+
     log_entry["llm_response"] = parsed_json
     llm_interactions_log.append(log_entry)
     return parsed_json
 
 
-class MyACMEAgent(HouseOwnerAgent):
+def stub_llm_response(agent_role: str, interaction_stage: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Deterministic stand-in for the LLM, following the strategy the prompts ask for: the owner starts low and concedes
+    towards the price of the other side, companies bid at or above cost, and both accept in the last round, or once
+    the two sides are less than a cent apart (long negotiations would otherwise halve the gap until offers stop moving)
+    """
+    round_num = context.get("round", 0)
+    if interaction_stage == "Auction":
+        if agent_role == "ACME":
+            return {"reasoning": "Stub decision.", "proposed_budget": context["budget"] * min(0.6 + 0.2 * round_num, 1.0)}
+        return {"reasoning": "Stub decision.", "decision_to_bid": context["price"] >= context["cost"]}
+
+    if agent_role == "ACME":
+        if round_num == 0:
+            return {"reasoning": "Stub decision.", "negotiation_offer": context["auction_price"] * 0.75}
+        counter = context["partner_previous_counter"]
+        settle = round_num >= context.get("last_round", 2) or counter - context["previous_offer"] < SETTLE_GAP
+        offer = counter if settle else max(context["previous_offer"], (context["previous_offer"] + counter) / 2)
+        return {"reasoning": "Stub decision.", "negotiation_offer": offer}
+
+    acceptable = max(context["offer"], context["cost"])
+    settle = round_num >= context.get("last_round", 2) or context["previous_counter"] - acceptable < SETTLE_GAP
+    counter = acceptable if settle else max(context["cost"], (context["previous_counter"] + acceptable) / 2)
+    return {"reasoning": "Stub decision.", "counter_offer": counter}
+
+
+def round_range(num_rounds: int, separator: str = ", ") -> str:
+    """
+    Rounds of a phase as the prompts list them: "0, 1, 2", or "0 to 4999" for long phases
+    """
+    if num_rounds <= 4:
+        return separator.join(str(round_num) for round_num in range(num_rounds))
+    return "0 to %i" % (num_rounds - 1)
+
+
+@lru_cache(maxsize=None)
+def load_surrogate_policy(path: str) -> SurrogatePolicy:
+    # Loaded once per file, all the agents of a game share it
+    return SurrogatePolicy.load(path)
+
+
+class LLMDecisionMixin(object):
+    """
+    Decision backend shared by the LLM agents: the surrogate policy when it is confident enough, the LLM otherwise.
+    Options (from game.cfg): nr_auction_rounds, nr_negotiation_rounds, decision_deadline, surrogate_policy (path of a fitted policy), surrogate_threshold,
+    llm_backend ("gemini" or "stub"), agent_state_size (max. entries of each per-item state store of the agent),
+    agent_state_archive (JSON lines file the settled and evicted state entries are appended to).
+    """
+    decision_deadline: Optional[float] = None # Seconds an LLM decision may take, no limit if None
+    nr_auction_rounds: int = 3
+    nr_negotiation_rounds: int = 3
+    llm_backend: str = GEMINI_BACKEND
+    surrogate: Optional[SurrogatePolicy] = None
+    surrogate_threshold: float = DEFAULT_SURROGATE_THRESHOLD
+    surrogate_decisions: int = 0
+
+    def configure(self, options: Dict[str, Any]) -> None:
+        self.decision_deadline = options.get("decision_deadline")
+        self.nr_auction_rounds = options.get("nr_auction_rounds", self.nr_auction_rounds)
+        self.nr_negotiation_rounds = options.get("nr_negotiation_rounds", self.nr_negotiation_rounds)
+        surrogate_path = options.get("surrogate_policy")
+        self.surrogate = load_surrogate_policy(surrogate_path) if surrogate_path else None
+        self.surrogate_threshold = options.get("surrogate_threshold", DEFAULT_SURROGATE_THRESHOLD)
+        self.llm_backend = options.get("llm_backend") or GEMINI_BACKEND
+
+        archive_path = options.get("agent_state_archive")
+        archive_hook = JsonlArchive(archive_path, self.name) if archive_path else None
+        # never fewer entries than the items of a game, whose state is needed until the game ends
+        max_entries = max(options.get("agent_state_size", DEFAULT_MAX_ENTRIES), self.items_per_game())
+        for store in vars(self).values():
+            if isinstance(store, BoundedStateStore):
+                store.max_entries = max_entries
+                store.archive_hook = archive_hook
+
+    def items_per_game(self) -> int:
+        return 0
+
+    def decide(self, agent_role: str, interaction_stage: str, item_name: str, round_num: int, system_prompt: str,
+               user_prompt: str, context: Dict[str, Any], speculative: bool = False) -> Dict[str, Any]:
+        if self.surrogate is not None:
+            role = "ACME" if agent_role == "ACME" else "Company"
+            prediction = self.surrogate.predict(role, interaction_stage, context)
+            if prediction is not None and prediction[1] >= self.surrogate_threshold:
+                decision, confidence = prediction
+                self.surrogate_decisions += 1
+                field = DECISION_FIELDS[(role, interaction_stage)]
+                response = {"reasoning": f"Surrogate policy decision (confidence {confidence:.2f}).", field: decision}
+                # Logged like an LLM call, marked so that it is neither fitted again nor counted as tokens
+                log_entry = {"agent_name": self.name, "agent_role": agent_role, "interaction_stage": interaction_stage,
+                             "item_name": item_name, "round_num": round_num, "system_prompt": system_prompt,
+                             "user_prompt": user_prompt, "llm_response": response, "context": context,
+                             "surrogate": True, "confidence": confidence}
+                if speculative:
+                    log_entry["speculative"] = True
+                llm_interactions_log.append(log_entry)
+                return response
+
+        return call_gemini_llm(self.name, agent_role, interaction_stage, item_name, round_num, system_prompt, user_prompt,
+                               deadline=self.decision_deadline, context=context, backend=self.llm_backend,
+                               speculative=speculative)
+
+
+class MyACMEAgent(LLMDecisionMixin, HouseOwnerAgent):
     def __init__(self, role: str, budget_list: List[Dict[str, Any]]):
         super(MyACMEAgent, self).__init__(role, budget_list)
-        self.previous_auction_offers: Dict[str, float] = {} 
-        self.negotiation_states: Dict[str, Dict[str, Dict]] = {} 
-        self.auction_round_responders: Dict[str, List[str]] = {} 
+        # Per-item state, bounded for agents playing many games; settled items are archived
+        self.previous_auction_offers = BoundedStateStore("previous_auction_offers")
+        self.negotiation_states = BoundedStateStore("negotiation_states")
+        self.auction_round_responders = BoundedStateStore("auction_round_responders")
+        self.item_feasibility: Dict[str, Dict[str, Any]] = {}
+        self.price_memory: Optional[PriceMemory] = None
+        # Offers prepared in speculative mode: item -> partner -> (round, {expected partner response: LLM response})
+        self.prepared_offers = BoundedStateStore("prepared_offers")
+        self.speculative_candidates = DEFAULT_SPECULATIVE_CANDIDATES
+        self.speculation_tolerance = DEFAULT_SPECULATION_TOLERANCE
+        self.speculation_hits = 0
+        self.speculation_misses = 0
+        self._speculation_lock = threading.Lock()
+
+    def configure(self, options: Dict[str, Any]) -> None:
+        super(MyACMEAgent, self).configure(options)
+        # Clearing and negotiated prices of previous games, seeding the opening offers
+        memory_path = options.get("price_memory")
+        self.price_memory = PriceMemory.load(memory_path, options.get("price_memory_half_life", DEFAULT_HALF_LIFE_DAYS),
+                                             options.get("price_memory_size", DEFAULT_MAX_ITEMS)) if memory_path else None
+        self.speculative_candidates = options.get("speculative_candidates", DEFAULT_SPECULATIVE_CANDIDATES)
+        self.speculation_tolerance = options.get("speculation_tolerance", DEFAULT_SPECULATION_TOLERANCE)
+
+    def reset(self) -> None:
+        self.previous_auction_offers.archive_all()
+        self.negotiation_states.archive_all()
+        self.auction_round_responders.archive_all()
+        self.prepared_offers.clear()
+        self.item_feasibility = {}
+        if self.price_memory is not None: self.price_memory.save()
+
+    def items_per_game(self) -> int:
+        return len(self.budget_dict)
+
+    def notify_item_feasibility(self, feasibility: Dict[str, Dict[str, Any]]) -> None:
+        self.item_feasibility = feasibility
 
     def propose_item_budget(self, auction_item: str, auction_round: int) -> float:
         item_budget_for_acme = self.budget_dict.get(auction_item, 0.0)
         previous_offer_for_item = self.previous_auction_offers.get(auction_item, 0.0)
         responding_agents_previous_round = self.auction_round_responders.get(auction_item, [])
+        feasibility = self.item_feasibility.get(auction_item, {})
+        min_cost = feasibility.get("min_cost") # Lowest cost among companies able to build the item, if known
+        remembered_price = self.price_memory.estimate(auction_item, AUCTION_PRICE) if self.price_memory else None
+
+        market_info = ""
+        if min_cost is not None:
+            market_info = f"""- Lowest Contractor Cost for "{auction_item}": {min_cost:.2f} (budget slack: {feasibility['slack']:.2f}, eligible bidders: {feasibility['eligible_bidders']})
+"""
+        if remembered_price is not None:
+            market_info += f"""- Clearing Price of "{auction_item}" in Previous Games: {remembered_price:.2f} (round 0 opens at {remembered_price * REMEMBERED_PRICE_OPENING:.2f})
+"""
 
         system_prompt = f"""
 You are ACME, a company building its new headquarters. You are currently in the 'Reverse Dutch Auction' phase for contracting construction tasks.
@@ -127,42 +373,50 @@ Your per-item budgets are: {json.dumps(self.budget_dict, indent=2)}
 
 Auction Rules:
 - You propose a price. This is a reverse Dutch auction: start low, raise price in subsequent rounds if no bids.
-- Max 3 auction rounds (0, 1, 2) per item. Failure if no bids after 3 rounds.
+- Max {self.nr_auction_rounds} auction rounds ({round_range(self.nr_auction_rounds)}) per item. Failure if no bids after {self.nr_auction_rounds} rounds.
 - If your offer in round N for an item was X, your offer in round N+1 must be > X if no one bid.
 - Successful bidders proceed to negotiation.
 Decide the price for the current item and round.
         """
         user_prompt = f"""
 Current Auction Status:
-- Item: "{auction_item}", Round: {auction_round} (max 2)
+- Item: "{auction_item}", Round: {auction_round} (max {self.nr_auction_rounds - 1})
 - Your Budget for "{auction_item}": {item_budget_for_acme:.2f}
 - Your Previous Offer for "{auction_item}": {previous_offer_for_item:.2f}
 - Responders in Previous Round for "{auction_item}": {responding_agents_previous_round}
-
+{market_info}
 Task:
 Think step by step.
-1. Round 0: Make a low initial offer (e.g., 50-70% of budget).
+1. Round 0: Make a low initial offer (e.g., 50-70% of budget). No company bids below its cost: if the lowest contractor cost is known, offer somewhat above it so the winner can still concede during negotiation.
 2. Round > 0 & no prior responders for this item: MUST increase offer significantly (must be > previous_offer_for_item).
-3. Last round (2) & no prior responders: Offer attractively, possibly near budget, to avoid item failure.
+3. Last round ({self.nr_auction_rounds - 1}) & no prior responders: Offer attractively, possibly near budget, to avoid item failure.
 4. New offer should not exceed your budget {item_budget_for_acme:.2f}.
 
 Output JSON: {{"reasoning": "...", "proposed_budget": <float>}}
         """
 
-        llm_response = call_gemini_llm(self.name, "ACME", "Auction", auction_item, auction_round, system_prompt, user_prompt)
-        
-        proposed_budget = item_budget_for_acme * 0.7 # Fallback if LLM fails
-        if "error" not in llm_response and "proposed_budget" in llm_response and isinstance(llm_response["proposed_budget"], (int, float)):
-            proposed_budget = float(llm_response["proposed_budget"])
-        
-        # Enforce constraints post-LLM
-        is_first_offer_attempt = (previous_offer_for_item == 0.0) # More robust check
-        no_responders_last_time = not responding_agents_previous_round
+        if auction_round == 0 and remembered_price is not None:
+            # Open a little below where previous games cleared, skipping the rounds far below it, without asking the LLM
+            proposed_budget = remembered_price * REMEMBERED_PRICE_OPENING
+        else:
+            llm_response = self.decide("ACME", "Auction", auction_item, auction_round, system_prompt, user_prompt,
+                                       context={"round": auction_round, "budget": item_budget_for_acme,
+                                                "previous_offer": previous_offer_for_item})
 
-        if not is_first_offer_attempt and no_responders_last_time: # Must increase if not first offer and no one responded
-            if proposed_budget <= previous_offer_for_item:
-                proposed_budget = previous_offer_for_item * 1.15 # Enforce significant increase
-        
+            proposed_budget = OWNER_AUCTION.decision(llm_response)
+            if proposed_budget is None: proposed_budget = item_budget_for_acme * 0.7 # Fallback if LLM fails
+
+            # Enforce constraints post-LLM
+            is_first_offer_attempt = (previous_offer_for_item == 0.0) # More robust check
+            no_responders_last_time = not responding_agents_previous_round
+
+            if not is_first_offer_attempt and no_responders_last_time: # Must increase if not first offer and no one responded
+                if proposed_budget <= previous_offer_for_item:
+                    proposed_budget = previous_offer_for_item * 1.15 # Enforce significant increase
+
+        if min_cost is not None: # Offers below every cost cannot clear; keep a margin so the winner can still concede
+            clearing_floor = min_cost + MIN_COST_SLACK_MARGIN * max(feasibility["slack"], 0.0)
+            if proposed_budget < clearing_floor: proposed_budget = clearing_floor
         if proposed_budget > item_budget_for_acme: proposed_budget = item_budget_for_acme
         if proposed_budget <= 0 and item_budget_for_acme > 0: proposed_budget = item_budget_for_acme * 0.1 # Ensure positive sensible offer
         elif proposed_budget <= 0 : proposed_budget = 1.0 # Absolute fallback for 0 budget items
@@ -173,26 +427,26 @@ Output JSON: {{"reasoning": "...", "proposed_budget": <float>}}
 
     def notify_auction_round_result(self, auction_item: str, auction_round: int, responding_agents: List[str]):
         self.auction_round_responders[auction_item] = responding_agents
+        if responding_agents and self.price_memory is not None:
+            self.price_memory.observe(auction_item, AUCTION_PRICE, self.previous_auction_offers[auction_item])
         print(f"ACME ({self.name}) notified: Auction for {auction_item}, rnd {auction_round}. Responders: {responding_agents}")
 
-    def provide_negotiation_offer(self, negotiation_item: str, partner_agent_name: str, negotiation_round: int) -> float:
+    def _negotiation_request(self, negotiation_item: str, partner_agent_name: str, negotiation_round: int,
+                             state: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
+        """
+        :return: the system prompt, user prompt and decision context of the offer, for the given negotiation state
+        """
         item_budget_for_acme = self.budget_dict.get(negotiation_item, 0.0)
-        
-        if negotiation_item not in self.negotiation_states: self.negotiation_states[negotiation_item] = {}
-        if partner_agent_name not in self.negotiation_states[negotiation_item]:
-            auction_agreed_price_for_this_partner = self.previous_auction_offers.get(negotiation_item, item_budget_for_acme)
-            self.negotiation_states[negotiation_item][partner_agent_name] = {
-                "previous_offer_acme": 0.0,
-                "partner_previous_counter_offer": 0.0,
-                "auction_agreed_price": auction_agreed_price_for_this_partner
-            }
-            
-        state = self.negotiation_states[negotiation_item][partner_agent_name]
         prev_acme_offer = state["previous_offer_acme"]
         prev_partner_counter = state["partner_previous_counter_offer"]
         auction_price = state["auction_agreed_price"]
         
         other_negotiators_count = max(0, len(self.negotiation_states[negotiation_item].keys()) - 1)
+        remembered_price = self.price_memory.estimate(negotiation_item, NEGOTIATED_PRICE) if self.price_memory else None
+        remembered_info = f"""- Price agreed for this item in previous games: {remembered_price:.2f}
+""" if remembered_price is not None else ""
+        history_info = f"""- History: your offers rose from {state['first_offer_acme']:.2f} to {prev_acme_offer:.2f} (last step +{state['last_offer_step']:.2f}), partner counters fell from {state['first_counter_partner']:.2f} to {prev_partner_counter:.2f} (last step -{state['last_counter_step']:.2f})
+""" if negotiation_round >= 2 else ""
 
         system_prompt = f"""
 You are ACME, in 'Monotonic Concession Negotiation' for "{negotiation_item}" with Company {partner_agent_name}.
@@ -200,20 +454,20 @@ Primary goal: complete item. Secondary: save money.
 Partner accepted auction at {auction_price:.2f}. Your max budget for item: {item_budget_for_acme:.2f}.
 
 Rules (Initiator):
-- Max 3 rounds (0, 1, 2).
+- Max {self.nr_negotiation_rounds} rounds ({round_range(self.nr_negotiation_rounds)}).
 - Your offers must be >= previous offer (monotonic increase/stagnation).
 - Agreement if: partner counter <= your current offer OR your current offer >= partner's previous counter.
 Decide your offer.
         """
         user_prompt = f"""
 Negotiation Status ({negotiation_item} with {partner_agent_name}):
-- Round: {negotiation_round} (max 2)
+- Round: {negotiation_round} (max {self.nr_negotiation_rounds - 1})
 - Your budget for item: {item_budget_for_acme:.2f}
 - Partner's auction acceptance price: {auction_price:.2f}
 - Your previous offer to partner: {prev_acme_offer:.2f}
 - Partner's previous counter-offer: {prev_partner_counter:.2f}
 - Estimated other negotiators for this item: {other_negotiators_count}
-
+{remembered_info}{history_info}
 Task:
 Think step by step.
 1. New offer must be >= {prev_acme_offer:.2f}.
@@ -221,22 +475,57 @@ Think step by step.
    - If {prev_partner_counter:.2f} > 0 & new offer >= {prev_partner_counter:.2f}, agreement possible.
    - Round 0: Offer significantly below {auction_price:.2f} (e.g., 70-80%).
 3. Offer should ideally not exceed {auction_price:.2f}.
-4. Final round (2) is critical.
+4. Final round ({self.nr_negotiation_rounds - 1}) is critical.
 Output JSON: {{"reasoning": "...", "negotiation_offer": <float>}}
         """
-        llm_response = call_gemini_llm(self.name, "ACME", "Negotiation", negotiation_item, negotiation_round, system_prompt, user_prompt)
+        context = {"round": negotiation_round, "budget": item_budget_for_acme,
+                   "auction_price": auction_price, "previous_offer": prev_acme_offer,
+                   "partner_previous_counter": prev_partner_counter,
+                   "competitors": other_negotiators_count,
+                   "last_round": self.nr_negotiation_rounds - 1}
+        return system_prompt, user_prompt, context
+
+    def provide_negotiation_offer(self, negotiation_item: str, partner_agent_name: str, negotiation_round: int) -> float:
+        item_budget_for_acme = self.budget_dict.get(negotiation_item, 0.0)
+        
+        if negotiation_item not in self.negotiation_states: self.negotiation_states[negotiation_item] = {}
+        if partner_agent_name not in self.negotiation_states[negotiation_item]:
+            auction_agreed_price_for_this_partner = self.previous_auction_offers.get(negotiation_item, item_budget_for_acme)
+            self.negotiation_states[negotiation_item][partner_agent_name] = {
+                "previous_offer_acme": 0.0,
+                "partner_previous_counter_offer": 0.0,
+                "auction_agreed_price": auction_agreed_price_for_this_partner,
+                # Constant-size summary of the rounds played, whatever their number
+                "first_offer_acme": 0.0, "last_offer_step": 0.0, "first_counter_partner": 0.0, "last_counter_step": 0.0
+            }
+            
+        state = self.negotiation_states[negotiation_item][partner_agent_name]
+        prev_acme_offer = state["previous_offer_acme"]
+        auction_price = state["auction_agreed_price"]
 
-        offer = auction_price # Fallback
-        if "error" not in llm_response and "negotiation_offer" in llm_response and isinstance(llm_response["negotiation_offer"],(int,float)):
-            offer = float(llm_response["negotiation_offer"])
+        system_prompt, user_prompt, context = self._negotiation_request(negotiation_item, partner_agent_name,
+                                                                        negotiation_round, state)
+        llm_response = self._prepared_response(negotiation_item, partner_agent_name, negotiation_round,
+                                               state["partner_previous_counter_offer"])
+        if llm_response is None:
+            llm_response = self.decide("ACME", "Negotiation", negotiation_item, negotiation_round, system_prompt,
+                                       user_prompt, context=context)
+
+        offer = OWNER_NEGOTIATION.decision(llm_response)
+        if offer is None: offer = auction_price # Fallback
         
-        if negotiation_round > 0 and offer < prev_acme_offer: offer = prev_acme_offer
+        # strict concession, the protocol fails on an offer that does not exceed the previous one: at least a cent more,
+        # or the partner counter if it is closer
+        min_offer = min(prev_acme_offer + MIN_OFFER_INCREMENT, state["partner_previous_counter_offer"])
+        if negotiation_round > 0 and offer < min_offer: offer = min_offer
         if negotiation_round == 0 and (offer <= 0 or offer > auction_price * 0.9): offer = auction_price * 0.7
         if offer > auction_price : offer = auction_price
         if offer <= 0 and auction_price > 0 : offer = auction_price * 0.1
         elif offer <=0 : offer = 1.0
 
 
+        if negotiation_round == 0: state["first_offer_acme"] = offer
+        else: state["last_offer_step"] = offer - prev_acme_offer
         state["previous_offer_acme"] = offer
         return offer
 
@@ -247,26 +536,124 @@ Output JSON: {{"reasoning": "...", "negotiation_offer": <float>}}
              self.negotiation_states[item][partner_name] = {
                 "previous_offer_acme": 0.0, 
                 "partner_previous_counter_offer": 0.0,
-                "auction_agreed_price": self.previous_auction_offers.get(item, self.budget_dict.get(item,0.0))
+                "auction_agreed_price": self.previous_auction_offers.get(item, self.budget_dict.get(item,0.0)),
+                "first_offer_acme": 0.0, "last_offer_step": 0.0, "first_counter_partner": 0.0, "last_counter_step": 0.0
             }
-        self.negotiation_states[item][partner_name]["partner_previous_counter_offer"] = offer
+        MyACMEAgent._record_partner_response(self.negotiation_states[item][partner_name], response_msg.round, offer)
         print(f"ACME ({self.name}) notified: Partner {partner_name} response for {item} is {offer:.2f}")
 
+    @staticmethod
+    def _record_partner_response(state: Dict[str, Any], response_round: int, offer: float) -> None:
+        if response_round == 0: state["first_counter_partner"] = offer
+        else: state["last_counter_step"] = state["partner_previous_counter_offer"] - offer
+        state["partner_previous_counter_offer"] = offer
+
+    def expected_partner_responses(self, negotiation_item: str, partner_agent: str,
+                                   negotiation_round: int) -> List[float]:
+        state = self.negotiation_states.get(negotiation_item, {}).get(partner_agent)
+        if state is None:
+            return []
+
+        # Before its first counter, the partner's implicit previous counter is the auction price
+        offer, auction_price = state["previous_offer_acme"], state["auction_agreed_price"]
+        prev_counter = auction_price if negotiation_round == 0 else state["partner_previous_counter_offer"]
+        last_step = auction_price - prev_counter if negotiation_round == 1 else state["last_counter_step"]
+
+        # Meeting halfway, then concessions shrinking by half, steady concessions, no concession
+        candidates = [(prev_counter + offer) / 2]
+        if negotiation_round > 0: candidates += [prev_counter - last_step / 2, prev_counter - last_step]
+        candidates.append(prev_counter)
+
+        expected, seen = [], set()
+        for candidate in candidates:
+            # A response at or below the offer ends the negotiation, there is no next offer to prepare
+            if candidate > offer and round(candidate, 2) not in seen:
+                seen.add(round(candidate, 2))
+                expected.append(candidate)
+        return expected[:self.speculative_candidates]
+
+    def speculate_negotiation_offer(self, negotiation_item: str, partner_agent: str, negotiation_round: int,
+                                    expected_response: float) -> None:
+        state = self.negotiation_states.get(negotiation_item, {}).get(partner_agent)
+        if state is None:
+            return
+
+        # The state the offer would be decided in, without touching the actual one
+        expected_state = dict(state)
+        MyACMEAgent._record_partner_response(expected_state, negotiation_round - 1, expected_response)
+        system_prompt, user_prompt, context = self._negotiation_request(negotiation_item, partner_agent,
+                                                                        negotiation_round, expected_state)
+        llm_response = self.decide("ACME", "Negotiation", negotiation_item, negotiation_round, system_prompt,
+                                   user_prompt, context=context, speculative=True)
+        if "error" in llm_response:
+            return
+
+        with self._speculation_lock:
+            prepared = self.prepared_offers.setdefault(negotiation_item, {})
+            if prepared.get(partner_agent, (None,))[0] != negotiation_round:
+                prepared[partner_agent] = (negotiation_round, {})
+            prepared[partner_agent][1][expected_response] = llm_response
+
+    def _prepared_response(self, negotiation_item: str, partner_agent: str, negotiation_round: int,
+                           partner_response: float) -> Optional[Dict[str, Any]]:
+        """
+        :return: the response prepared by `speculate_negotiation_offer` for the expected partner response closest to
+        the actual one, if they are within `speculation_tolerance` of each other; None otherwise (it is discarded)
+        """
+        with self._speculation_lock:
+            prepared = self.prepared_offers.get(negotiation_item, {}).pop(partner_agent, None)
+            if prepared is None:
+                return None
+
+            prepared_round, responses = prepared
+            llm_response = None
+            if prepared_round == negotiation_round and responses:
+                expected_response = min(responses, key=lambda expected: abs(expected - partner_response))
+                if abs(expected_response - partner_response) <= self.speculation_tolerance * partner_response:
+                    llm_response = responses[expected_response]
+            if llm_response is None: self.speculation_misses += 1
+            else: self.speculation_hits += 1
+            return llm_response
+
     def notify_negotiation_winner(self, negotiation_item: str, winning_agent_name: str, winning_offer: float) -> None:
         print(f"ACME ({self.name}) notified: Nego for {negotiation_item} won by {winning_agent_name} at {winning_offer:.2f}")
-        if negotiation_item in self.negotiation_states:
-            # Keep state for learning, or mark as completed. For simplicity, can remove.
-            # self.negotiation_states[negotiation_item].clear() # Or del specific partner if needed
-            pass
+        if self.price_memory is not None:
+            self.price_memory.observe(negotiation_item, NEGOTIATED_PRICE, winning_offer)
+            self.price_memory.save()
+        # The item is settled, its state only matters for the record
+        self.negotiation_states.archive(negotiation_item)
+        self.previous_auction_offers.archive(negotiation_item)
+        self.auction_round_responders.archive(negotiation_item)
+        self.prepared_offers.pop(negotiation_item, None)
 
 
-class MyCompanyAgent(CompanyAgent):
+class MyCompanyAgent(LLMDecisionMixin, CompanyAgent):
     def __init__(self, role: str, specialties: List[Dict[str, Any]]):
         super(MyCompanyAgent, self).__init__(role, specialties)
         self.contracts_won_count: int = 0
-        self.negotiation_competitors: Dict[str, int] = {}
-        self.previous_negotiation_counter_offers: Dict[str, float] = {}
-        self.auction_agreed_prices: Dict[str, float] = {}
+        # Contracts of different items can be assigned at the same time, by the item threads of simultaneous games
+        self._contracts_lock = threading.Lock()
+        # Per-item state, bounded for agents playing many games; settled items are archived
+        self.negotiation_competitors = BoundedStateStore("negotiation_competitors")
+        self.previous_negotiation_counter_offers = BoundedStateStore("previous_negotiation_counter_offers")
+        self.auction_agreed_prices = BoundedStateStore("auction_agreed_prices")
+        # Constant-size summary of the rounds of each negotiation, whatever their number
+        self.negotiation_summaries = BoundedStateStore("negotiation_summaries")
+        # State each item had before the last reply, restored if the message bus discards the reply as too late
+        self.replaced_auction_prices = BoundedStateStore("replaced_auction_prices")
+        self.replaced_negotiation_states = BoundedStateStore("replaced_negotiation_states")
+
+    def reset(self) -> None:
+        self.contracts_won_count = 0
+        self.negotiation_competitors.clear()
+        self.previous_negotiation_counter_offers.clear()
+        self.negotiation_summaries.clear()
+        self.replaced_auction_prices.clear()
+        self.replaced_negotiation_states.clear()
+        self.auction_agreed_prices.archive_all()
+
+    def items_per_game(self) -> int:
+        return len(self.specialties)
 
     def _get_cost_for_item(self, item_name: str) -> Optional[float]:
         return self.specialties.get(item_name)
@@ -282,12 +669,12 @@ Your specialties & costs: {json.dumps(self.specialties)}
 
 Auction Rules:
 - ACME proposes price. Bid if item is your specialty & price >= your cost.
-- Successful bid leads to negotiation. Max 3 auction rounds (0,1,2).
+- Successful bid leads to negotiation. Max {self.nr_auction_rounds} auction rounds ({round_range(self.nr_auction_rounds, ",")}).
 Decide whether to bid.
         """
         user_prompt = f"""
 Auction Status for Company {self.name} ({self.role}):
-- Item: "{auction_item}", Round: {auction_round} (max 2)
+- Item: "{auction_item}", Round: {auction_round} (max {self.nr_auction_rounds - 1})
 - ACME's Proposed Price for "{auction_item}": {acme_proposed_price:.2f}
 - Your Cost for "{auction_item}": {your_cost:.2f}
 - Contracts Won by You: {self.contracts_won_count}
@@ -296,18 +683,20 @@ Task:
 Think step by step.
 1. Bid only if {acme_proposed_price:.2f} >= {your_cost:.2f}.
 2. Goals: If {self.contracts_won_count} == 0, strong incentive to bid if price >= cost. Good profit is also a factor.
-3. Round consideration: Early round (0) + acceptable offer = secure negotiation. Late round (2) + acceptable offer = crucial bid.
+3. Round consideration: Early round (0) + acceptable offer = secure negotiation. Late round ({self.nr_auction_rounds - 1}) + acceptable offer = crucial bid.
 Output JSON: {{"reasoning": "...", "decision_to_bid": <true_or_false>}}
         """
-        llm_response = call_gemini_llm(self.name, f"Company {self.role}", "Auction", auction_item, auction_round, system_prompt, user_prompt)
+        llm_response = self.decide(f"Company {self.role}", "Auction", auction_item, auction_round, system_prompt, user_prompt,
+                                   context={"round": auction_round, "price": acme_proposed_price, "cost": your_cost,
+                                            "contracts_won": self.contracts_won_count})
 
-        decision = False # Fallback
-        if "error" not in llm_response and "decision_to_bid" in llm_response and isinstance(llm_response["decision_to_bid"], bool):
-            decision = bool(llm_response["decision_to_bid"])
+        decision = COMPANY_AUCTION.decision(llm_response)
+        if decision is None: decision = False # Fallback
         
         if your_cost is not None and acme_proposed_price < your_cost: # Enforce cannot bid below cost
             decision = False
         
+        self.replaced_auction_prices[auction_item] = self.auction_agreed_prices.get(auction_item)
         if decision: self.auction_agreed_prices[auction_item] = acme_proposed_price
         return decision
 
@@ -324,6 +713,15 @@ Output JSON: {{"reasoning": "...", "decision_to_bid": <true_or_false>}}
         auction_price = self.auction_agreed_prices.get(item, your_cost * 1.1) # Fallback
         prev_counter = self.previous_negotiation_counter_offers.get(item, auction_price) # First "previous" is auction price
         num_comps = self.negotiation_competitors.get(item, 1)
+        replaced_summary = self.negotiation_summaries.get(item)
+        self.replaced_negotiation_states[item] = (self.previous_negotiation_counter_offers.get(item),
+                                                  dict(replaced_summary) if replaced_summary is not None else None)
+        if round_num == 0 or item not in self.negotiation_summaries:
+            self.negotiation_summaries[item] = {"first_offer": acme_offer, "previous_offer": acme_offer,
+                                                "first_counter": prev_counter, "last_counter_step": 0.0}
+        summary = self.negotiation_summaries[item]
+        history_info = f"""- History: ACME offers rose from {summary['first_offer']:.2f} to {acme_offer:.2f} (last step +{acme_offer - summary['previous_offer']:.2f}), your counters fell from {summary['first_counter']:.2f} to {prev_counter:.2f} (last step -{summary['last_counter_step']:.2f})
+""" if round_num >= 2 else ""
 
         system_prompt = f"""
 You are Contractor Company {self.name} ({self.role}), in 'Monotonic Concession Negotiation' for "{item}" with ACME.
@@ -331,7 +729,7 @@ Primary goal: win >=1 contract. Secondary: profit (counter_offer - cost).
 Your cost for "{item}": {your_cost:.2f}. Initial auction price was {auction_price:.2f}.
 
 Rules (Responder):
-- Max 3 rounds (0,1,2).
+- Max {self.nr_negotiation_rounds} rounds ({round_range(self.nr_negotiation_rounds, ",")}).
 - Your counter-offers must be <= previous counter (currently {prev_counter:.2f}).
 - Agreement if: your counter <= ACME's current offer OR ACME's next offer >= your current counter.
 - {num_comps} companies (incl. you) are negotiating for this item.
@@ -339,14 +737,14 @@ Decide your counter-offer.
         """
         user_prompt = f"""
 Negotiation Status ({item} for Co. {self.name}):
-- Round: {round_num} (max 2)
+- Round: {round_num} (max {self.nr_negotiation_rounds - 1})
 - ACME's Current Offer: {acme_offer:.2f}
 - Your Implicit Previous Counter-Offer: {prev_counter:.2f}
 - Your Cost for "{item}": {your_cost:.2f}
 - Auction Price for "{item}": {auction_price:.2f}
 - Contracts Won by You: {self.contracts_won_count}
 - Total Competitors (incl. you) for this item: {num_comps}
-
+{history_info}
 Task:
 Think step by step.
 1. Counter-offer MUST be >= {your_cost:.2f}.
@@ -356,14 +754,17 @@ Think step by step.
         - To accept: counter_offer = {acme_offer:.2f}. (Strong if {self.contracts_won_count}==0 or {num_comps}>1).
         - Else, counter_offer < {prev_counter:.2f} but >= {acme_offer:.2f} (or slightly higher).
     - If {acme_offer:.2f} < {your_cost:.2f}: Cannot accept. Counter_offer >= {your_cost:.2f}. Concede from {prev_counter:.2f} if possible.
-4. Final round (2): Strongly consider accepting if ACME's offer >= cost. Else, best possible counter.
+4. Final round ({self.nr_negotiation_rounds - 1}): Strongly consider accepting if ACME's offer >= cost. Else, best possible counter.
 Output JSON: {{"reasoning": "...", "counter_offer": <float>}}
         """
-        llm_response = call_gemini_llm(self.name, f"Company {self.role}", "Negotiation", item, round_num, system_prompt, user_prompt)
+        llm_response = self.decide(f"Company {self.role}", "Negotiation", item, round_num, system_prompt, user_prompt,
+                                   context={"round": round_num, "offer": acme_offer, "previous_counter": prev_counter,
+                                            "cost": your_cost, "auction_price": auction_price,
+                                            "contracts_won": self.contracts_won_count, "competitors": num_comps,
+                                            "last_round": self.nr_negotiation_rounds - 1})
         
-        counter_offer = prev_counter # Fallback
-        if "error" not in llm_response and "counter_offer" in llm_response and isinstance(llm_response["counter_offer"], (int,float)):
-            counter_offer = float(llm_response["counter_offer"])
+        counter_offer = COMPANY_NEGOTIATION.decision(llm_response)
+        if counter_offer is None: counter_offer = prev_counter # Fallback
 
         if counter_offer < your_cost: counter_offer = your_cost
         # Ensure monotonic concession (for rounds > 0, or if current counter > initial auction price)
@@ -371,19 +772,48 @@ Output JSON: {{"reasoning": "...", "counter_offer": <float>}}
            (round_num == 0 and counter_offer > auction_price) :
             counter_offer = prev_counter if round_num > 0 else auction_price
         
+        if round_num == 0: summary["first_counter"] = counter_offer
+        else: summary["last_counter_step"] = prev_counter - counter_offer
+        summary["previous_offer"] = acme_offer
+
         self.previous_negotiation_counter_offers[item] = counter_offer
         return counter_offer
 
     def notify_contract_assigned(self, construction_item: str, price: float) -> None:
-        self.contracts_won_count += 1
-        print(f"Company {self.name} notified: Contract ASSIGNED for {construction_item} at {price:.2f}. Total: {self.contracts_won_count}")
+        with self._contracts_lock:
+            self.contracts_won_count += 1
+            contracts_won = self.contracts_won_count
+        print(f"Company {self.name} notified: Contract ASSIGNED for {construction_item} at {price:.2f}. Total: {contracts_won}")
         # Clean up state for this item
         self.negotiation_competitors.pop(construction_item, None)
         self.previous_negotiation_counter_offers.pop(construction_item, None)
-        # self.auction_agreed_prices.pop(construction_item, None) # Optionally keep for record
+        self.negotiation_summaries.pop(construction_item, None)
+        self.replaced_auction_prices.pop(construction_item, None)
+        self.replaced_negotiation_states.pop(construction_item, None)
+        self.auction_agreed_prices.archive(construction_item)
 
     def notify_negotiation_lost(self, construction_item: str) -> None:
         print(f"Company {self.name} notified: Negotiation LOST for {construction_item}")
         self.negotiation_competitors.pop(construction_item, None)
         self.previous_negotiation_counter_offers.pop(construction_item, None)
+        self.negotiation_summaries.pop(construction_item, None)
+        self.replaced_auction_prices.pop(construction_item, None)
+        self.replaced_negotiation_states.pop(construction_item, None)
+        self.auction_agreed_prices.archive(construction_item)
+
+    def notify_reply_discarded(self, message: Any) -> None:
+        # The environment used the default reply (no bid, no concession): restore the state from before the late reply
+        if isinstance(message, AuctionAnnouncement) and message.auction_item in self.replaced_auction_prices:
+            self._restore(self.auction_agreed_prices, message.auction_item,
+                          self.replaced_auction_prices.pop(message.auction_item))
+        elif isinstance(message, NegotiationMessage) and message.negotiation_item in self.replaced_negotiation_states:
+            counter, summary = self.replaced_negotiation_states.pop(message.negotiation_item)
+            self._restore(self.previous_negotiation_counter_offers, message.negotiation_item, counter)
+            self._restore(self.negotiation_summaries, message.negotiation_item, summary)
+        print(f"Company {self.name} notified: late reply to {message} discarded")
+
+    @staticmethod
+    def _restore(store: BoundedStateStore, item: str, value: Any) -> None:
+        if value is None: store.pop(item, None)
+        else: store[item] = value
 
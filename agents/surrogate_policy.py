@@ -0,0 +1,264 @@
+"""
+Surrogate policy distilled from recorded LLM decisions.
+
+The policy is a lookup table: the structured inputs of a decision (round, budget, previous offers, cost, number of
+competitors, ...) are reduced to a few normalized, bucketed features, and every table cell keeps running statistics
+of the decisions the LLM took in that situation. Prices are learned relative to a reference price of the situation
+(e.g. the offer as a share of the budget), so that a table fitted on one project transfers to others.
+
+A prediction comes with a confidence in [0, 1] that grows with the number of examples in the cell and shrinks with
+their spread. Agents use the prediction instead of calling the LLM when the confidence reaches their threshold.
+
+Fitting, from plain or compact interaction logs:
+    python -m agents.surrogate_policy fit llm_interactions_log.jsonl runs/*.jsonl.gz -o surrogate_policy.json
+"""
+import argparse
+import json
+import math
+import re
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+from agents.llm_response import OWNER, COMPANY, DECISION_FIELDS, RESPONSE_SCHEMAS
+
+SURROGATE_FORMAT_VERSION = 1
+
+# number of examples at which a cell is trusted half-way
+PRIOR_COUNT = 5.0
+# spread (standard deviation of the relative target) at which a cell is not trusted at all
+STD_TOLERANCE = 0.1
+# width of the buckets of the relative features
+BUCKET_WIDTH = 0.05
+
+# context values read back from the user prompts of logs recorded before the context was logged
+_NUMBER = r"([-0-9.]+|inf)"
+PROMPT_PATTERNS = {
+    (OWNER, "Auction"): {
+        "budget": r"Your Budget for \"[^\"]*\": " + _NUMBER,
+        "previous_offer": r"Your Previous Offer for \"[^\"]*\": " + _NUMBER,
+    },
+    (COMPANY, "Auction"): {
+        "price": r"ACME's Proposed Price for \"[^\"]*\": " + _NUMBER,
+        "cost": r"Your Cost for \"[^\"]*\": " + _NUMBER,
+        "contracts_won": r"Contracts Won by You: " + _NUMBER,
+    },
+    (OWNER, "Negotiation"): {
+        "budget": r"Your budget for item: " + _NUMBER,
+        "auction_price": r"Partner's auction acceptance price: " + _NUMBER,
+        "previous_offer": r"Your previous offer to partner: " + _NUMBER,
+        "partner_previous_counter": r"Partner's previous counter-offer: " + _NUMBER,
+        "competitors": r"Estimated other negotiators for this item: " + _NUMBER,
+    },
+    (COMPANY, "Negotiation"): {
+        "offer": r"ACME's Current Offer: " + _NUMBER,
+        "previous_counter": r"Your Implicit Previous Counter-Offer: " + _NUMBER,
+        "cost": r"Your Cost for \"[^\"]*\": " + _NUMBER,
+        "auction_price": r"Auction Price for \"[^\"]*\": " + _NUMBER,
+        "contracts_won": r"Contracts Won by You: " + _NUMBER,
+        "competitors": r"Total Competitors \(incl. you\) for this item: " + _NUMBER,
+    },
+}
+_COMPILED_PATTERNS = {key: {name: re.compile(pattern) for name, pattern in patterns.items()}
+                      for key, patterns in PROMPT_PATTERNS.items()}
+
+
+def role_kind(agent_role: str) -> str:
+    return OWNER if agent_role == OWNER else COMPANY
+
+
+def _bucket(value: float) -> int:
+    return int(math.floor(value / BUCKET_WIDTH))
+
+
+def _ratio(value: float, reference: float) -> float:
+    return value / reference if reference else 0.0
+
+
+def cell_key(role: str, stage: str, context: Dict[str, Any]) -> Optional[str]:
+    """
+    Reduces the context of a decision to the key of its lookup table cell
+    """
+    round_num = int(context["round"])
+
+    if (role, stage) == (OWNER, "Auction"):
+        features = (round_num, _bucket(_ratio(context["previous_offer"], context["budget"])))
+    elif (role, stage) == (COMPANY, "Auction"):
+        features = (round_num, _bucket(_ratio(context["price"], context["cost"])), context["contracts_won"] > 0)
+    elif (role, stage) == (OWNER, "Negotiation"):
+        features = (round_num, _bucket(_ratio(context["previous_offer"], context["auction_price"])),
+                    _bucket(_ratio(context["partner_previous_counter"], context["auction_price"])),
+                    context["competitors"] > 0)
+    elif (role, stage) == (COMPANY, "Negotiation"):
+        features = (round_num, _bucket(_ratio(context["offer"], context["cost"])),
+                    _bucket(_ratio(context["previous_counter"], context["cost"])),
+                    context["contracts_won"] > 0, context["competitors"] > 1)
+    else:
+        return None
+
+    return "|".join(str(int(feature)) for feature in features)
+
+
+def _target(role: str, stage: str, context: Dict[str, Any], decision: Any) -> float:
+    """
+    Normalized value learned by the table for a decision
+    """
+    if (role, stage) == (OWNER, "Auction"):
+        return _ratio(decision, context["budget"])
+    if (role, stage) == (COMPANY, "Auction"):
+        return 1.0 if decision else 0.0
+    if (role, stage) == (OWNER, "Negotiation"):
+        return _ratio(decision, context["auction_price"])
+    return _ratio(decision, context["cost"])
+
+
+def _decision(role: str, stage: str, context: Dict[str, Any], target: float) -> Any:
+    """
+    Inverse of `_target`: the decision corresponding to a normalized value
+    """
+    if (role, stage) == (OWNER, "Auction"):
+        return target * context["budget"]
+    if (role, stage) == (COMPANY, "Auction"):
+        return target >= 0.5
+    if (role, stage) == (OWNER, "Negotiation"):
+        return target * context["auction_price"]
+    return target * context["cost"]
+
+
+def context_from_record(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    :return: the decision context of a logged LLM interaction, read back from its prompt if it was not logged
+    """
+    if record.get("context"):
+        return record["context"]
+
+    key = (role_kind(record.get("agent_role")), record.get("interaction_stage"))
+    patterns = _COMPILED_PATTERNS.get(key)
+    if patterns is None or record.get("round_num") is None:
+        return None
+
+    context: Dict[str, Any] = {"round": record["round_num"]}
+    for name, pattern in patterns.items():
+        match = pattern.search(record.get("user_prompt") or "")
+        if match is None:
+            return None
+        context[name] = float(match.group(1))
+
+    return context
+
+
+class SurrogatePolicy(object):
+    """
+    Lookup table policy predicting the decisions of the LLM from their structured context
+    """
+
+    def __init__(self):
+        # (role, stage) -> cell key -> [count, mean, sum of squared deviations]
+        self.tables: Dict[Tuple[str, str], Dict[str, list]] = {key: {} for key in DECISION_FIELDS}
+
+    def add_example(self, role: str, stage: str, context: Dict[str, Any], decision: Any) -> None:
+        key = cell_key(role, stage, context)
+        if key is None:
+            return
+
+        target = _target(role, stage, context, decision)
+        cell = self.tables[(role, stage)].setdefault(key, [0, 0.0, 0.0])
+
+        # Welford's running mean / variance
+        cell[0] += 1
+        delta = target - cell[1]
+        cell[1] += delta / cell[0]
+        cell[2] += delta * (target - cell[1])
+
+    def fit(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Adds the decisions of logged LLM interactions to the table. Interactions that ended in an error (where the
+        agent used its fallback) are skipped.
+        :return: the number of examples used
+        """
+        examples = 0
+        for record in records:
+            response = record.get("llm_response") or {}
+            role, stage = role_kind(record.get("agent_role")), record.get("interaction_stage")
+            schema = RESPONSE_SCHEMAS.get((role, stage))
+            if schema is None or record.get("surrogate"):
+                continue
+
+            decision = schema.decision(response)
+            if decision is None:
+                continue
+
+            context = context_from_record(record)
+            if context is None:
+                continue
+
+            self.add_example(role, stage, context, decision)
+            examples += 1
+
+        return examples
+
+    def predict(self, role: str, stage: str, context: Dict[str, Any]) -> Optional[Tuple[Any, float]]:
+        """
+        :return: (decision, confidence) for the given context, None if the table has no such situation
+        """
+        key = cell_key(role, stage, context)
+        cell = self.tables.get((role, stage), {}).get(key) if key is not None else None
+        if not cell:
+            return None
+
+        count, mean, m2 = cell
+        support = count / (count + PRIOR_COUNT)
+        if (role, stage) == (COMPANY, "Auction"):
+            # agreement between the examples: 0 for a coin flip, 1 when they all took the same decision
+            consistency = abs(2 * mean - 1)
+        else:
+            std = math.sqrt(m2 / count) if count > 1 else 0.0
+            consistency = max(0.0, 1.0 - std / STD_TOLERANCE)
+
+        return _decision(role, stage, context, mean), support * consistency
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"version": SURROGATE_FORMAT_VERSION,
+                       "tables": {"%s/%s" % key: cells for key, cells in self.tables.items()}}, f)
+
+    @staticmethod
+    def load(path: str) -> "SurrogatePolicy":
+        with open(path) as f:
+            data = json.load(f)
+
+        if data.get("version") != SURROGATE_FORMAT_VERSION:
+            raise ValueError("Unsupported surrogate policy format in %s" % path)
+
+        policy = SurrogatePolicy()
+        for name, cells in data["tables"].items():
+            policy.tables[tuple(name.split("/", 1))] = cells
+        return policy
+
+    def summary(self) -> str:
+        lines = []
+        for (role, stage), cells in self.tables.items():
+            examples = sum(cell[0] for cell in cells.values())
+            lines.append("%-8s %-12s %6i cells %8i examples" % (role, stage, len(cells), examples))
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from llm_log import read_log
+
+    parser = argparse.ArgumentParser(description="Fit a surrogate policy on recorded LLM decisions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fit_cmd = commands.add_parser("fit")
+    fit_cmd.add_argument("logs", nargs="+", help="LLM interaction logs (plain or compact)")
+    fit_cmd.add_argument("-o", "--output", default="surrogate_policy.json")
+    fit_cmd.add_argument("--update", action="store_true", help="add the examples to the existing output policy")
+    args = parser.parse_args()
+
+    surrogate = SurrogatePolicy.load(args.output) if args.update else SurrogatePolicy()
+    total = 0
+    for log_path in args.logs:
+        used = surrogate.fit(read_log(log_path))
+        total += used
+        print("%s: %i examples" % (log_path, used))
+
+    surrogate.save(args.output)
+    print(surrogate.summary())
+    print("Surrogate policy fitted on %i examples saved to %s" % (total, args.output))
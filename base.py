@@ -5,10 +5,13 @@ class Agent(object):
     """
     def __init__(self, name):
         self.name = name
+        # dense integer id given by the AgentRegistry of the environment, None until registered
+        self.agent_id = None
 
     def __eq__(self, other):
         """
-        Two agents are equal if their names are the same
+        Two agents are equal if their names are the same (ids are only unique within one registry, and are given
+        after construction, so they would change the hash of registered agents)
         :param other: the other agent
         :return: True if the `other' agent has the same name as this one
         """
@@ -20,10 +23,58 @@ class Agent(object):
     def __hash__(self):
         return hash(self.name)
 
+    def configure(self, options):
+        """
+        Function called by the environment right after the agent is created, with the agent settings of the game
+        configuration (game wide settings such as `decision_deadline`, plus the `options` of the agent entry)
+        :param options: dict of settings, agents ignore the ones they do not use
+        """
+        pass
+
+    def reset(self):
+        """
+        Function called by the environment before it plays another game with the same agents: clears the state of
+        the previous game, keeping the configuration of the agent (budgets, specialties, options)
+        """
+        pass
+
     def __str__(self):
         return "%s" % self.name
 
 
+class AgentRegistry(object):
+    """
+    Gives the agents of a game dense integer ids (0, 1, 2, ...), so that the environment can refer to agents by id
+    (e.g. the companies selected by an auction) and resolve them with `agent`
+    """
+    def __init__(self):
+        self._agents = []
+        self._ids = {}
+
+    def register(self, agent):
+        """
+        Assigns the next id to an agent
+        :param agent: the agent to register, its name must be unique in the registry
+        :return: the id of the agent
+        """
+        if agent.name in self._ids:
+            raise ValueError("Agent %s is already registered" % agent.name)
+
+        agent.agent_id = len(self._agents)
+        self._agents.append(agent)
+        self._ids[agent.name] = agent.agent_id
+        return agent.agent_id
+
+    def agent(self, agent_id):
+        return self._agents[agent_id]
+
+    def __len__(self):
+        return len(self._agents)
+
+    def __iter__(self):
+        return iter(self._agents)
+
+
 class Environment(object):
     """
     Base class to be implemented by environment implementations.
@@ -1,4 +1,5 @@
-from typing import Dict, List
+from collections import deque
+from typing import Deque, Dict, List, Optional
 from base import Agent
 from agents import HouseOwnerAgent, CompanyAgent
 
@@ -11,6 +12,10 @@ with open('logging_conf.yaml', 'r') as f:
 logging.config.dictConfig(log_cfg)
 logger = logging.getLogger("communication")
 
+# positions of the two participants in MonotonicConcessionNegotiation.negotiation_history
+INITIATOR = 0
+PARTNER = 1
+
 
 class NegotiationMessage(object):
     """
@@ -38,13 +43,35 @@ class NegotiationMessage(object):
                                   self.conversation_id, self.round)
 
 
+class AuctionAnnouncement(object):
+    """
+    Class representing the price announced by the owner to a company in an auction round. The reply of the
+    company is its decision to bid.
+    """
+    def __init__(self, sender_name: str, receiver_name: str, auction_item: str, round: int, price: float):
+        self.sender = sender_name
+        self.receiver = receiver_name
+        self.auction_item = auction_item
+        self.round = round
+        self.price = price
+
+    def __str__(self) -> str:
+        return "[AuctionAnnouncement] from: %s, to: %s, " \
+               "item: %s, round: %i, price: %f" % (self.sender, self.receiver, self.auction_item, self.round,
+                                                   self.price)
+
+
 class MonotonicConcessionNegotiation(object):
     """
     Class representing a negotiation interaction between two agents
     """
 
     def __init__(self, initiator_agent: HouseOwnerAgent, partner_agent: CompanyAgent, negotiation_item: str,
-                 num_rounds: int):
+                 num_rounds: int, history_window: Optional[int] = None):
+        """
+        :param history_window: number of messages kept per participant, all of them if None. The protocol only looks
+        at the current and the previous round, so 2 keeps the state of long negotiations constant in size
+        """
         self.initiator: HouseOwnerAgent = initiator_agent
         self.partner: CompanyAgent = partner_agent
         self.negotiation_item = negotiation_item
@@ -52,30 +79,41 @@ class MonotonicConcessionNegotiation(object):
         self.conversation_id = "conv" + "_" + negotiation_item + "_" + initiator_agent.name + "_" + partner_agent.name
 
         self.failed = False
+        # price of the agreement the environment concluded this negotiation with, None if it did not
+        self.agreed_price: Optional[float] = None
         self.initiator_offer: float = 0
         self.partner_offer: float = 0
         self.round = 0
 
-        self.negotiation_history: Dict[Agent, List[NegotiationMessage]] = {
-            self.initiator: [],
-            self.partner: []
-        }
+        # messages of the initiator and of the partner, indexed by INITIATOR / PARTNER
+        self.negotiation_history: List[Deque[NegotiationMessage]] = [deque(maxlen=history_window),
+                                                                     deque(maxlen=history_window)]
 
     def new_initiator_message(self, offer: float = 0) -> NegotiationMessage:
         msg = NegotiationMessage(self.initiator.name, self.partner.name, self.negotiation_item,
                                  self.conversation_id, self.round, offer)
-        self.negotiation_history[self.initiator].append(msg)
+        self.negotiation_history[INITIATOR].append(msg)
         return msg
 
     def new_partner_message(self, offer: float = 0) -> NegotiationMessage:
         msg = NegotiationMessage(self.partner.name, self.initiator.name, self.negotiation_item,
                                  self.conversation_id, self.round, offer)
-        self.negotiation_history[self.partner].append(msg)
+        self.negotiation_history[PARTNER].append(msg)
         return msg
 
     def next_round(self) -> None:
         self.round += 1
 
+    def message(self, participant: int, round: int) -> Optional[NegotiationMessage]:
+        """
+        :param participant: INITIATOR or PARTNER
+        :return: the message of the participant in the given round, None if it sent none or it left the history window
+        """
+        for msg in reversed(self.negotiation_history[participant]):
+            if msg.round <= round:
+                return msg if msg.round == round else None
+        return None
+
     def agreement_reached(self) -> float:
         """
         Function that assesses the achievement of an agreement. It returns true if:
@@ -86,11 +124,11 @@ class MonotonicConcessionNegotiation(object):
         Function returns 0 if negotiation not started, agreement conditions not met or number of rounds exceeded
         :return: The agreement that is advantageous for the initiator if agreement reached, 0 otherwise
         """
-        if self.round == 0 and self.negotiation_history[self.initiator] and \
-           self.negotiation_history[self.partner]:
+        if self.round == 0 and self.negotiation_history[INITIATOR] and \
+           self.negotiation_history[PARTNER]:
             # if the first round of conversation has passed check if response to initiator proposal is a match
-            initiator_proposal = self.negotiation_history[self.initiator][self.round]
-            partner_response = self.negotiation_history[self.partner][self.round]
+            initiator_proposal = self.message(INITIATOR, self.round)
+            partner_response = self.message(PARTNER, self.round)
 
             print('initiator proposol offer : ',initiator_proposal.offer)
             print('partner proposol offer : ',partner_response.offer)
@@ -101,14 +139,14 @@ class MonotonicConcessionNegotiation(object):
         elif self.round > 0 and self.round < self.num_rounds:
             # if proposal in current round from initiator is HIGHER THAN response form partner in previous round
             # OR partner response in THIS round is LOWER than initiator proposal
-            initiator_proposal = self.negotiation_history[self.initiator][self.round]
-            partner_response_prev = self.negotiation_history[self.partner][self.round - 1]
+            initiator_proposal = self.message(INITIATOR, self.round)
+            partner_response_prev = self.message(PARTNER, self.round - 1)
 
             if initiator_proposal.offer >= partner_response_prev.offer:
                 return initiator_proposal.offer
             else:
-                if len(self.negotiation_history[self.partner]) > self.round:
-                    partner_response = self.negotiation_history[self.partner][self.round]
+                partner_response = self.message(PARTNER, self.round)
+                if partner_response is not None:
                     if initiator_proposal.offer >= partner_response.offer:
                         return partner_response.offer
 
@@ -120,8 +158,8 @@ class MonotonicConcessionNegotiation(object):
         :return: True if protocol respected, False otherwise
         """
         if self.round > 0:
-            proposal_prev = self.negotiation_history[self.initiator][self.round - 1]
-            proposal = self.negotiation_history[self.initiator][self.round]
+            proposal_prev = self.message(INITIATOR, self.round - 1)
+            proposal = self.message(INITIATOR, self.round)
 
             if proposal.offer > proposal_prev.offer:
                 return True
@@ -137,8 +175,8 @@ class MonotonicConcessionNegotiation(object):
         :return: True if protocol respected, False otherwise
         """
         if self.round > 0:
-            proposal_prev = self.negotiation_history[self.partner][self.round - 1]
-            proposal = self.negotiation_history[self.partner][self.round]
+            proposal_prev = self.message(PARTNER, self.round - 1)
+            proposal = self.message(PARTNER, self.round)
 
             if proposal.offer < proposal_prev.offer:
                 return True
@@ -150,3 +188,31 @@ class MonotonicConcessionNegotiation(object):
 
     def is_failed(self):
         return self.failed or self.round >= self.num_rounds
+
+    def conclude(self, price: float) -> None:
+        """
+        Records that the environment concluded the negotiation with an agreement at the given price, in the
+        current round
+        """
+        self.agreed_price = price
+
+    def closing_message(self) -> Optional[NegotiationMessage]:
+        """
+        :return: the message of the concluding round that made the agreement (the initiator offer if it met the
+        previous partner counter offer, the partner counter offer otherwise), None if the negotiation was not
+        concluded with an agreement
+        """
+        if self.agreed_price is None:
+            return None
+
+        initiator_msg = self.message(INITIATOR, self.round)
+        if self.round > 0 and initiator_msg is not None and initiator_msg.offer == self.agreed_price:
+            return initiator_msg
+        return self.message(PARTNER, self.round)
+
+    def is_partial(self) -> bool:
+        """
+        :return: True if messages of the first rounds left the history window
+        """
+        first_msg = self.negotiation_history[INITIATOR][0] if self.negotiation_history[INITIATOR] else None
+        return first_msg is not None and first_msg.round > 0
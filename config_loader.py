@@ -0,0 +1,212 @@
+"""
+Loading and validation of the game configuration files.
+
+The owner (`config-ACME-project.cfg`), companies (`config-companies.cfg`) and game (`game.cfg`) configurations are
+parsed with the C YAML loader when PyYAML was built with libyaml, and their schema is checked once, when they are
+parsed. The parsed and validated configuration is then cached:
+  - in the process, keyed by the path, modification time and size of the file, so that games played one after the
+    other by the same process do not even read the file again, and by the SHA-256 of the file content
+  - on disk, as a pickle keyed by the kind of configuration and the SHA-256 of the file content, so that other
+    processes (tournament workers, batch runs) and copies of the same file (the per-game temporary files of the
+    tournament) skip the YAML parsing
+
+The cache directory is `.config_cache` in the working directory, or the directory given by the CONFIG_CACHE_DIR
+environment variable; an empty CONFIG_CACHE_DIR disables the disk cache.
+
+    owner_cfg = load_config("config-ACME-project.cfg", OWNER_CONFIG)
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+import yaml
+
+# libyaml based loader, about ten times faster than the pure Python one
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+OWNER_CONFIG = "owner"
+COMPANIES_CONFIG = "companies"
+GAME_CONFIG = "game"
+
+CACHE_DIR_VARIABLE = "CONFIG_CACHE_DIR"
+DEFAULT_CACHE_DIR = ".config_cache"
+
+# bump when the validation or the cached structure changes, so that older cache entries are ignored
+CACHE_FORMAT_VERSION = 2
+
+# Max. number of files / configurations kept in the in-process cache (the tournament uses new files for every game)
+MEMORY_CACHE_SIZE = 256
+
+INFEASIBLE_ITEMS_POLICIES = ("fail", "flag")
+
+
+class ConfigError(ValueError):
+    """
+    Raised when a configuration file does not follow the expected schema
+    """
+    pass
+
+
+def _require(condition: bool, path: str, message: str) -> None:
+    if not condition:
+        raise ConfigError("%s: %s" % (path, message))
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_owner_config(cfg: Any, path: str) -> None:
+    _require(isinstance(cfg, dict) and isinstance(cfg.get("elements"), list) and cfg["elements"], path,
+             "expected a non-empty 'elements' list")
+
+    names = set()
+    for element in cfg["elements"]:
+        _require(isinstance(element, dict) and isinstance(element.get("name"), str), path,
+                 "every element needs a 'name', got %r" % (element,))
+        _require(_is_number(element.get("budget")) and element["budget"] >= 0, path,
+                 "element '%s' needs a non-negative 'budget'" % element["name"])
+        _require(element["name"] not in names, path, "element '%s' is listed twice" % element["name"])
+        names.add(element["name"])
+
+
+def validate_companies_config(cfg: Any, path: str) -> None:
+    _require(isinstance(cfg, dict) and isinstance(cfg.get("companies"), list), path, "expected a 'companies' list")
+
+    names = set()
+    for company in cfg["companies"]:
+        _require(isinstance(company, dict) and isinstance(company.get("name"), str), path,
+                 "every company needs a 'name', got %r" % (company,))
+        _require(company["name"] not in names, path, "company '%s' is listed twice" % company["name"])
+        names.add(company["name"])
+
+        _require(isinstance(company.get("specialties"), list), path,
+                 "company '%s' needs a 'specialties' list" % company["name"])
+        for spec in company["specialties"]:
+            _require(isinstance(spec, dict) and isinstance(spec.get("specialty"), str) and
+                     _is_number(spec.get("cost")) and spec["cost"] >= 0, path,
+                     "company '%s' has an invalid specialty %r" % (company["name"], spec))
+
+
+def validate_game_config(cfg: Any, path: str) -> None:
+    _require(isinstance(cfg, dict), path, "expected a mapping")
+    for rounds in ("nr_auction_rounds", "nr_negotiation_rounds"):
+        _require(isinstance(cfg.get(rounds), int) and cfg[rounds] >= 1, path, "'%s' must be an integer >= 1" % rounds)
+
+    _require(cfg.get("negotiation_history") is None or
+             (isinstance(cfg["negotiation_history"], int) and cfg["negotiation_history"] >= 2), path,
+             "'negotiation_history' must be null or an integer >= 2")
+    _require(cfg.get("infeasible_items", "fail") in INFEASIBLE_ITEMS_POLICIES, path,
+             "'infeasible_items' must be one of %s" % (INFEASIBLE_ITEMS_POLICIES,))
+    for timeout in ("decision_deadline", "reply_timeout"):
+        _require(cfg.get(timeout) is None or (_is_number(cfg[timeout]) and cfg[timeout] > 0), path,
+                 "'%s' must be null or a positive number of seconds" % timeout)
+
+    _require(isinstance(cfg.get("agents"), list) and cfg["agents"], path, "expected a non-empty 'agents' list")
+    owners = 0
+    for ag_data in cfg["agents"]:
+        _require(isinstance(ag_data, dict) and isinstance(ag_data.get("module"), str) and
+                 isinstance(ag_data.get("class"), str), path,
+                 "every agents entry needs a 'module' and a 'class', got %r" % (ag_data,))
+        _require(isinstance(ag_data.get("roles"), list) and ag_data["roles"], path,
+                 "agents entry %s.%s needs a non-empty 'roles' list" % (ag_data["module"], ag_data["class"]))
+        _require(ag_data.get("options") is None or isinstance(ag_data["options"], dict), path,
+                 "the 'options' of agents entry %s.%s must be a mapping" % (ag_data["module"], ag_data["class"]))
+        owners += "ACME" in ag_data["roles"]
+    _require(owners == 1, path, "exactly one agents entry must have the 'ACME' role")
+
+
+VALIDATORS: Dict[str, Callable[[Any, str], None]] = {
+    OWNER_CONFIG: validate_owner_config,
+    COMPANIES_CONFIG: validate_companies_config,
+    GAME_CONFIG: validate_game_config,
+}
+
+# (kind, absolute path) -> ((mtime_ns, size), content hash) and (kind, content hash) -> configuration
+_file_hashes: Dict[Tuple[str, str], Tuple[Tuple[int, int], str]] = {}
+_parsed_configs: Dict[Tuple[str, str], Any] = {}
+_memory_cache_lock = threading.Lock()
+
+
+def cache_dir() -> str:
+    return os.environ.get(CACHE_DIR_VARIABLE, DEFAULT_CACHE_DIR)
+
+
+def parse_config(text: bytes, kind: str, path: str) -> Any:
+    """
+    Parses and validates the content of a configuration file
+    """
+    cfg = yaml.load(text, Loader=YAML_LOADER)
+    VALIDATORS[kind](cfg, path)
+    return cfg
+
+
+def _remember(cache: Dict[Any, Any], key: Any, value: Any) -> None:
+    cache[key] = value
+    if len(cache) > MEMORY_CACHE_SIZE:
+        # dicts keep the insertion order, drop the oldest entry
+        del cache[next(iter(cache))]
+
+
+def _read_cached(cache_file: str) -> Any:
+    try:
+        with open(cache_file, "rb") as f:
+            version, cfg = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        return None
+    return cfg if version == CACHE_FORMAT_VERSION else None
+
+
+def _write_cached(directory: str, cache_file: str, cfg: Any) -> None:
+    # written to a temporary file first, so that concurrent processes never read a partial entry
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((CACHE_FORMAT_VERSION, cfg), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        # the cache is an optimization, a read-only or full disk must not stop the game
+        pass
+
+
+def load_config(path: str, kind: str) -> Any:
+    """
+    Loads a validated configuration file, from the caches when the file did not change
+    :param path: the configuration file
+    :param kind: OWNER_CONFIG, COMPANIES_CONFIG or GAME_CONFIG
+    :return: the parsed configuration; it is shared with the later loads of the same file and must not be modified
+    """
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    file_key = (stat.st_mtime_ns, stat.st_size)
+
+    with _memory_cache_lock:
+        known = _file_hashes.get((kind, abs_path))
+        if known is not None and known[0] == file_key and (kind, known[1]) in _parsed_configs:
+            return _parsed_configs[(kind, known[1])]
+
+    with open(abs_path, "rb") as f:
+        text = f.read()
+    digest = hashlib.sha256(text).hexdigest()
+
+    with _memory_cache_lock:
+        cfg = _parsed_configs.get((kind, digest))
+
+    directory = cache_dir()
+    if cfg is None and directory:
+        cache_file = os.path.join(directory, "%s-%s.pickle" % (kind, digest))
+        cfg = _read_cached(cache_file)
+        if cfg is None:
+            cfg = parse_config(text, kind, path)
+            _write_cached(directory, cache_file, cfg)
+    elif cfg is None:
+        cfg = parse_config(text, kind, path)
+
+    with _memory_cache_lock:
+        _remember(_file_hashes, (kind, abs_path), (file_key, digest))
+        _remember(_parsed_configs, (kind, digest), cfg)
+    return cfg
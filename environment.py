@@ -1,11 +1,21 @@
-from base import Environment
-from typing import List, Dict, Any
+from base import Environment, AgentRegistry
+from typing import List, Dict, Any, Tuple, Callable, Optional
 import yaml
-from agents.student_agent import llm_interactions_log 
-from agents import HouseOwnerAgent, CompanyAgent
-from communication import MonotonicConcessionNegotiation
+from agents.student_agent import llm_interactions_log, token_ledger
+from agents import HouseOwnerAgent, CompanyAgent, load_agent_class
+from communication import MonotonicConcessionNegotiation, NegotiationMessage, AuctionAnnouncement, PARTNER
+from message_bus import MessageBus, NO_BID, NO_CONCESSION
+from remote_agents import AgentHosts, LOCAL_HOST
+from token_accounting import record_log_entry
+from negotiation_trace import NegotiationTrace
+from llm_log import save_interactions, LOG_FORMATS
+from config_loader import load_config, OWNER_CONFIG, COMPANIES_CONFIG, GAME_CONFIG
+from results_store import ResultsStore, config_hash, strategies
+from concurrent.futures import ThreadPoolExecutor, Future
+import argparse
 import json
 import logging.config
+import time
 
 with open('logging_conf.yaml', 'r') as f:
     log_cfg = yaml.safe_load(f.read())
@@ -23,6 +33,17 @@ INTERIOR_DESIGN     = "interior design"
 ELECTRICS_PLUMBING  = "electrics and plumbing"
 
 
+"""
+GAME PHASES, reported to the phase listeners of the environment
+"""
+AUCTION_END         = "auction_end"       # all the auctions are completed
+NEGOTIATION_END     = "negotiation_end"   # the negotiation of an item is completed or failed
+GAME_END            = "game_end"
+
+
+# Max. number of speculative owner offers prepared at the same time
+SPECULATION_WORKERS = 32
+
 
 """
 ENVIRONMENT IMPLEMENTATION
@@ -34,292 +55,692 @@ class BuildingEnvironment(Environment):
     AGENT_MODULE            = "module"
     AGENT_CLASS             = "class"
     AGENT_ROLES             = "roles"
+    AGENT_OPTIONS           = "options"
+    AGENT_HOST              = "host"
+    AGENT_WORKERS           = "agent_workers"
+    INFEASIBLE_ITEMS        = "infeasible_items"
+    SIMULTANEOUS_ITEMS      = "simultaneous_items"
+    DECISION_DEADLINE       = "decision_deadline"
+    MESSAGE_BUS             = "message_bus"
+    REPLY_TIMEOUT           = "reply_timeout"
+    LLM_BACKEND             = "llm_backend"
+    NEGOTIATION_HISTORY     = "negotiation_history"
+    SPECULATIVE_OFFERS      = "speculative_offers"
+
+    # game wide settings that are passed on to every agent through Agent.configure
+    AGENT_GAME_SETTINGS     = [NR_AUCTION_ROUNDS, NR_NEGOTIATION_ROUNDS, DECISION_DEADLINE, LLM_BACKEND]
     BUDGET_ELEMENTS         = "elements"
     COMPANIES               = "companies"
     SPECIALTIES             = "specialties"
 
-    def __init__(self, owner_cfg_file: str, companies_cfg_file: str, game_cfg_file: str):
+    def __init__(self, owner_cfg_file: str, companies_cfg_file: str, game_cfg_file: str, reusable: bool = False):
+        """
+        :param reusable: keep the message bus and the agent hosts open at the end of a game, so that more games can
+        be played with `reset`; `close` must then be called once done with the environment
+        """
         super(BuildingEnvironment, self).__init__()
 
         self._owner_cfg_file: str = owner_cfg_file
         self._companies_cfg_file: str = companies_cfg_file
         self._game_cfg_file: str = game_cfg_file
 
+        self._registry = AgentRegistry()
         self._company_agents: List[CompanyAgent] = []
         self._owner_agent: HouseOwnerAgent = None
 
         self._num_auction_rounds = 3
         self._num_negotiation_rounds = 3
+        self._negotiation_history: Optional[int] = None
+        self._infeasible_items_policy = "fail"
+        self._simultaneous_items = False
+        self._item_executor: ThreadPoolExecutor = None
+        self._speculative_offers = False
+        self._speculation_executor: ThreadPoolExecutor = None
+        self._message_bus: MessageBus = None
+        self._reply_timeout = None
+        self._agent_hosts: AgentHosts = None
+        self._reusable = reusable
+        self._closed = False
 
-        self._construction_items = [STRUCTURAL_DESIGN, STRUCTURE_BUILDING, ELECTRICS_PLUMBING, INTERIOR_DESIGN]
         self._crt_item_idx: int = 0
-
         self._auction_stage = True
-        self._auction_status = {
-            STRUCTURAL_DESIGN: {"round": 0, "completed": False, "selected": []},
-            STRUCTURE_BUILDING: {"round": 0, "completed": False, "selected": []},
-            ELECTRICS_PLUMBING: {"round": 0, "completed": False, "selected": []},
-            INTERIOR_DESIGN: {"round": 0, "completed": False, "selected": []},
-        }
-
         self._negotiation_stage = False
-        self._negotiation_status: Dict[str, Dict[str, Any]] = {
-            STRUCTURAL_DESIGN: {"completed": False, "winner": None, "negotiations": []},
-            STRUCTURE_BUILDING: {"completed": False, "winner": None, "negotiations": []},
-            ELECTRICS_PLUMBING: {"completed": False, "winner": None, "negotiations": []},
-            INTERIOR_DESIGN: {"completed": False, "winner": None, "negotiations": []},
-        }
+        # replaced by the items of the owner configuration in initialize
+        self.__set_construction_items([STRUCTURAL_DESIGN, STRUCTURE_BUILDING, ELECTRICS_PLUMBING, INTERIOR_DESIGN])
 
         self._finished = False
+        self._game_successful = False
         self._game_status_str = None
 
 
         self._attributed_items: Dict[str, CompanyAgent] = {}
+        self._attributed_prices: Dict[str, float] = {}
 
-    @staticmethod
-    def __get_company_config(companies: List[Dict[str, Any]], role: str):
-        for comp in companies:
-            if comp["name"] == role:
-                return comp
+        self._feasibility: Dict[str, Dict[str, Any]] = {}
 
-        return None
+        self._phase_listeners: List[Callable[[str, Optional[str]], None]] = []
+
+    def add_phase_listener(self, listener: Callable[[str, Optional[str]], None]) -> None:
+        """
+        Registers a function called, from the thread running `step`, at the end of the game phases: with
+        (AUCTION_END, None), (NEGOTIATION_END, item) for every item and (GAME_END, None)
+        """
+        self._phase_listeners.append(listener)
+
+    def __notify_phase(self, phase: str, item: Optional[str] = None) -> None:
+        for listener in self._phase_listeners:
+            listener(phase, item)
+
+    def __set_construction_items(self, items: List[str]) -> None:
+        """
+        Sets the construction items of the game, auctioned and negotiated in the given order
+        """
+        self._construction_items = list(items)
+        self._auction_status = {
+            item: {"round": 0, "completed": False, "selected": [], "price": None, "failed": False} for item in items
+        }
+        self._negotiation_status: Dict[str, Dict[str, Any]] = {
+            item: {"completed": False, "winner": None, "negotiations": [], "failed": False} for item in items
+        }
 
     def add_company_agent(self, agent: CompanyAgent):
+        self._registry.register(agent)
         self._company_agents.append(agent)
 
     def set_owner_agent(self, agent: HouseOwnerAgent):
+        self._registry.register(agent)
         self._owner_agent = agent
 
     def initialize(self):
         """
         Initializes the house building environment with attributes provided in the yml config file with
-        which the environment was instantiate
+        which the environment was instantiate. The configuration files are validated when they are parsed, and
+        only parsed again when they change (see config_loader).
         """
-        owner_cfg = None
-        companies_cfg = None
-        game_cfg = None
+        owner_cfg = load_config(self._owner_cfg_file, OWNER_CONFIG)
+        companies_cfg = load_config(self._companies_cfg_file, COMPANIES_CONFIG)
+        game_cfg = load_config(self._game_cfg_file, GAME_CONFIG)
 
-        with open(self._owner_cfg_file) as f:
-            owner_cfg = yaml.load(f, Loader=yaml.FullLoader)
+        self._num_auction_rounds = game_cfg[BuildingEnvironment.NR_AUCTION_ROUNDS]
+        self._num_negotiation_rounds = game_cfg[BuildingEnvironment.NR_NEGOTIATION_ROUNDS]
+        self._negotiation_history = game_cfg.get(BuildingEnvironment.NEGOTIATION_HISTORY)
+        self._infeasible_items_policy = game_cfg.get(BuildingEnvironment.INFEASIBLE_ITEMS, "fail")
+        self._simultaneous_items = game_cfg.get(BuildingEnvironment.SIMULTANEOUS_ITEMS, False)
+        self._speculative_offers = game_cfg.get(BuildingEnvironment.SPECULATIVE_OFFERS, False)
+        if game_cfg.get(BuildingEnvironment.MESSAGE_BUS, False):
+            self._message_bus = MessageBus()
+            self._reply_timeout = game_cfg.get(BuildingEnvironment.REPLY_TIMEOUT)
 
-        with open(self._companies_cfg_file) as f:
-            companies_cfg = yaml.load(f, Loader=yaml.FullLoader)
+        self._agent_hosts = AgentHosts(game_cfg.get(BuildingEnvironment.AGENT_WORKERS, 0))
 
-        with open(self._game_cfg_file) as f:
-            game_cfg = yaml.load(f, Loader=yaml.FullLoader)
+        self.__set_construction_items([element["name"] for element in owner_cfg[BuildingEnvironment.BUDGET_ELEMENTS]])
+        company_configs = {comp["name"]: comp for comp in companies_cfg[BuildingEnvironment.COMPANIES]}
 
-        self._num_auction_rounds = game_cfg[BuildingEnvironment.NR_AUCTION_ROUNDS]
-        self._num_negotiation_rounds = game_cfg[BuildingEnvironment.NR_NEGOTIATION_ROUNDS]
+        game_settings = {setting: game_cfg[setting] for setting in BuildingEnvironment.AGENT_GAME_SETTINGS
+                         if setting in game_cfg}
 
         for ag_data in game_cfg[self.AGENTS]:
-            agent_module = "agents." + ag_data[BuildingEnvironment.AGENT_MODULE]
-            agent_class = ag_data[BuildingEnvironment.AGENT_CLASS]
-
-            mod = __import__(agent_module, fromlist=[agent_class])
-            klass = getattr(mod, agent_class)
+            agent_options = dict(game_settings)
+            agent_options.update(ag_data.get(BuildingEnvironment.AGENT_OPTIONS) or {})
 
             if "ACME" in ag_data[BuildingEnvironment.AGENT_ROLES]:
-                agent = klass("ACME", owner_cfg[BuildingEnvironment.BUDGET_ELEMENTS])
+                agent = self.__create_agent(ag_data, "ACME", owner_cfg[BuildingEnvironment.BUDGET_ELEMENTS],
+                                            agent_options, owner=True)
                 self.set_owner_agent(agent)
             else:
                 for role in ag_data[BuildingEnvironment.AGENT_ROLES]:
-                    comp_config = BuildingEnvironment.__get_company_config(
-                        companies_cfg[BuildingEnvironment.COMPANIES],
-                        role
-                    )
-
+                    comp_config = company_configs.get(role)
                     if comp_config:
-                        agent = klass(role, comp_config[BuildingEnvironment.SPECIALTIES])
+                        agent = self.__create_agent(ag_data, role, comp_config[BuildingEnvironment.SPECIALTIES],
+                                                    agent_options, owner=False)
                         self.add_company_agent(agent)
 
+        self._feasibility = self.analyze_feasibility()
+        self.__start_game()
+
+    def reset(self) -> None:
+        """
+        Prepares the environment for a new game with the same configuration and the same agents: the game state of
+        the environment and of the agents is cleared, while the parsed configuration, the agents, their budgets /
+        specialties and the feasibility analysis are kept. Configuration files changed since `initialize` are not
+        read again.
+        """
+        if self._closed:
+            raise RuntimeError("The message bus and agent hosts were closed at the end of the game, "
+                               "create the environment with reusable=True to reset it")
+
+        self._crt_item_idx = 0
+        self._auction_stage = True
+        self._negotiation_stage = False
+        self.__set_construction_items(self._construction_items)
+
+        self._finished = False
+        self._game_successful = False
+        self._game_status_str = None
+        self._attributed_items = {}
+        self._attributed_prices = {}
+
+        self._owner_agent.reset()
+        for agent in self._company_agents:
+            agent.reset()
+        self.__start_game()
+
+    def __start_game(self) -> None:
+        """
+        Starts accounting the LLM calls of a new game, sends the feasibility analysis to the owner, and ends the game
+        right away if an item is infeasible and the `infeasible_items` policy is "fail"
+        """
+        token_ledger.new_game()
+        self._owner_agent.notify_item_feasibility(self._feasibility)
+
+        infeasible_items = [item for item in self._construction_items if not self._feasibility[item]["feasible"]]
+        if infeasible_items:
+            if self._infeasible_items_policy == "fail":
+                self.__end_game(successful=False)
+                logger.info("[NOTIFICATION] GAME ENDED UNSUCCESSFULLY! No company can build item(s) %s within "
+                            "the owner budget" % infeasible_items)
+            else:
+                logger.warning("Construction item(s) %s cannot be contracted within the owner budget"
+                               % infeasible_items)
+
+    def __create_agent(self, ag_data: Dict[str, Any], role: str, init_arg: List[Dict[str, Any]],
+                       agent_options: Dict[str, Any], owner: bool):
+        """
+        Creates and configures an agent of an `agents` entry, in the environment process or on the host given by
+        the entry, and registers it on the message bus if there is one
+        :param init_arg: the budget list of the owner or the specialties of the company
+        :return: the agent, or the proxy the environment has to use to talk to it
+        """
+        agent_module = ag_data[BuildingEnvironment.AGENT_MODULE]
+        agent_class = ag_data[BuildingEnvironment.AGENT_CLASS]
+        host = ag_data.get(BuildingEnvironment.AGENT_HOST, LOCAL_HOST)
+
+        if host == LOCAL_HOST:
+            agent = load_agent_class(agent_module, agent_class)(role, init_arg)
+            agent.configure(agent_options)
+        else:
+            agent = self._agent_hosts.create_agent(host, owner, agent_module, agent_class, role, init_arg,
+                                                   agent_options)
+
+        if self._message_bus is not None:
+            agent = self._message_bus.register(agent)
+        return agent
+
+    def analyze_feasibility(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Checks, before the auction starts, whether each construction item can be contracted at all. A company can
+        only bid for an item it specializes in and at a price that covers its cost, while the owner never offers
+        more than its budget for the item.
+        :return: dict mapping each construction item to its `budget`, the number of `specialists`, the minimum
+        cost among them (`min_cost`), the number of `eligible_bidders` (specialists whose cost is within budget),
+        the budget `slack` (budget - min_cost) and the `feasible` flag
+        """
+        feasibility = {}
+        for item in self._construction_items:
+            budget = self._owner_agent.budget_dict.get(item, 0)
+            costs = [ag.specialties[item] for ag in self._company_agents if ag.has_specialty(item)]
+            min_cost = min(costs) if costs else None
+
+            feasibility[item] = {
+                "budget": budget,
+                "specialists": len(costs),
+                "min_cost": min_cost,
+                "eligible_bidders": len([cost for cost in costs if cost <= budget]),
+                "slack": budget - min_cost if min_cost is not None else None,
+                "feasible": min_cost is not None and min_cost <= budget,
+            }
+
+        return feasibility
+
+
+    def _auction_item_step(self, auction_item: str) -> None:
+        """
+        Plays one auction round for the given construction item and updates its `_auction_status` entry: the item
+        is marked as completed if there were respondents, as failed if all auction rounds have passed without any.
+        :param auction_item: the construction item to auction
+        """
+        print('[Auction stage]')
+        print("Item  : ",auction_item, end='')
+        auction_round = self._auction_status[auction_item]["round"]
+        if auction_round < self._num_auction_rounds:
+
+            # send an AuctioneerPerception to the house owner
+            item_budget = self._owner_agent.propose_item_budget(auction_item, auction_round)
+
+            print(' /',item_budget)
+
+            # send a BidderPerception to the company agents
+            bidders = [ag for ag in self._company_agents if ag.has_specialty(auction_item)]
+            agent_bids: List[bool] = self.__collect_bids(bidders, auction_item, auction_round, item_budget)
+
+            print("    agent _bids : ",agent_bids)
+
+            # send result of auction round to house owner
+            selected_agents = [ag for ag, bid in zip(bidders, agent_bids) if bid]
+            responding_agents = [ag.name for ag in selected_agents]
+            print("responding agent are : ",responding_agents)
+
+            self._owner_agent.notify_auction_round_result(auction_item, auction_round, responding_agents)
+
+            # inform responding agent that they have won the auction
+            for ag in selected_agents:
+                ag.notify_won_auction(auction_item, auction_round, len(responding_agents))
+
+            # if there were any respondents the auction for the current auction item ends
+            if responding_agents:
+                self._auction_status[auction_item]["completed"] = True
+                self._auction_status[auction_item]["selected"] = [ag.agent_id for ag in selected_agents]
+                self._auction_status[auction_item]["price"] = item_budget
+                logger.info("[NOTIFICATION] Companies " + str(responding_agents) +
+                            " have accepted construction item " + auction_item + " at price: " +
+                            str(item_budget))
+            else:
+                # increase round count
+                self._auction_status[auction_item]["round"] = auction_round + 1
+        else:
+            # if number of auction round have passed, the game is lost by the home owner
+            self._auction_status[auction_item]["failed"] = True
+            logger.info("[NOTIFICATION] GAME ENDED UNSUCCESSFULLY! House owner could not secure contract " +
+                        "for item %s after %i rounds\n" % (auction_item, auction_round))
+
+    def _negotiation_item_step(self, negotiation_item: str) -> None:
+        """
+        Plays one negotiation round for the given construction item with all the companies selected in its
+        auction and updates its `_negotiation_status` entry: the item is marked as completed when one of the
+        negotiations reaches an agreement, as failed when none of them is still active.
+        :param negotiation_item: the construction item under negotiation
+        """
+        print('[Negotiation stage]')
+
+        # if negotiation(s) for this construction has not started, create one/some
+        if not self._negotiation_status[negotiation_item]["negotiations"]:
+            initial_offers: List[Tuple[MonotonicConcessionNegotiation, NegotiationMessage]] = []
+            for partner_id in self._auction_status[negotiation_item]["selected"]:
+                partner_ag = self._registry.agent(partner_id)
+                negotiation_conv = MonotonicConcessionNegotiation(self._owner_agent, partner_ag, negotiation_item,
+                                                                  self._num_negotiation_rounds,
+                                                                  self._negotiation_history)
+                self._negotiation_status[negotiation_item]["negotiations"].append(negotiation_conv)
+
+                # get first offer from initiator
+                initial_offer = self._owner_agent.provide_negotiation_offer(negotiation_item, partner_ag.name,
+                                                                            negotiation_conv.round)
+                self.__offer_to_partner(initial_offers, negotiation_conv,
+                                        negotiation_conv.new_initiator_message(offer=initial_offer))
+
+            # get initial responses from partner agents
+            self.__play_responses(initial_offers)
+
+        # check if after after a proposal by initiator and response by partner agreement is reached
+        best_response_ag: CompanyAgent = None
+        best_response: float = 0
+
+        active_negotiations = [n for n in self._negotiation_status[negotiation_item]["negotiations"]
+                                 if not n.is_failed()]
+        if not active_negotiations:
+            logger.info("[NOTIFICATION] GAME ENDED UNSUCCESSFULLY! Owner Agent failed to "
+                        "negotiate properly for construction item %s" % negotiation_item)
+            self._negotiation_status[negotiation_item]["failed"] = True
+            return
+
+        for negotiation_conv in active_negotiations:
+            negotiation_result = negotiation_conv.agreement_reached()
+            if negotiation_result:
+                if best_response_ag is None:
+                    best_response = negotiation_result
+                    best_response_ag = negotiation_conv.partner
+                elif negotiation_result < best_response:
+                    best_response = negotiation_result
+                    best_response_ag = negotiation_conv.partner
+
+        if best_response_ag:
+            # if there is a winner, announce it and end negotiation for current construction item
+            self.__assign_negotiation_winner(negotiation_item, best_response_ag, best_response)
+
+        else:
+            # another negotiation round has to take place
+            pending_offers: List[Tuple[MonotonicConcessionNegotiation, NegotiationMessage]] = []
+            for negotiation_conv in active_negotiations:
+                # initiate next round
+                negotiation_conv.next_round()
+
+                # get owner offer
+                owner_offer = self._owner_agent.provide_negotiation_offer(negotiation_item,
+                                                                          negotiation_conv.partner.name,
+                                                                          negotiation_conv.round)
+                owner_offer_msg = negotiation_conv.new_initiator_message(offer=owner_offer)
+
+                if negotiation_conv.protocol_respected_initiator():
+                    # test if new offer made by owner agent leads to protocol end
+                    negotiation_result = negotiation_conv.agreement_reached()
+                    if negotiation_result:
+                        if best_response_ag is None:
+                            best_response = negotiation_result
+                            best_response_ag = negotiation_conv.partner
+                        elif negotiation_result < best_response:
+                            best_response = negotiation_result
+                            best_response_ag = negotiation_conv.partner
+                    else:
+                        # if owner offer does not close protocol, a response from partner is needed
+                        self.__offer_to_partner(pending_offers, negotiation_conv, owner_offer_msg)
+
+            self.__play_responses(pending_offers)
+
+            if best_response_ag:
+                # if one of the negotiations finished succesfully end the negotiation for this item
+                self.__assign_negotiation_winner(negotiation_item, best_response_ag, best_response)
+
+    def __offer_to_partner(self, pending_offers: List[Tuple[MonotonicConcessionNegotiation, NegotiationMessage]],
+                           negotiation_conv: MonotonicConcessionNegotiation, offer_msg: NegotiationMessage) -> None:
+        """
+        Without the message bus, the partner responds to the owner offer right away, before the owner makes its
+        offer to the next partner. Through the bus, the offer waits in `pending_offers` to go out with the offers to
+        the other partners.
+        """
+        if self._message_bus is None:
+            self.__play_responses([(negotiation_conv, offer_msg)])
+        else:
+            pending_offers.append((negotiation_conv, offer_msg))
+
+    def __play_responses(self, offers: List[Tuple[MonotonicConcessionNegotiation, NegotiationMessage]]) -> None:
+        """
+        Gets the responses of the partners to the owner offers and notifies the owner of the ones respecting the
+        protocol
+        """
+        for (negotiation_conv, _), response_offer in zip(offers, self.__collect_responses(offers)):
+            if response_offer is NO_CONCESSION:
+                # the partner did not answer within `reply_timeout`: its standing offer holds, which is no violation
+                response_offer_msg = negotiation_conv.new_partner_message(offer=self.__standing_offer(negotiation_conv))
+                self._owner_agent.notify_partner_response(response_offer_msg)
+                continue
+
+            response_offer_msg = negotiation_conv.new_partner_message(offer=response_offer)
+
+            # if partner respects protocol, send partner response to owner agent
+            if negotiation_conv.protocol_respected_partner():
+                self._owner_agent.notify_partner_response(response_offer_msg)
+
+    def __standing_offer(self, negotiation_conv: MonotonicConcessionNegotiation) -> float:
+        """
+        :return: the price the partner of a negotiation last agreed to: its previous counter offer, or the auction
+        price in round 0
+        """
+        previous_counter = negotiation_conv.message(PARTNER, negotiation_conv.round - 1)
+        if previous_counter is not None:
+            return previous_counter.offer
+        return self._auction_status[negotiation_conv.negotiation_item]["price"]
+
+    def __collect_bids(self, bidders: List[CompanyAgent], auction_item: str, auction_round: int,
+                       item_budget: float) -> List[bool]:
+        """
+        Announces the auction price to the companies specialized in the item. Through the message bus, the
+        announcements go out at the same time and companies that do not answer within `reply_timeout` do not bid.
+        :return: the decision to bid of each bidder, in the order of the bidders
+        """
+        if self._message_bus is None:
+            return [ag.decide_bid(auction_item, auction_round, item_budget) for ag in bidders]
+
+        announcements = [AuctionAnnouncement(self._owner_agent.name, ag.name, auction_item, auction_round, item_budget)
+                         for ag in bidders]
+        return self._message_bus.deliver(announcements, self._reply_timeout, NO_BID)
+
+    def __collect_responses(self, offers: List[Tuple[MonotonicConcessionNegotiation, NegotiationMessage]]) \
+            -> List[float]:
+        """
+        Gets the response of the partner of each negotiation to the owner offer. Through the message bus, the
+        offers go out at the same time and partners that do not answer within `reply_timeout` do not concede
+        (NO_CONCESSION): their standing offer holds.
+        :return: the counter offers, in the order of the given offers
+        """
+        speculations = self.__speculate_offers(offers)
+        if self._message_bus is None:
+            responses = [negotiation_conv.partner.respond_to_offer(offer_msg) for negotiation_conv, offer_msg in offers]
+        else:
+            responses = self._message_bus.deliver([offer_msg for _, offer_msg in offers], self._reply_timeout,
+                                                  NO_CONCESSION)
+
+        # the owner hears of the responses once its speculative offers are prepared, so that they never overlap
+        for speculation in speculations:
+            try:
+                speculation.result()
+            except Exception:
+                # nothing was prepared: the owner decides its next offer as usual, as for any missed speculation
+                logger.exception("Owner agent failed to prepare a speculative offer")
+        return responses
+
+    def __speculate_offers(self, offers: List[Tuple[MonotonicConcessionNegotiation, NegotiationMessage]]) \
+            -> List[Future]:
+        """
+        With `speculative_offers`, starts preparing the owner offers of the next round for the responses the owner
+        expects, while the partners decide: the owner uses a prepared offer when the actual response matches, so
+        that the next round does not wait for its decision
+        :return: the pending speculative offers
+        """
+        if not self._speculative_offers:
+            return []
+
+        if self._speculation_executor is None:
+            self._speculation_executor = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS,
+                                                            thread_name_prefix="speculation")
+        speculations = []
+        for negotiation_conv, _ in offers:
+            next_round = negotiation_conv.round + 1
+            if next_round >= self._num_negotiation_rounds:
+                continue
+            partner_name = negotiation_conv.partner.name
+            for expected_response in self._owner_agent.expected_partner_responses(negotiation_conv.negotiation_item,
+                                                                                  partner_name, negotiation_conv.round):
+                speculations.append(self._speculation_executor.submit(
+                    self._owner_agent.speculate_negotiation_offer, negotiation_conv.negotiation_item, partner_name,
+                    next_round, expected_response))
+        return speculations
+
+    def __assign_negotiation_winner(self, negotiation_item: str, winner: CompanyAgent, price: float) -> None:
+        for negotiation_conv in self._negotiation_status[negotiation_item]["negotiations"]:
+            if negotiation_conv.partner is winner:
+                negotiation_conv.conclude(price)
+        self._negotiation_status[negotiation_item]["winner"] = winner
+        self._negotiation_status[negotiation_item]["completed"] = True
+        self._attributed_items[negotiation_item] = winner
+        self._attributed_prices[negotiation_item] = price
+        self._owner_agent.notify_negotiation_winner(negotiation_item, winner.name, price)
+        winner.notify_contract_assigned(negotiation_item, price)
+
+        for ag_id in self._auction_status[negotiation_item]["selected"]:
+            if ag_id != winner.agent_id:
+                self._registry.agent(ag_id).notify_negotiation_lost(negotiation_item)
+
+    def __run_concurrently(self, step_function, items: List[str]) -> None:
+        """
+        Runs the per-item step function for all the given construction items in parallel threads. Agent
+        decisions are dominated by LLM latency, so the step takes as long as the slowest item.
+        """
+        if self._item_executor is None:
+            self._item_executor = ThreadPoolExecutor(max_workers=len(self._construction_items),
+                                                     thread_name_prefix="item")
+
+        # consume the results so that exceptions raised in a worker thread propagate
+        list(self._item_executor.map(step_function, items))
+
+    def __end_game(self, successful: bool) -> None:
+        self._auction_stage = False
+        self._negotiation_stage = False
+        self._finished = True
+        self._game_successful = successful
+        self.__shutdown_executors()
+
+        if not self._reusable:
+            self._closed = self._message_bus is not None or bool(self._agent_hosts and self._agent_hosts.agents)
+        if self._message_bus is not None and not self._reusable:
+            self._message_bus.close()
+
+        if self._agent_hosts is not None:
+            # bring the LLM interactions of the hosted agents back into the logs of this process
+            for entry in self._agent_hosts.collect_interactions():
+                llm_interactions_log.append(entry)
+                record_log_entry(token_ledger, entry)
+            if not self._reusable:
+                self._agent_hosts.close()
+
+        self.__notify_phase(GAME_END)
+
+    def __shutdown_executors(self) -> None:
+        """
+        Stops the threads of the simultaneous items and of the speculative offers, created again when needed
+        """
+        if self._item_executor is not None:
+            self._item_executor.shutdown(wait=False)
+            self._item_executor = None
+        if self._speculation_executor is not None:
+            self._speculation_executor.shutdown(wait=False)
+            self._speculation_executor = None
+
+    def close(self) -> None:
+        """
+        Stops the message bus, the agent hosts and the worker threads of a reusable environment
+        """
+        self.__shutdown_executors()
+        if self._message_bus is not None:
+            self._message_bus.close()
+        if self._agent_hosts is not None:
+            self._agent_hosts.close()
 
     def step(self):
-        
-        
+        if self._simultaneous_items:
+            self.__simultaneous_step()
+            return
+
         # Stage 1 - auction stage
         if self._auction_stage:
-            
             auction_item = self._construction_items[self._crt_item_idx]
-            print('[Auction stage]')
-            print("Item  : ",auction_item, end='')
             if self._auction_status[auction_item]["completed"]:
                 self._crt_item_idx += 1
             else:
-                auction_round = self._auction_status[auction_item]["round"]
-                if auction_round < self._num_auction_rounds:
-                    
-                    # send an AuctioneerPerception to the house owner
-                    item_budget = self._owner_agent.propose_item_budget(auction_item, auction_round)
-
-                    print(' /',item_budget)                    
-
-                    # send a BidderPerception to the company agents
-                    agent_bids: Dict[CompanyAgent, float] = {}
-                    for ag in self._company_agents:
-                        if ag.has_specialty(auction_item):
-                            bid = ag.decide_bid(auction_item, auction_round, item_budget)
-                            agent_bids[ag] = bid
-                            
-                    print("    agent _bids : ",agent_bids.values())
-                    
-                    # send result of auction round to house owner
-                    responding_agents = [ag.name for ag in agent_bids if agent_bids[ag]]
-                    print("responding agent are : ",responding_agents)
-                    
-                    self._owner_agent.notify_auction_round_result(auction_item, auction_round, responding_agents)
-
-                    # inform responding agent that they have won the auction
-                    for ag in [ag for ag in agent_bids if agent_bids[ag]]:
-                        ag.notify_won_auction(auction_item, auction_round, len(responding_agents))
-
-                    # if there were any respondents the auction for the current auction item ends and one can move on
-                    if responding_agents:
-                        self._auction_status[auction_item]["completed"] = True
-                        self._auction_status[auction_item]["selected"] = [ag for ag in agent_bids if agent_bids[ag]]
-                        self._crt_item_idx += 1
-                        logger.info("[NOTIFICATION] Companies " + str(responding_agents) +
-                                    " have accepted construction item " + auction_item + " at price: " +
-                                    str(item_budget))
-
-                        if self._crt_item_idx == len(self._construction_items):
-                            # At this point the auction stage is finished
-                            self._auction_stage = False
-                            self._negotiation_stage = True
-                            self._crt_item_idx = 0
-                            logger.info("[NOTIFICATION] The Auction Phase has finished.")
-                    else:
-                        # increase round count
-                        self._auction_status[auction_item]["round"] = auction_round + 1
-                else:
-                    # if number of auction round have passed, the game is lost by the home owner
-                    self._finished = True
-                    logger.info("[NOTIFICATION] GAME ENDED UNSUCCESSFULLY! House owner could not secure contract " +
-                                "for item %s after %i rounds\n" % (auction_item, auction_round))
+                self._auction_item_step(auction_item)
+
+                if self._auction_status[auction_item]["failed"]:
+                    self.__end_game(successful=False)
+
+                elif self._auction_status[auction_item]["completed"]:
+                    # the auction for the current auction item ends and one can move on
+                    self._crt_item_idx += 1
+
+                    if self._crt_item_idx == len(self._construction_items):
+                        # At this point the auction stage is finished
+                        self._auction_stage = False
+                        self._negotiation_stage = True
+                        self._crt_item_idx = 0
+                        logger.info("[NOTIFICATION] The Auction Phase has finished.")
+                        self.__notify_phase(AUCTION_END)
 
         elif self._negotiation_stage:
-            print('[Negotiation stage]')
             # Stage 2 - negotiation stage
-            
             if self._crt_item_idx < len(self._construction_items):
                 negotiation_item = self._construction_items[self._crt_item_idx] # select current negotiation item
 
-                # if negotiation(s) for this construction has not started, create one/some
-                if not self._negotiation_status[negotiation_item]["negotiations"]:
-                    for partner_ag in self._auction_status[negotiation_item]["selected"]:
-                        negotiation_conv = MonotonicConcessionNegotiation(self._owner_agent, partner_ag, negotiation_item,
-                                                                          self._num_negotiation_rounds)
-                        self._negotiation_status[negotiation_item]["negotiations"].append(negotiation_conv)
-
-                        # get first offer from initiator
-                        initial_offer = self._owner_agent.provide_negotiation_offer(negotiation_item, partner_ag.name,
-                                                                                    negotiation_conv.round)
-                        initial_offer_msg = negotiation_conv.new_initiator_message(offer=initial_offer)
-
-                        # get initial response for partner agent
-                        response_offer = partner_ag.respond_to_offer(initial_offer_msg)
-                        response_offer_msg = negotiation_conv.new_partner_message(offer=response_offer)
-                        self._owner_agent.notify_partner_response(response_offer_msg)
-
                 # negotiation under way, see if agreement reached or protocol followed
                 if self._negotiation_status[negotiation_item]["completed"]:
                     logger.info("[NOTIFICATION] Construction item %s assigned to %s!"
                                 % (negotiation_item, self._negotiation_status[negotiation_item]["winner"]))
                     self._crt_item_idx += 1
                 else:
-                    # check if after after a proposal by initiator and response by partner agreement is reached
-                    best_response_ag: CompanyAgent = None
-                    best_response: float = 0
-
-                    active_negotiations = [n for n in self._negotiation_status[negotiation_item]["negotiations"]
-                                             if not n.is_failed()]
-                    if not active_negotiations:
-                        logger.info("[NOTIFICATION] GAME ENDED UNSUCCESSFULLY! Owner Agent failed to "
-                                    "negotiate properly for construction item %s" % negotiation_item)
-                        self._finished = True
-                        return
-
-                    for negotiation_conv in active_negotiations:
-                        negotiation_result = negotiation_conv.agreement_reached()
-                        if negotiation_result:
-                            if best_response_ag is None:
-                                best_response = negotiation_result
-                                best_response_ag = negotiation_conv.partner
-                            elif negotiation_result < best_response:
-                                best_response = negotiation_result
-                                best_response_ag = negotiation_conv.partner
-
-                    if best_response_ag:
-                        # if there is a winner, announce it and end negotiation for current construction item
-                        self._negotiation_status[negotiation_item]["winner"] = best_response_ag
-                        self._negotiation_status[negotiation_item]["completed"] = True
-                        self._owner_agent.notify_negotiation_winner(negotiation_item, best_response_ag.name,
-                                                                    best_response)
-                        best_response_ag.notify_contract_assigned(negotiation_item, best_response)
-
-                        for ag in self._auction_status[negotiation_item]["selected"]:
-                            if ag != best_response_ag:
-                                ag.notify_negotiation_lost(negotiation_item)
+                    self._negotiation_item_step(negotiation_item)
 
-                    else:
-                        # another negotiation round has to take place
-                        active_negotiations = [n for n in self._negotiation_status[negotiation_item]["negotiations"]
-                                               if not n.is_failed()]
-                        if not active_negotiations:
-                            logger.info("[NOTIFICATION] GAME ENDED UNSUCCESSFULLY! Owner Agent failed to "
-                                        "negotiate properly for construction item %s" % negotiation_item)
-                            self._finished = True
-                            return
-
-                        for negotiation_conv in active_negotiations:
-                            # initiate next round
-                            negotiation_conv.next_round()
-
-                            # get owner offer
-                            owner_offer = self._owner_agent.provide_negotiation_offer(negotiation_item,
-                                                                                      negotiation_conv.partner.name,
-                                                                                      negotiation_conv.round)
-                            owner_offer_msg = negotiation_conv.new_initiator_message(offer=owner_offer)
-
-                            if negotiation_conv.protocol_respected_initiator():
-                                # test if new offer made by owner agent leads to protocol end
-                                negotiation_result = negotiation_conv.agreement_reached()
-                                if negotiation_result:
-                                    if best_response_ag is None:
-                                        best_response = negotiation_result
-                                        best_response_ag = negotiation_conv.partner
-                                    elif negotiation_result < best_response:
-                                        best_response = negotiation_result
-                                        best_response_ag = negotiation_conv.partner
-                                else:
-                                    # if owner offer does not close protocol, get a response from partner
-                                    response_offer = negotiation_conv.partner.respond_to_offer(owner_offer_msg)
-                                    response_offer_msg = negotiation_conv.new_partner_message(offer=response_offer)
-
-                                    # if partner respects protocol, send partner response to owner agent
-                                    if negotiation_conv.protocol_respected_partner():
-                                        self._owner_agent.notify_partner_response(response_offer_msg)
-
-                            if best_response_ag:
-                                # if one of the negotiations finished succesfully end the negotiation for this item
-                                self._negotiation_status[negotiation_item]["winner"] = best_response_ag
-                                self._negotiation_status[negotiation_item]["completed"] = True
-                                self._owner_agent.notify_negotiation_winner(negotiation_item, best_response_ag.name,
-                                                                            best_response)
-                                best_response_ag.notify_contract_assigned(negotiation_item, best_response)
-                                for ag in self._auction_status[negotiation_item]["selected"]:
-                                    if ag != best_response_ag:
-                                        ag.notify_negotiation_lost(negotiation_item)
+                    if self._negotiation_status[negotiation_item]["completed"] or \
+                            self._negotiation_status[negotiation_item]["failed"]:
+                        self.__notify_phase(NEGOTIATION_END, negotiation_item)
+
+                    if self._negotiation_status[negotiation_item]["failed"]:
+                        self.__end_game(successful=False)
             else:
-                self._negotiation_stage = False
-                self._finished = True
-                return
+                self.__end_game(successful=True)
+        else:
+            self._finished = True
+
+    def __simultaneous_step(self):
+        """
+        Step used when `simultaneous_items` is set in the game configuration: every step plays one auction (or
+        negotiation) round for all the construction items that are still open, in parallel.
+        """
+        try:
+            self.__simultaneous_round()
+        except BaseException:
+            # the game cannot go on, do not leave the item threads behind
+            self.__shutdown_executors()
+            raise
+
+    def __simultaneous_round(self):
+        if self._auction_stage:
+            open_items = [item for item in self._construction_items if not self._auction_status[item]["completed"]]
+            self.__run_concurrently(self._auction_item_step, open_items)
+
+            if any(self._auction_status[item]["failed"] for item in open_items):
+                self.__end_game(successful=False)
+
+            elif all(self._auction_status[item]["completed"] for item in self._construction_items):
+                self._auction_stage = False
+                self._negotiation_stage = True
+                logger.info("[NOTIFICATION] The Auction Phase has finished.")
+                self.__notify_phase(AUCTION_END)
+
+        elif self._negotiation_stage:
+            open_items = [item for item in self._construction_items
+                          if not self._negotiation_status[item]["completed"]]
+            self.__run_concurrently(self._negotiation_item_step, open_items)
+
+            for item in open_items:
+                if self._negotiation_status[item]["completed"]:
+                    logger.info("[NOTIFICATION] Construction item %s assigned to %s!"
+                                % (item, self._negotiation_status[item]["winner"]))
+                if self._negotiation_status[item]["completed"] or self._negotiation_status[item]["failed"]:
+                    self.__notify_phase(NEGOTIATION_END, item)
+
+            if any(self._negotiation_status[item]["failed"] for item in open_items):
+                self.__end_game(successful=False)
+
+            elif all(self._negotiation_status[item]["completed"] for item in self._construction_items):
+                self.__end_game(successful=True)
         else:
             self._finished = True
-            return
 
     def goals_completed(self):
         return self._finished
 
+    def game_results(self) -> Dict[str, Any]:
+        """
+        Summarizes the outcome of the game played so far, per construction item
+        :return: dict with the overall success flag, the owner budgets, the feasibility analysis and, for every
+        construction item, the auction round / price, the selected companies, the winner and the final price
+        """
+        items = {}
+        for item in self._construction_items:
+            winner = self._attributed_items.get(item)
+            items[item] = {
+                "auction_round": self._auction_status[item]["round"],
+                "auction_price": self._auction_status[item]["price"],
+                "selected": [self._registry.agent(ag_id).name
+                             for ag_id in self._auction_status[item]["selected"]],
+                "winner": winner.name if winner else None,
+                "winner_cost": winner.specialties.get(item) if winner else None,
+                "price": self._attributed_prices.get(item),
+            }
+
+        return {
+            "successful": self._game_successful,
+            "owner_budget": dict(self._owner_agent.budget_dict) if self._owner_agent else {},
+            "feasibility": self._feasibility,
+            "items": items,
+        }
+
+    def record_negotiations(self, trace: NegotiationTrace, game: str = "") -> None:
+        """
+        Adds every round of every negotiation of the game played so far to a columnar negotiation trace
+        :param trace: the trace to add the rows to
+        :param game: identifier of the game, stored in the `game` column
+        """
+        for item in self._construction_items:
+            trace.add_negotiations(self._negotiation_status[item]["negotiations"], game)
+
     def __str__(self):
         res = "#### House Building Environment ####" + "\n"
         if self._game_status_str:
@@ -328,6 +749,17 @@ class BuildingEnvironment(Environment):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the house building game")
+    parser.add_argument("--llm-log", default="llm_interactions_log.jsonl",
+                        help="file the LLM interactions are saved to (gzip-compressed if it ends with .gz)")
+    parser.add_argument("--llm-log-format", choices=LOG_FORMATS, default="jsonl",
+                        help="'compact' interns the repeated prompt text in a side table")
+    parser.add_argument("--negotiation-trace", default=None,
+                        help="save every negotiation round as typed columns to this .npz file")
+    parser.add_argument("--results-db", default=None, help="add the outcome of the game to this SQLite results store")
+    args = parser.parse_args()
+
+    game_start = time.perf_counter()
     env = BuildingEnvironment(owner_cfg_file="config-ACME-project.cfg",
                              companies_cfg_file="config-companies.cfg",
                              game_cfg_file="game.cfg")
@@ -336,6 +768,7 @@ if __name__ == "__main__":
     while not env.goals_completed():
         env.step()
         print(env) # This existing line prints the environment status
+    game_duration = time.perf_counter() - game_start
 
     # --- Add the following code to process LLM logs ---
     print("\n\n#####################################")
@@ -352,15 +785,33 @@ if __name__ == "__main__":
             print("LLM Response:\n", json.dumps(entry.get('llm_response',{}), indent=2))
 
         # Option 2: Save to a JSONL (JSON Lines) file
-        log_file_name = "llm_interactions_log.jsonl"
+        log_file_name = args.llm_log
         try:
-            with open(log_file_name, "w") as f:
-                for entry in llm_interactions_log:
-                    f.write(json.dumps(entry) + "\n")
+            save_interactions(llm_interactions_log, log_file_name, args.llm_log_format)
             print(f"\nLLM interaction logs also saved to {log_file_name}")
         except IOError as e:
             print(f"Error saving LLM logs to file: {e}")
     else:
         print("No LLM interactions were logged.")
 
+    print("\n--- LLM Token Usage ---")
+    print(token_ledger.report(group_by=("agent", "stage")))
+
+    if args.negotiation_trace:
+        negotiation_trace = NegotiationTrace()
+        env.record_negotiations(negotiation_trace)
+        negotiation_trace.save(args.negotiation_trace)
+        print("\nNegotiation trace (%i messages) saved to %s" % (len(negotiation_trace), args.negotiation_trace))
+
+    if args.results_db:
+        game_cfg = load_config("game.cfg", GAME_CONFIG)
+        owner_strategy, company_strategy = strategies(game_cfg)
+        with ResultsStore(args.results_db) as store:
+            store.add({"owner": owner_strategy, "company": company_strategy,
+                       "config_hash": config_hash(load_config("config-ACME-project.cfg", OWNER_CONFIG),
+                                                  load_config("config-companies.cfg", COMPANIES_CONFIG), game_cfg),
+                       "successful": env.game_results()["successful"], "duration": game_duration,
+                       "results": env.game_results(), "tokens": token_ledger.totals(group_by=()).get(())})
+        print("\nGame results added to %s" % args.results_db)
+
     print("\nSimulation finished.")
\ No newline at end of file
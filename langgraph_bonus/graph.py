@@ -1,8 +1,27 @@
+import sqlite3
+from functools import lru_cache
+from typing import Optional
+
 from langgraph.graph import StateGraph, END
 from .state import NegotiationState # Relative import
 from .nodes import acme_agent_node, company_agent_node, negotiation_manager_node # Relative import
 
-def build_negotiation_graph() -> StateGraph:
+def sqlite_checkpointer(db_path: str):
+    """
+    Checkpointer saving the NegotiationState in a local SQLite file after every node, so that an interrupted run
+    can be resumed from its thread id (requires the langgraph-checkpoint-sqlite package)
+    """
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    # the compiled graph is shared by the scenario worker threads, SqliteSaver serializes the writes itself
+    return SqliteSaver(sqlite3.connect(db_path, check_same_thread=False))
+
+
+def build_negotiation_graph(checkpointer=None) -> StateGraph:
+    """
+    :param checkpointer: optional LangGraph checkpointer (e.g. `sqlite_checkpointer`), runs must then pass a
+    `thread_id` in the `configurable` part of their config
+    """
     graph_builder = StateGraph(NegotiationState)
 
     graph_builder.add_node("acme_turn", acme_agent_node)
@@ -38,6 +57,8 @@ def build_negotiation_graph() -> StateGraph:
     def route_after_processing_results(state: NegotiationState) -> str:
         if state.get("negotiation_complete"):
             return END
+        elif state.get("pause_after_round"): # Long negotiations: the caller invokes the graph again for the next round
+            return END
         else: # Continue to next round, ACME's turn
             return "acme_turn"
 
@@ -47,6 +68,21 @@ def build_negotiation_graph() -> StateGraph:
         {END: END, "acme_turn": "acme_turn"}
     )
     
-    return graph_builder.compile()
+    return graph_builder.compile(checkpointer=checkpointer)
+
+
+@lru_cache(maxsize=None)
+def get_app(checkpoint_db: Optional[str] = None):
+    """
+    Compiled negotiation graph, built on first use and shared by all the callers (compiled graphs can run several
+    scenarios at the same time)
+    :param checkpoint_db: SQLite file where the graph saves its checkpoints, no persistence if None
+    """
+    return build_negotiation_graph(sqlite_checkpointer(checkpoint_db) if checkpoint_db else None)
+
 
-app = build_negotiation_graph()
\ No newline at end of file
+def __getattr__(name: str):
+    # `from .graph import app` keeps working, without compiling the graph at import time
+    if name == "app":
+        return get_app()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -1,5 +1,5 @@
-import json
 import google.generativeai as genai
+from agents.llm_response import decode_response, ResponseDecodeError
 from .config import IS_GEMINI_CONFIGURED 
 
 # --- Global Log for LLM Interactions ---
@@ -46,10 +46,10 @@ def call_gemini_llm_for_langgraph(agent_name: str, system_prompt: str, user_prom
                 raise ValueError(f"LLM call blocked for {agent_name}. Reason: {response.prompt_feedback.block_reason_message or response.prompt_feedback.block_reason}")
             raise ValueError(f"LLM returned empty or unreadable response content for {agent_name}.")
 
-        parsed_json = json.loads(response_text)
-        print(f"LLM Response for {agent_name}:\n{json.dumps(parsed_json, indent=2)}")
+        parsed_json = decode_response(response_text)
+        print(f"LLM Response for {agent_name}: {response_text}")
         log_entry["llm_response"] = parsed_json
-    except json.JSONDecodeError as e:
+    except ResponseDecodeError as e:
         print(f"Error decoding JSON from LLM response for {agent_name}: {e}")
         raw_text_for_error = response_text if 'response_text' in locals() and response_text else "Raw response text not available or empty."
         print(f"LLM raw response text was: {raw_text_for_error}")
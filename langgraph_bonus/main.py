@@ -2,14 +2,14 @@
 import json
 from .config import ITEM_NAME, MAX_NEGOTIATION_ROUNDS, COMPANY_B_COST_STRUCTURAL_DESIGN, COMPANY_F_COST_STRUCTURAL_DESIGN # Relative
 from .state import NegotiationState 
-from .graph import app 
+from .graph import get_app
 from .llm_calls import langgraph_llm_interactions_log 
 
 
 def run_scenario(scenario_name: str, initial_state: NegotiationState):
     print(f"\n\n--- RUNNING SCENARIO: {scenario_name} ---")
     final_state_result = None
-    for s_output in app.stream(initial_state, {"recursion_limit": 25}):
+    for s_output in get_app().stream(initial_state, {"recursion_limit": 25}):
         node_name = list(s_output.keys())[0]
         # print(f"\nOutput from node: {node_name}") # Verbose state printing
         # print(json.dumps(s_output[node_name], indent=2, default=str))
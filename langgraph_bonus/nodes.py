@@ -1,9 +1,23 @@
 import json
 from typing import Dict, Any
 from .state import NegotiationState 
+from agents.llm_response import OWNER_NEGOTIATION, COMPANY_NEGOTIATION
 from .llm_calls import call_gemini_llm_for_langgraph 
 from .config import ACME_BUDGET_STRUCTURAL_DESIGN 
 
+
+def append_history(state: NegotiationState, record: Dict[str, Any]) -> list:
+    """
+    :return: the history of the state with the record, keeping the last `history_window` rounds only (if set) so
+    that the state of long negotiations, and their checkpoints, do not grow with every round
+    """
+    history = state["history"] + [record]
+    window = state.get("history_window")
+    if window:
+        history = [entry for entry in history if entry["round"] > record["round"] - window]
+    return history
+
+
 # Definition of acme_agent_node
 def acme_agent_node(state: NegotiationState) -> Dict[str, Any]:
     print(f"\n--- ACME's Turn (Round {state['negotiation_round']}) ---")
@@ -17,24 +31,8 @@ def acme_agent_node(state: NegotiationState) -> Dict[str, Any]:
         partner_agent_name = company_info["name"]
         auction_agreed_price = company_info["auction_price"]
         
-        your_previous_offer_to_partner = 0.0
-        partner_previous_counter_offer = 0.0
-
-        temp_prev_offer_acme = 0.0
-        for record in reversed(state["history"]): 
-            if record["round"] < current_round:
-                if record["actor"] == acme_name and record["acme_offers"] and partner_agent_name in record["acme_offers"]:
-                    temp_prev_offer_acme = record["acme_offers"][partner_agent_name]
-                    break 
-        your_previous_offer_to_partner = temp_prev_offer_acme
-
-        temp_prev_counter_partner = 0.0
-        for record in reversed(state["history"]): 
-            if record["round"] < current_round:
-                if record["actor"] == partner_agent_name and record["company_response_to_acme"] is not None:
-                    temp_prev_counter_partner = record["company_response_to_acme"]
-                    break 
-        partner_previous_counter_offer = temp_prev_counter_partner
+        your_previous_offer_to_partner = state.get("previous_acme_offers", {}).get(partner_agent_name, 0.0)
+        partner_previous_counter_offer = state.get("previous_company_counters", {}).get(partner_agent_name, 0.0)
         
         if current_round == 0: 
             your_previous_offer_to_partner = 0.0
@@ -73,9 +71,8 @@ Output JSON: {{"reasoning": "...", "negotiation_offer": <float>}}
 
         llm_response = call_gemini_llm_for_langgraph(f"{acme_name}_negotiating_with_{partner_agent_name}", system_prompt, user_prompt)
         
-        offer = auction_agreed_price 
-        if "error" not in llm_response and "negotiation_offer" in llm_response and isinstance(llm_response["negotiation_offer"],(int,float)):
-            offer = float(llm_response["negotiation_offer"])
+        offer = OWNER_NEGOTIATION.decision(llm_response)
+        if offer is None: offer = auction_agreed_price
         
         if current_round > 0 and offer < your_previous_offer_to_partner: offer = your_previous_offer_to_partner
         if current_round == 0 and (offer <= 0 or offer > auction_agreed_price * 0.95): offer = auction_agreed_price * 0.7 
@@ -86,10 +83,10 @@ Output JSON: {{"reasoning": "...", "negotiation_offer": <float>}}
         new_acme_offers_this_round[partner_agent_name] = offer
         round_history_entry_offers[partner_agent_name] = offer
 
-    updated_history = state["history"] + [{
+    updated_history = append_history(state, {
         "round": current_round, "actor": acme_name, "acme_offers": round_history_entry_offers,
         "company_name": None, "company_response_to_acme": None, "acme_offer_received": None
-    }]
+    })
     
     return {
         "acme_current_offers_for_round": new_acme_offers_this_round,
@@ -116,14 +113,8 @@ def company_agent_node(state: NegotiationState) -> Dict[str, Any]:
     current_round = state["negotiation_round"]
     item_name = state["current_item"]
     
-    previous_counter_offer_by_company = company_info["auction_price"] 
-    temp_prev_counter = company_info["auction_price"] 
-    for record in reversed(state["history"]):
-        if record["round"] < current_round:
-            if record["actor"] == company_name_to_act and record["company_response_to_acme"] is not None:
-                temp_prev_counter = record["company_response_to_acme"]
-                break
-    previous_counter_offer_by_company = temp_prev_counter
+    previous_counter_offer_by_company = state.get("previous_company_counters", {}).get(
+        company_name_to_act, company_info["auction_price"])
     
     if current_round == 0: 
         previous_counter_offer_by_company = company_info["auction_price"]
@@ -165,9 +156,8 @@ Output JSON: {{"reasoning": "...", "counter_offer": <float>}}
 
     llm_response = call_gemini_llm_for_langgraph(company_name_to_act, system_prompt, user_prompt)
 
-    counter_offer = previous_counter_offer_by_company 
-    if "error" not in llm_response and "counter_offer" in llm_response and isinstance(llm_response["counter_offer"],(int,float)):
-        counter_offer = float(llm_response["counter_offer"])
+    counter_offer = COMPANY_NEGOTIATION.decision(llm_response)
+    if counter_offer is None: counter_offer = previous_counter_offer_by_company
 
     if counter_offer < company_info['cost']: counter_offer = company_info['cost']
     if (current_round > 0 and counter_offer > previous_counter_offer_by_company) or \
@@ -177,11 +167,11 @@ Output JSON: {{"reasoning": "...", "counter_offer": <float>}}
     updated_company_responses = state.get("company_current_responses_for_round", {}).copy() 
     updated_company_responses[company_name_to_act] = counter_offer
     
-    updated_history = state["history"] + [{
+    updated_history = append_history(state, {
         "round": current_round, "actor": company_name_to_act, "acme_offers": None,
         "company_name": company_name_to_act, "company_response_to_acme": counter_offer, 
         "acme_offer_received": acme_offer_to_this_company
-    }]
+    })
     
     updated_companies_acted = state["companies_acted_this_round"] + [company_name_to_act]
     
@@ -210,7 +200,8 @@ def negotiation_manager_node(state: NegotiationState) -> Dict[str, Any]:
     potential_agreements = [] 
     acme_offers_k = state["acme_current_offers_for_round"]
     company_responses_k = state["company_current_responses_for_round"]
-    acme_name = state["acme_agent_name"]
+    previous_acme_offers = state.get("previous_acme_offers", {})
+    previous_company_counters = state.get("previous_company_counters", {})
 
     for company_info in state["active_companies"]:
         comp_name = company_info["name"]
@@ -221,13 +212,7 @@ def negotiation_manager_node(state: NegotiationState) -> Dict[str, Any]:
             print(f"Note: Missing offer/response for {comp_name} in round {current_round}. Skipping agreement check for this pair this round.")
             continue
 
-        p_k_minus_1_c = None
-        if current_round > 0:
-            for record in reversed(state["history"]):
-                 if record["round"] < current_round: 
-                    if record["actor"] == comp_name and record["company_response_to_acme"] is not None:
-                        p_k_minus_1_c = record["company_response_to_acme"]
-                        break
+        p_k_minus_1_c = previous_company_counters.get(comp_name) if current_round > 0 else None
         
         if p_kc <= i_kc: 
             potential_agreements.append({"company": comp_name, "price": p_kc, "reason": f"Company accepted ACME's offer of {i_kc:.2f}"})
@@ -236,24 +221,14 @@ def negotiation_manager_node(state: NegotiationState) -> Dict[str, Any]:
             potential_agreements.append({"company": comp_name, "price": i_kc, "reason": f"ACME accepted company's previous counter of {p_k_minus_1_c:.2f} with new offer {i_kc:.2f}"})
             print(f"Potential Agreement (A accepts C_prev): ACME accepts {i_kc:.2f} (Company prev countered {p_k_minus_1_c:.2f})")
         
-        i_k_minus_1_c = 0.0
         if current_round > 0:
-            for record in reversed(state["history"]):
-                if record["round"] < current_round and record["actor"] == acme_name and record["acme_offers"] and comp_name in record["acme_offers"]:
-                    i_k_minus_1_c = record["acme_offers"][comp_name]
-                    break
+            i_k_minus_1_c = previous_acme_offers.get(comp_name, 0.0)
             if i_kc < i_k_minus_1_c:
                  print(f"MONOTONICITY WARNING (ACME): For {comp_name}, offer {i_kc:.2f} < previous {i_k_minus_1_c:.2f}")
 
-        p_k_minus_1_c_for_comp_check = company_info["auction_price"] 
         if current_round > 0: 
-            found_prev_counter = False
-            for record in reversed(state["history"]):
-                if record["round"] < current_round and record["actor"] == comp_name and record["company_response_to_acme"] is not None:
-                    p_k_minus_1_c_for_comp_check = record["company_response_to_acme"]
-                    found_prev_counter = True
-                    break
-            if found_prev_counter and p_kc > p_k_minus_1_c_for_comp_check:
+            p_k_minus_1_c_for_comp_check = previous_company_counters.get(comp_name)
+            if p_k_minus_1_c_for_comp_check is not None and p_kc > p_k_minus_1_c_for_comp_check:
                  print(f"MONOTONICITY WARNING ({comp_name}): Counter {p_kc:.2f} > previous {p_k_minus_1_c_for_comp_check:.2f}")
         elif current_round == 0 and p_kc > company_info["auction_price"]: 
             print(f"MONOTONICITY WARNING ({comp_name}): First counter {p_kc:.2f} > auction price {company_info['auction_price']:.2f}")
@@ -276,6 +251,9 @@ def negotiation_manager_node(state: NegotiationState) -> Dict[str, Any]:
     print(f"No agreement in round {current_round}. Proceeding to round {current_round + 1}.")
     return {
         "negotiation_round": current_round + 1,
+        # latest offers of every pair, including those of the rounds a pair did not act in
+        "previous_acme_offers": {**previous_acme_offers, **acme_offers_k},
+        "previous_company_counters": {**previous_company_counters, **company_responses_k},
         "acme_current_offers_for_round": {}, 
         "company_current_responses_for_round": {}, 
         "companies_acted_this_round": [],
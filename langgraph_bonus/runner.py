@@ -0,0 +1,175 @@
+"""
+Runs the LangGraph negotiation scenarios of a YAML file concurrently.
+
+The negotiation graph is compiled once (`get_app`) and shared by all the scenarios, each one running in its own
+worker thread with its own state, so scenarios waiting on LLM calls overlap instead of running one after the other.
+
+    python -m langgraph_bonus.runner --scenarios langgraph_bonus/scenarios.yaml --workers 8
+
+A summary table with the outcome of every scenario is printed at the end, and the LLM interactions are saved like
+in `langgraph_bonus/main.py`.
+
+With `--checkpoint-db FILE`, the state of every scenario is saved in a SQLite file after each graph node, under the
+thread id of the scenario (its `thread_id`, or its name). Running the same command again resumes the unfinished
+scenarios from their last checkpoint and reports the finished ones without running them, so an interrupted run does
+not pay the LLM calls it already made:
+
+    python -m langgraph_bonus.runner --workers 8 --checkpoint-db langgraph_checkpoints.sqlite
+
+Scenarios with `long_horizon: true` (hundreds or thousands of rounds) keep only the last `history_window` rounds in
+their state, and the graph stops after every round: the runner invokes it once per round, so that the recursion
+limit and the checkpoints of a round do not depend on the number of rounds, and an interrupted scenario resumes from
+its last round.
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+from .config import ITEM_NAME, MAX_NEGOTIATION_ROUNDS
+from .state import NegotiationState
+from .graph import get_app
+from .llm_calls import langgraph_llm_interactions_log
+
+DEFAULT_SCENARIOS = "langgraph_bonus/scenarios.yaml"
+DEFAULT_LOG_FILE = "langgraph_bonus_llm_interactions.jsonl"
+
+# Graph steps left on top of the expected ones before LangGraph stops a scenario
+RECURSION_MARGIN = 5
+
+# rounds kept in the history of long-horizon scenarios without a `history_window`
+LONG_HORIZON_HISTORY_WINDOW = 2
+
+
+def load_scenarios(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        scenarios = yaml.safe_load(f)["scenarios"]
+
+    for scenario in scenarios:
+        if not scenario.get("name") or not scenario.get("companies"):
+            raise ValueError("Every scenario needs a name and at least one company: %s" % scenario)
+    return scenarios
+
+
+def initial_state(scenario: Dict[str, Any]) -> NegotiationState:
+    return {
+        "current_item": scenario.get("item", ITEM_NAME),
+        "negotiation_round": 0,
+        "max_negotiation_rounds": scenario.get("max_negotiation_rounds", MAX_NEGOTIATION_ROUNDS),
+        "acme_agent_name": scenario.get("acme_agent_name", "ACME_" + scenario["name"]),
+        "active_companies": [dict(company) for company in scenario["companies"]],
+        "acme_current_offers_for_round": {}, "company_current_responses_for_round": {}, "history": [],
+        "negotiation_complete": False, "final_agreement_price": None, "winning_company": None,
+        "next_actor_in_round": None, "companies_acted_this_round": [],
+        "previous_acme_offers": {}, "previous_company_counters": {},
+        "history_window": scenario.get("history_window",
+                                       LONG_HORIZON_HISTORY_WINDOW if scenario.get("long_horizon") else None),
+        "pause_after_round": bool(scenario.get("long_horizon", False))
+    }
+
+
+def recursion_limit(state: NegotiationState) -> int:
+    """
+    Every round runs the ACME node, one node per company and the negotiation manager; graphs pausing after every
+    round run one round per invocation
+    """
+    rounds = 1 if state.get("pause_after_round") else state["max_negotiation_rounds"]
+    return rounds * (len(state["active_companies"]) + 2) + RECURSION_MARGIN
+
+
+def thread_id(scenario: Dict[str, Any]) -> str:
+    return str(scenario.get("thread_id", scenario["name"]))
+
+
+def run_scenario(scenario: Dict[str, Any], checkpoint_db: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Runs one scenario to the end
+    :param checkpoint_db: SQLite checkpoint file, the scenario resumes from its last checkpoint if there is one
+    :return: the outcome of the scenario, with the error message if the graph failed
+    """
+    app = get_app(checkpoint_db)
+    state = initial_state(scenario)
+    config = {"recursion_limit": recursion_limit(state)}
+    result = {"name": scenario["name"], "complete": False, "winner": None, "price": None, "rounds": None,
+              "duration": 0.0, "error": None, "resumed": False}
+
+    start = time.perf_counter()
+    try:
+        graph_input, final_state = state, None
+        if checkpoint_db:
+            config["configurable"] = {"thread_id": thread_id(scenario)}
+            saved = app.get_state(config)
+            if saved.values:
+                result["resumed"] = True
+                if saved.next:
+                    # None as input continues from the checkpoint, inside the round it stopped in
+                    graph_input = None
+                else:
+                    # finished scenario (not run again), or long-horizon scenario paused between two rounds
+                    final_state = saved.values
+        if final_state is None:
+            final_state = app.invoke(graph_input, config)
+        while final_state.get("pause_after_round") and not final_state.get("negotiation_complete"):
+            final_state = app.invoke(final_state, config)
+    except Exception as e:
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+    else:
+        result.update(complete=final_state.get("negotiation_complete", False),
+                      winner=final_state.get("winning_company"),
+                      price=final_state.get("final_agreement_price"),
+                      rounds=final_state.get("negotiation_round"))
+    result["duration"] = time.perf_counter() - start
+    return result
+
+
+def run_scenarios(scenarios: List[Dict[str, Any]], workers: int,
+                  checkpoint_db: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    :return: the outcomes of the scenarios, in the order of `scenarios`
+    """
+    thread_ids = [thread_id(scenario) for scenario in scenarios]
+    if checkpoint_db and len(set(thread_ids)) != len(thread_ids):
+        raise ValueError("Scenarios sharing a checkpoint file need distinct thread ids")
+
+    # compile the graph before the workers start, rather than in the first one that needs it
+    get_app(checkpoint_db)
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="scenario") as executor:
+        return list(executor.map(lambda scenario: run_scenario(scenario, checkpoint_db), scenarios))
+
+
+def summary_table(results: List[Dict[str, Any]]) -> List[str]:
+    lines = ["%-35s %9s %8s %-20s %10s %7s %9s  %s" % ("scenario", "complete", "resumed", "winner", "price",
+                                                       "rounds", "time (s)", "error")]
+    for result in results:
+        lines.append("%-35s %9s %8s %-20s %10s %7s %9.2f  %s" % (
+            result["name"], result["complete"], result["resumed"], result["winner"] or "-",
+            "%.2f" % result["price"] if result["price"] is not None else "-",
+            result["rounds"] if result["rounds"] is not None else "-",
+            result["duration"], result["error"] or ""))
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run LangGraph negotiation scenarios concurrently")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help="YAML file with the scenarios")
+    parser.add_argument("--workers", type=int, default=4, help="number of scenarios running at the same time")
+    parser.add_argument("--llm-log", default=DEFAULT_LOG_FILE, help="file receiving the LLM interactions")
+    parser.add_argument("--checkpoint-db", default=None,
+                        help="SQLite file with the scenario checkpoints, unfinished scenarios resume from it")
+    args = parser.parse_args()
+
+    scenario_list = load_scenarios(args.scenarios)
+    start_time = time.perf_counter()
+    scenario_results = run_scenarios(scenario_list, args.workers, args.checkpoint_db)
+
+    print("\n--- %i scenarios in %.2fs ---" % (len(scenario_results), time.perf_counter() - start_time))
+    print("\n".join(summary_table(scenario_results)))
+
+    if langgraph_llm_interactions_log:
+        with open(args.llm_log, "w") as f:
+            for entry in list(langgraph_llm_interactions_log):
+                f.write(json.dumps(entry) + "\n")
+        print("LangGraph LLM interaction logs saved to %s" % args.llm_log)
@@ -21,4 +21,10 @@ class NegotiationState(TypedDict):
     final_agreement_price: Optional[float]
     winning_company: Optional[str]
     next_actor_in_round: Optional[str] 
-    companies_acted_this_round: List[str]
\ No newline at end of file
+    companies_acted_this_round: List[str]
+    # latest offer / counter-offer of every pair in the previous rounds, so that nodes do not scan the history
+    previous_acme_offers: Dict[str, float]
+    previous_company_counters: Dict[str, float]
+    # rounds kept in history (None: all), and whether the graph stops after every round (long negotiations)
+    history_window: Optional[int]
+    pause_after_round: bool
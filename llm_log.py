@@ -0,0 +1,334 @@
+"""
+Compact storage format for the LLM interaction logs.
+
+A plain log (`llm_interactions_log.jsonl`) stores the full system and user prompt in every record, although most
+of the prompt text repeats from one round to the next. The compact format interns the prompts by content hash:
+
+  - `<log>.jsonl` holds one record per LLM interaction, where `system_prompt` / `user_prompt` are replaced by
+    `system_prompt_ref` / `user_prompt_ref` hashes. All the other fields are stored as they are.
+  - `<log>.prompts.jsonl` is the side table. A prompt is stored once, as the list of hashes of its lines, and every
+    distinct line of text is stored once as well, under a sequential id. Prompts that only differ in a few numbers
+    therefore share all their other lines.
+
+Both files are gzip-compressed when the log name ends with .gz, which mostly shrinks the free-form `reasoning`
+text of the LLM responses. Most of the size reduction comes from gzip: the log of the repository game takes 113 KB
+in the plain format, 72 KB in the compact format and 12 KB compact and gzip-compressed. Batch runs should therefore
+write `.gz` logs, as the tournament workers do (`tournament.py --llm-log-dir`).
+
+Usage:
+    python llm_log.py compact llm_interactions_log.jsonl compact_log.jsonl
+    python llm_log.py compact llm_interactions_log.jsonl compact_log.jsonl.gz
+    python llm_log.py expand compact_log.jsonl restored_log.jsonl
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Pattern, Tuple
+
+PROMPT_FIELDS = ("system_prompt", "user_prompt")
+REF_SUFFIX = "_ref"
+
+# kinds of entries in the side table
+LINE_ENTRY = "l"
+PROMPT_ENTRY = "p"
+
+LOG_FORMATS = ("jsonl", "compact")
+
+GZIP_SUFFIX = ".gz"
+
+# prompts kept in memory by a PromptIndex, for the records that reference them again
+PROMPT_CACHE_SIZE = 256
+
+# side table entries inserted at a time into a PromptIndex
+INDEX_BATCH_SIZE = 10000
+
+PROMPT_INDEX_SCHEMA = """
+CREATE TABLE lines (id INTEGER PRIMARY KEY, text TEXT NOT NULL);
+CREATE TABLE prompt_lines (
+    ref TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    line_id INTEGER NOT NULL,
+    PRIMARY KEY (ref, position)
+) WITHOUT ROWID;
+CREATE TABLE line_matches (id INTEGER PRIMARY KEY, match TEXT NOT NULL);
+"""
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def prompt_table_path(log_path: str) -> str:
+    """
+    :return: the path of the side table holding the interned prompts of a compact log
+    """
+    if log_path.endswith(GZIP_SUFFIX):
+        return prompt_table_path(log_path[:-len(GZIP_SUFFIX)]) + GZIP_SUFFIX
+
+    root, _ = os.path.splitext(log_path)
+    return root + ".prompts.jsonl"
+
+
+def _open_log(path: str, mode: str):
+    """
+    Opens a log file in text mode, gzip-compressed if its name ends with .gz
+    """
+    if path.endswith(GZIP_SUFFIX):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class CompactLogWriter(object):
+    """
+    Writes LLM interaction records in the compact format. Only prompt text that was not written before (by this
+    writer or, when appending, by a previous one) goes to the side table.
+    """
+
+    def __init__(self, log_path: str, append: bool = False):
+        self.log_path = log_path
+        self.table_path = prompt_table_path(log_path)
+        self._prompt_refs = set()
+        self._line_ids: Dict[str, int] = {}
+
+        if append and os.path.exists(self.table_path):
+            with _open_log(self.table_path, "r") as f:
+                for raw in f:
+                    entry = json.loads(raw)
+                    if entry["k"] == LINE_ENTRY:
+                        self._line_ids[entry["t"]] = entry["i"]
+                    else:
+                        self._prompt_refs.add(entry["h"])
+
+        mode = "a" if append else "w"
+        self._log_file = _open_log(self.log_path, mode)
+        self._table_file = _open_log(self.table_path, mode)
+
+    def _intern_line(self, text: str) -> int:
+        line_id = self._line_ids.get(text)
+        if line_id is None:
+            line_id = len(self._line_ids)
+            self._line_ids[text] = line_id
+            self._table_file.write(json.dumps({"k": LINE_ENTRY, "i": line_id, "t": text}) + "\n")
+        return line_id
+
+    def intern_prompt(self, text: str) -> str:
+        """
+        Adds a prompt to the side table, if not already there
+        :return: the reference of the prompt
+        """
+        ref = text_hash(text)
+        if ref not in self._prompt_refs:
+            line_ids = [self._intern_line(line) for line in text.split("\n")]
+            self._prompt_refs.add(ref)
+            self._table_file.write(json.dumps({"k": PROMPT_ENTRY, "h": ref, "l": line_ids}) + "\n")
+        return ref
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        record = {}
+        for key, value in entry.items():
+            if key in PROMPT_FIELDS and isinstance(value, str):
+                record[key + REF_SUFFIX] = self.intern_prompt(value)
+            else:
+                record[key] = value
+
+        self._log_file.write(json.dumps(record) + "\n")
+
+    def flush(self) -> None:
+        # the side table goes first, so that a record never references a prompt missing from the file
+        if self.log_path.endswith(GZIP_SUFFIX):
+            # a gzip stream can only be read back once it is closed: end the current gzip member of both files
+            # and continue in a new one
+            self.close()
+            self._table_file = _open_log(self.table_path, "a")
+            self._log_file = _open_log(self.log_path, "a")
+        else:
+            self._table_file.flush()
+            self._log_file.flush()
+
+    def close(self) -> None:
+        self._table_file.close()
+        self._log_file.close()
+
+    def __enter__(self) -> "CompactLogWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class PromptIndex(object):
+    """
+    On-disk SQLite copy of the side table of a compact log, built in one pass over the table. Prompts are then
+    rebuilt, or searched line by line, with indexed lookups, so that memory stays constant whatever the size of the
+    log. The index is a temporary file, removed by `close`.
+    """
+
+    def __init__(self, table_path: str):
+        fd, self.index_path = tempfile.mkstemp(prefix="prompts-", suffix=".sqlite")
+        os.close(fd)
+        self.conn = sqlite3.connect(self.index_path)
+        self.conn.executescript(PROMPT_INDEX_SCHEMA)
+        # the last prompts rebuilt, which the next records mostly reference again
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+
+        lines, prompt_lines = [], []
+        with _open_log(table_path, "r") as f:
+            for raw in f:
+                entry = json.loads(raw)
+                if entry["k"] == LINE_ENTRY:
+                    lines.append((entry["i"], entry["t"]))
+                else:
+                    prompt_lines.extend((entry["h"], position, line_id) for position, line_id in enumerate(entry["l"]))
+                if len(lines) + len(prompt_lines) >= INDEX_BATCH_SIZE:
+                    self.__insert(lines, prompt_lines)
+                    lines, prompt_lines = [], []
+        self.__insert(lines, prompt_lines)
+        self.conn.commit()
+
+    def __insert(self, lines: List[Tuple[int, str]], prompt_lines: List[Tuple[str, int, int]]) -> None:
+        self.conn.executemany("INSERT OR IGNORE INTO lines (id, text) VALUES (?, ?)", lines)
+        self.conn.executemany("INSERT OR IGNORE INTO prompt_lines (ref, position, line_id) VALUES (?, ?, ?)",
+                              prompt_lines)
+
+    def prompt(self, ref: str) -> str:
+        """
+        :return: the full text of a prompt
+        """
+        text = self._cache.get(ref)
+        if text is not None:
+            self._cache.move_to_end(ref)
+            return text
+
+        rows = self.conn.execute("SELECT l.text FROM prompt_lines p JOIN lines l ON l.id = p.line_id "
+                                 "WHERE p.ref = ? ORDER BY p.position", (ref,)).fetchall()
+        if not rows:
+            raise KeyError(ref)
+        text = self._cache[ref] = "\n".join(row[0] for row in rows)
+        if len(self._cache) > PROMPT_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return text
+
+    def rebuild(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        :return: the record of a compact log with its full prompts, identical to the record of the plain format
+        """
+        entry = {}
+        for key, value in record.items():
+            field = _prompt_field(key)
+            if field:
+                entry[field] = self.prompt(value)
+            else:
+                entry[key] = value
+        return entry
+
+    def match_lines(self, pattern: Pattern) -> None:
+        """
+        Searches the distinct prompt lines, without rebuilding the prompts, for the lookups of `matched_group`
+        :param pattern: regular expression with one group
+        """
+        self.conn.execute("DELETE FROM line_matches")
+        matches = []
+        for line_id, text in self.conn.cursor().execute("SELECT id, text FROM lines"):
+            match = pattern.search(text)
+            if match:
+                matches.append((line_id, match.group(1)))
+            if len(matches) >= INDEX_BATCH_SIZE:
+                self.conn.executemany("INSERT INTO line_matches (id, match) VALUES (?, ?)", matches)
+                matches = []
+        self.conn.executemany("INSERT INTO line_matches (id, match) VALUES (?, ?)", matches)
+        self.conn.commit()
+
+    def matched_group(self, ref: str) -> Optional[str]:
+        """
+        :return: the group of the first line of a prompt that matched the pattern of `match_lines`, None if none did
+        """
+        row = self.conn.execute("SELECT m.match FROM prompt_lines p JOIN line_matches m ON m.id = p.line_id "
+                                "WHERE p.ref = ? ORDER BY p.position LIMIT 1", (ref,)).fetchone()
+        return row[0] if row else None
+
+    def close(self) -> None:
+        self.conn.close()
+        os.remove(self.index_path)
+
+    def __enter__(self) -> "PromptIndex":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def _prompt_field(key: str) -> Optional[str]:
+    """
+    :return: the prompt field referenced by a key of a compact record, None if the key is not a reference
+    """
+    if key.endswith(REF_SUFFIX) and key[:-len(REF_SUFFIX)] in PROMPT_FIELDS:
+        return key[:-len(REF_SUFFIX)]
+    return None
+
+
+def read_log(log_path: str, rebuild_prompts: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Streams the records of an interaction log, in either format. Records of a compact log are rebuilt with their
+    full prompts, so that they are identical to the records of the plain format. Their prompts are looked up in a
+    `PromptIndex`, built in one pass over the side table, so that the whole table is never in memory.
+    :param rebuild_prompts: if False, the records of a compact log keep their `system_prompt_ref` / `user_prompt_ref`
+    references (see `PromptIndex`)
+    """
+    prompt_index = None
+    try:
+        with _open_log(log_path, "r") as f:
+            for raw in f:
+                record = json.loads(raw)
+                if rebuild_prompts and any(_prompt_field(key) for key in record):
+                    if prompt_index is None:
+                        prompt_index = PromptIndex(prompt_table_path(log_path))
+                    record = prompt_index.rebuild(record)
+                yield record
+    finally:
+        if prompt_index is not None:
+            prompt_index.close()
+
+
+def save_interactions(entries: Iterable[Dict[str, Any]], log_path: str, log_format: str = "jsonl") -> None:
+    """
+    Saves a list of LLM interaction records, e.g. `llm_interactions_log`, in the given format
+    :param entries: the interaction records
+    :param log_path: the path of the log file
+    :param log_format: "jsonl" for the plain format, "compact" for the interned one
+    """
+    if log_format == "compact":
+        with CompactLogWriter(log_path) as writer:
+            for entry in entries:
+                writer.write(entry)
+    elif log_format == "jsonl":
+        with _open_log(log_path, "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+    else:
+        raise ValueError("Unknown log format '%s', expected one of %s" % (log_format, LOG_FORMATS))
+
+
+def _file_size(paths: List[str]) -> int:
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert LLM interaction logs between the plain and compact formats")
+    parser.add_argument("command", choices=["compact", "expand"])
+    parser.add_argument("source", help="log to convert")
+    parser.add_argument("destination", help="converted log")
+    args = parser.parse_args()
+
+    target_format = "compact" if args.command == "compact" else "jsonl"
+    save_interactions(read_log(args.source), args.destination, target_format)
+
+    source_files = [args.source, prompt_table_path(args.source)] if args.command == "expand" else [args.source]
+    destination_files = [args.destination, prompt_table_path(args.destination)] \
+        if args.command == "compact" else [args.destination]
+    print("%s (%i bytes) -> %s (%i bytes)" % (args.source, _file_size(source_files), args.destination,
+                                              _file_size(destination_files)))
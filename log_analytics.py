@@ -0,0 +1,390 @@
+"""
+Indexed analytics over LLM interaction logs.
+
+The logs are streamed once into an on-disk SQLite index, holding one row per LLM interaction with its agent, stage,
+item, negotiation partner, round and the decision value taken from the LLM response. The aggregate queries then run
+on the index in SQLite, so neither indexing nor querying has to hold the logs in memory. Indexing is incremental:
+files that did not change are skipped, and plain logs that grew are indexed from where the last run stopped.
+
+Both the plain (`.jsonl`) and the compact (see llm_log.py) log formats are supported.
+
+Usage:
+    python log_analytics.py index llm_interactions_log.jsonl runs/*.jsonl.gz
+    python log_analytics.py avg --field counter_offer --by agent,round
+    python log_analytics.py violations --agent MyACMEAgent_ACME
+    python log_analytics.py fallbacks
+    python log_analytics.py show --agent MyCompanyAgent_B --stage Negotiation --limit 5
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from agents.llm_response import DECISION_FIELDS, RESPONSE_SCHEMAS
+from agents.surrogate_policy import role_kind
+from llm_log import read_log, PromptIndex, prompt_table_path, GZIP_SUFFIX
+
+DEFAULT_INDEX = "llm_logs.idx.sqlite"
+
+INSERT_BATCH_SIZE = 10000
+
+# dimensions that the interactions can be grouped and filtered by
+DIMENSIONS = ("file", "game", "agent", "role", "stage", "item", "partner", "round", "episode", "field")
+
+PARTNER_PATTERN = re.compile(r"Negotiation Status \(.+ with (.+)\):")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    indexed_bytes INTEGER NOT NULL,
+    lines INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS interactions (
+    file_id INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    offset INTEGER,
+    game TEXT,
+    agent TEXT,
+    role TEXT,
+    stage TEXT,
+    item TEXT,
+    partner TEXT,
+    round INTEGER,
+    episode INTEGER NOT NULL,
+    field TEXT,
+    value REAL,
+    error INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_dims ON interactions (agent, stage, item, round);
+CREATE INDEX IF NOT EXISTS idx_interactions_sequence
+    ON interactions (file_id, agent, stage, item, partner, episode, round);
+"""
+
+
+def _is_plain_log(path: str) -> bool:
+    return not path.endswith(GZIP_SUFFIX) and not os.path.exists(prompt_table_path(path))
+
+
+def _read_records(path: str, start_offset: int, start_line: int) -> Iterator[Tuple[int, Optional[int], int, Dict]]:
+    """
+    Streams (line number, byte offset, end offset, record) tuples of a log. Byte offsets are only known for plain
+    logs, which are also the only ones that can be resumed from an offset. A last line that is still being written
+    (no line break yet) is left for the next run. Records of compact logs keep their prompt references.
+    """
+    if _is_plain_log(path):
+        with open(path, "rb") as f:
+            f.seek(start_offset)
+            offset, line = start_offset, start_line
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                if raw.strip():
+                    yield line, offset, offset + len(raw), json.loads(raw)
+                offset += len(raw)
+                line += 1
+    else:
+        for line, record in enumerate(read_log(path, rebuild_prompts=False)):
+            yield line, None, 0, record
+
+
+def _decision(record: Dict[str, Any]) -> Tuple[Optional[str], Optional[float], bool]:
+    """
+    Reads the decision of an interaction with the response schema the agents use for its (role, stage), so that
+    the responses counted as errors are exactly those where the agent used its fallback
+    :return: the decision field, its numeric value and whether the response is an error
+    """
+    schema = RESPONSE_SCHEMAS.get((role_kind(record.get("agent_role")), record.get("interaction_stage")))
+    if schema is None:
+        return None, None, True
+
+    decision = schema.decision(record.get("llm_response") or {})
+    if decision is None:
+        return schema.field, None, True
+    return schema.field, float(decision), False
+
+
+class LogIndex(object):
+    """
+    On-disk index of LLM interaction logs
+    """
+
+    def __init__(self, index_path: str = DEFAULT_INDEX):
+        self.index_path = index_path
+        self.conn = sqlite3.connect(index_path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def index_file(self, path: str) -> int:
+        """
+        Adds a log to the index, or brings its entry up to date
+        :return: the number of newly indexed records
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self.conn.execute("SELECT id, size, mtime, indexed_bytes, lines FROM files WHERE path = ?",
+                                (path,)).fetchone()
+
+        start_offset, start_line = 0, 0
+        if row:
+            file_id, size, mtime, indexed_bytes, lines = row
+            if size == stat.st_size and mtime == stat.st_mtime:
+                return 0
+
+            if _is_plain_log(path) and stat.st_size > indexed_bytes:
+                # append-only log that grew: continue after what was already indexed
+                start_offset, start_line = indexed_bytes, lines
+            else:
+                self.conn.execute("DELETE FROM interactions WHERE file_id = ?", (file_id,))
+        else:
+            file_id = self.conn.execute("INSERT INTO files (path, size, mtime, indexed_bytes, lines) "
+                                        "VALUES (?, 0, 0, 0, 0)", (path,)).lastrowid
+
+        # the episode of an (agent, stage, item, partner) sequence changes when its round number goes back (a new
+        # game in the same log) or when the record names another game; the key space is bounded by the roster size
+        sequence_state: Dict[Tuple, Tuple[int, int, Any]] = {}
+        if start_line:
+            for row in self.conn.execute("SELECT agent, stage, item, partner, episode, round, game "
+                                         "FROM interactions WHERE file_id = ? ORDER BY line", (file_id,)):
+                sequence_state[row[:4]] = row[4:]
+
+        # the partner is the only part of the prompts the index needs: in compact logs, it is looked up in an index of
+        # the side table, searched once per distinct prompt line instead of rebuilding every prompt
+        table_path = prompt_table_path(path)
+        prompt_index = PromptIndex(table_path) if os.path.exists(table_path) else None
+
+        batch = []
+        new_records = 0
+        indexed_bytes, next_line = start_offset, start_line
+        try:
+            if prompt_index is not None:
+                prompt_index.match_lines(PARTNER_PATTERN)
+            for line, offset, end_offset, record in _read_records(path, start_offset, start_line):
+                indexed_bytes, next_line = end_offset, line + 1
+                if record.get("surrogate") or record.get("speculative"):
+                    # decided by the surrogate policy, not by the LLM, or prepared for a round that may never be
+                    # played: logged ahead of the actual decision of that round, it would start a new episode
+                    continue
+
+                partner = None
+                if record.get("agent_role") == "ACME":
+                    if prompt_index is None:
+                        match = PARTNER_PATTERN.search(record.get("user_prompt") or "")
+                        partner = match.group(1) if match else None
+                    else:
+                        partner = prompt_index.matched_group(record.get("user_prompt_ref"))
+
+                round_num = record.get("round_num")
+                key = (record.get("agent_name"), record.get("interaction_stage"), record.get("item_name"), partner)
+                episode, last_round, last_game = sequence_state.get(key, (0, None, None))
+                game = record.get("game")
+                if last_round is not None and (round_num is None or round_num <= last_round or game != last_game):
+                    episode += 1
+                sequence_state[key] = (episode, round_num if round_num is not None else -1, game)
+
+                field, value, error = _decision(record)
+                batch.append((file_id, line, offset, game, key[0], record.get("agent_role"), key[1], key[2], partner,
+                              round_num, episode, field, value, int(error)))
+
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    self.__insert(batch)
+                    new_records += len(batch)
+                    batch = []
+        finally:
+            if prompt_index is not None:
+                prompt_index.close()
+
+        self.__insert(batch)
+        new_records += len(batch)
+
+        self.conn.execute("UPDATE files SET size = ?, mtime = ?, indexed_bytes = ?, lines = ? WHERE id = ?",
+                          (stat.st_size, stat.st_mtime, indexed_bytes, next_line, file_id))
+        self.conn.commit()
+        return new_records
+
+    def __insert(self, rows: List[Tuple]) -> None:
+        self.conn.executemany("INSERT INTO interactions (file_id, line, offset, game, agent, role, stage, item, "
+                              "partner, round, episode, field, value, error) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    @staticmethod
+    def __where(filters: Dict[str, Any], alias: str = "i") -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        for dim, value in filters.items():
+            if value is None:
+                continue
+            if dim == "file":
+                clauses.append("%s.file_id IN (SELECT id FROM files WHERE path LIKE ?)" % alias)
+                params.append("%" + value)
+            else:
+                clauses.append("%s.%s = ?" % (alias, dim))
+                params.append(value)
+
+        return (" AND ".join(clauses) if clauses else "1"), params
+
+    @staticmethod
+    def __column(dim: str, alias: str = "i") -> str:
+        if dim == "file":
+            return "(SELECT path FROM files WHERE id = %s.file_id)" % alias
+        return "%s.%s" % (alias, dim)
+
+    def average(self, field: str, group_by: List[str], filters: Dict[str, Any]) -> Tuple[List[str], List[Tuple]]:
+        """
+        Average (and count / min / max) of a decision field, grouped by the given dimensions
+        """
+        where, params = self.__where(filters)
+        columns = [self.__column(dim) for dim in group_by]
+        select = ", ".join(columns + ["COUNT(*)", "AVG(i.value)", "MIN(i.value)", "MAX(i.value)"])
+        query = "SELECT %s FROM interactions i WHERE i.field = ? AND i.error = 0 AND %s" % (select, where)
+        if columns:
+            query += " GROUP BY %s ORDER BY %s" % (", ".join(columns), ", ".join(columns))
+
+        return group_by + ["count", "avg", "min", "max"], self.conn.execute(query, [field] + params).fetchall()
+
+    def monotonicity_violations(self, filters: Dict[str, Any], strict: bool) -> Tuple[List[str], List[Tuple]]:
+        """
+        Counts the negotiation decisions of the LLM that break the monotonic concession protocol with respect to
+        the previous round of the same negotiation: an owner offer lower than the previous one, or a company
+        counter-offer higher than the previous one. With `strict`, equal offers count as violations too, as in
+        the protocol checks of MonotonicConcessionNegotiation.
+        """
+        where, params = self.__where(filters, "cur")
+        lower, higher = ("<=", ">=") if strict else ("<", ">")
+        query = """
+            SELECT cur.agent, cur.field, COUNT(*),
+                   SUM(CASE WHEN (cur.field = 'negotiation_offer' AND cur.value %s prev.value)
+                              OR (cur.field = 'counter_offer' AND cur.value %s prev.value) THEN 1 ELSE 0 END)
+            FROM interactions cur
+            JOIN interactions prev
+              ON prev.file_id = cur.file_id AND prev.agent = cur.agent AND prev.stage = cur.stage
+             AND prev.item = cur.item AND prev.partner IS cur.partner AND prev.episode = cur.episode
+             AND prev.game IS cur.game
+             AND prev.round = cur.round - 1
+            WHERE cur.stage = 'Negotiation' AND cur.error = 0 AND prev.error = 0 AND cur.field = prev.field
+              AND %s
+            GROUP BY cur.agent, cur.field
+            ORDER BY cur.agent
+        """ % (lower, higher, where)
+
+        rows = [row + (row[3] / row[2] if row[2] else 0.0,) for row in self.conn.execute(query, params)]
+        return ["agent", "field", "decisions", "violations", "rate"], rows
+
+    def fallbacks(self, group_by: List[str], filters: Dict[str, Any]) -> Tuple[List[str], List[Tuple]]:
+        """
+        Share of the LLM interactions that ended in an error, i.e. where the agent used its fallback logic
+        """
+        where, params = self.__where(filters)
+        columns = [self.__column(dim) for dim in group_by]
+        select = ", ".join(columns + ["COUNT(*)", "SUM(i.error)", "AVG(i.error)"])
+        query = "SELECT %s FROM interactions i WHERE %s" % (select, where)
+        if columns:
+            query += " GROUP BY %s ORDER BY %s" % (", ".join(columns), ", ".join(columns))
+
+        return group_by + ["interactions", "errors", "rate"], self.conn.execute(query, params).fetchall()
+
+    def records(self, filters: Dict[str, Any], limit: int) -> Iterator[Dict[str, Any]]:
+        """
+        Streams the full log records matching the filters, read back from the log files
+        """
+        where, params = self.__where(filters)
+        query = "SELECT f.path, i.line, i.offset FROM interactions i JOIN files f ON f.id = i.file_id " \
+                "WHERE %s ORDER BY i.file_id, i.line LIMIT ?" % where
+
+        matches: Dict[str, List[Tuple[int, Optional[int]]]] = {}
+        for path, line, offset in self.conn.execute(query, params + [limit]):
+            matches.setdefault(path, []).append((line, offset))
+
+        for path, positions in matches.items():
+            if _is_plain_log(path):
+                with open(path, "rb") as f:
+                    for _, offset in positions:
+                        f.seek(offset)
+                        yield json.loads(f.readline())
+            else:
+                wanted = set(line for line, _ in positions)
+                with PromptIndex(prompt_table_path(path)) as prompt_index:
+                    for line, record in enumerate(read_log(path, rebuild_prompts=False)):
+                        if line in wanted:
+                            yield prompt_index.rebuild(record)
+
+
+def print_table(header: List[str], rows: List[Tuple]) -> None:
+    cells = [[("%.2f" % value) if isinstance(value, float) else str(value) for value in row] for row in rows]
+    widths = [max([len(name)] + [len(row[idx]) for row in cells]) for idx, name in enumerate(header)]
+
+    print("  ".join(name.ljust(width) for name, width in zip(header, widths)))
+    print("  ".join("-" * width for width in widths))
+    for row in cells:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def _add_filter_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--agent")
+    parser.add_argument("--role")
+    parser.add_argument("--stage", choices=["Auction", "Negotiation"])
+    parser.add_argument("--item")
+    parser.add_argument("--partner")
+    parser.add_argument("--round", type=int)
+    parser.add_argument("--game", help="game identifier, as recorded by the tournament")
+    parser.add_argument("--file", help="only interactions from log files whose path ends with this")
+
+
+def _group_by(value: str) -> List[str]:
+    dims = [dim.strip() for dim in value.split(",") if dim.strip()]
+    for dim in dims:
+        if dim not in DIMENSIONS:
+            raise argparse.ArgumentTypeError("unknown dimension '%s', expected one of %s" % (dim, DIMENSIONS))
+    return dims
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analytics over LLM interaction logs")
+    parser.add_argument("--db", default=DEFAULT_INDEX, help="index database (default: %s)" % DEFAULT_INDEX)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index_cmd = commands.add_parser("index", help="index (or update the index of) log files")
+    index_cmd.add_argument("logs", nargs="+")
+
+    avg_cmd = commands.add_parser("avg", help="average of a decision field")
+    avg_cmd.add_argument("--field", choices=list(DECISION_FIELDS.values()), required=True)
+    avg_cmd.add_argument("--by", type=_group_by, default=["agent"], help="comma separated dimensions")
+    _add_filter_arguments(avg_cmd)
+
+    violations_cmd = commands.add_parser("violations", help="monotonic concession violations of the LLM decisions")
+    violations_cmd.add_argument("--strict", action="store_true", help="count equal offers as violations")
+    _add_filter_arguments(violations_cmd)
+
+    fallbacks_cmd = commands.add_parser("fallbacks", help="share of LLM interactions ending in an error")
+    fallbacks_cmd.add_argument("--by", type=_group_by, default=["agent", "stage"], help="comma separated dimensions")
+    _add_filter_arguments(fallbacks_cmd)
+
+    show_cmd = commands.add_parser("show", help="print the full records matching the filters")
+    show_cmd.add_argument("--limit", type=int, default=10)
+    _add_filter_arguments(show_cmd)
+
+    args = parser.parse_args()
+    log_index = LogIndex(args.db)
+    query_filters = {dim: getattr(args, dim, None) for dim in ("file", "game", "agent", "role", "stage", "item",
+                                                              "partner", "round")}
+
+    try:
+        if args.command == "index":
+            for log_path in args.logs:
+                print("%s: %i new records" % (log_path, log_index.index_file(log_path)))
+        elif args.command == "avg":
+            print_table(*log_index.average(args.field, args.by, query_filters))
+        elif args.command == "violations":
+            print_table(*log_index.monotonicity_violations(query_filters, args.strict))
+        elif args.command == "fallbacks":
+            print_table(*log_index.fallbacks(args.by, query_filters))
+        elif args.command == "show":
+            for log_record in log_index.records(query_filters, args.limit):
+                print(json.dumps(log_record, indent=2))
+    finally:
+        log_index.close()
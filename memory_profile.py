@@ -0,0 +1,207 @@
+"""
+Memory profiling of house building games.
+
+Games are played one after the other in this process under `tracemalloc`. A snapshot is taken at the start of every
+game and at the end of its phases (auction end, end of the negotiation of each item, game end), through the phase
+listeners of `BuildingEnvironment`. For every phase the report gives the memory traced at that point, the peak
+traced since the previous phase, and the allocation sites that grew the most since the start of the game. The peak
+resident memory of the process is given after every game.
+
+Module level state that outlives a game (`llm_interactions_log`, the token ledger, the agent caches) shows up as
+growth from one game to the next, just like in a batch run:
+
+    python memory_profile.py --games 3 --top 10
+    python memory_profile.py --games 3 --game-cfg game.cfg --clear-llm-log
+    python memory_profile.py --games 3 --reuse-env
+"""
+import argparse
+import contextlib
+import io
+import linecache
+import logging
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+DEFAULT_OWNER_CFG = "config-ACME-project.cfg"
+DEFAULT_COMPANIES_CFG = "config-companies.cfg"
+DEFAULT_GAME_CFG = "game.cfg"
+
+MAX_STEPS_PER_GAME = 1000
+
+# frames kept per allocation, enough to get from the list / dict append to the code responsible for it
+TRACEBACK_FRAMES = 10
+
+# allocations of the profiler itself and of the import machinery are not reported
+IGNORED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def peak_rss_kb() -> int:
+    """
+    :return: the peak resident memory of the process so far, in KiB (it never decreases)
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in KiB elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class MemoryProfiler(object):
+    """
+    Phase listener of `BuildingEnvironment` snapshotting the traced memory at the end of every game phase
+    """
+
+    def __init__(self, top: int = 10):
+        self.top = top
+        self.games: List[Dict[str, Any]] = []
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(IGNORED_TRACES)
+
+    def start_game(self, game: str) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEBACK_FRAMES)
+
+        self._baseline = self._snapshot()
+        tracemalloc.reset_peak()
+        self.games.append({"game": game, "start_traced": tracemalloc.get_traced_memory()[0], "phases": [],
+                           "top_sites": [], "peak_traced": 0, "peak_rss_kb": 0})
+
+    def __call__(self, phase: str, item: Optional[str] = None) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        game = self.games[-1]
+        game["peak_traced"] = max(game["peak_traced"], peak)
+
+        growth = self._snapshot().compare_to(self._baseline, "lineno")
+        game["phases"].append({
+            "phase": phase if item is None else "%s (%s)" % (phase, item),
+            "traced": current,
+            "peak": peak,
+            "top_sites": [str(stat) for stat in growth[:self.top] if stat.size_diff > 0],
+        })
+        tracemalloc.reset_peak()
+
+    def end_game(self) -> Dict[str, Any]:
+        """
+        Ends the game started last, with its top allocation sites grouped by traceback
+        :return: the report of the game
+        """
+        game = self.games[-1]
+        current, peak = tracemalloc.get_traced_memory()
+        game["peak_traced"] = max(game["peak_traced"], peak)
+        game["end_traced"] = current
+        game["peak_rss_kb"] = peak_rss_kb()
+
+        growth = self._snapshot().compare_to(self._baseline, "traceback")
+        game["top_sites"] = [stat for stat in growth[:self.top] if stat.size_diff > 0]
+        return game
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+
+
+def format_report(game: Dict[str, Any]) -> List[str]:
+    lines = ["#### %s ####" % game["game"],
+             "traced: %.1f KiB at start, %.1f KiB at end (%+.1f KiB), peak %.1f KiB; peak RSS %.1f MiB" % (
+                 game["start_traced"] / 1024, game["end_traced"] / 1024,
+                 (game["end_traced"] - game["start_traced"]) / 1024, game["peak_traced"] / 1024,
+                 game["peak_rss_kb"] / 1024)]
+
+    lines.append("%-50s %12s %12s" % ("phase", "traced KiB", "peak KiB"))
+    for phase in game["phases"]:
+        lines.append("%-50s %12.1f %12.1f" % (phase["phase"], phase["traced"] / 1024, phase["peak"] / 1024))
+        for site in phase["top_sites"][:3]:
+            lines.append("    " + site)
+
+    lines.append("top allocation sites (growth over the game):")
+    for stat in game["top_sites"]:
+        lines.append("  %+.1f KiB in %+i blocks" % (stat.size_diff / 1024, stat.count_diff))
+        for frame_line in stat.traceback.format(limit=4, most_recent_first=True):
+            lines.append("    " + frame_line)
+    return lines
+
+
+def profile_games(num_games: int, owner_cfg_file: str = DEFAULT_OWNER_CFG,
+                  companies_cfg_file: str = DEFAULT_COMPANIES_CFG, game_cfg_file: str = DEFAULT_GAME_CFG,
+                  top: int = 10, clear_llm_log: bool = False, quiet: bool = True,
+                  reuse_env: bool = False) -> List[Dict[str, Any]]:
+    """
+    Plays `num_games` games one after the other under tracemalloc
+    :param clear_llm_log: empty `llm_interactions_log` and the token ledger after every game, like the tournament
+    workers do, instead of letting them grow like in consecutive runs of a single process
+    :param reuse_env: play all the games with one environment and the same agents, `reset` between games
+    :return: the report of every game
+    """
+    profiler = MemoryProfiler(top)
+    # import the game code before tracing starts, so that module loading is not reported as game allocations
+    from environment import BuildingEnvironment
+    from agents import student_agent
+
+    env = None
+    for game_idx in range(num_games):
+        profiler.start_game("game %i" % game_idx)
+        start = time.perf_counter()
+
+        output = io.StringIO() if quiet else sys.stdout
+        with contextlib.redirect_stdout(output):
+            if env is None:
+                env = BuildingEnvironment(owner_cfg_file=owner_cfg_file, companies_cfg_file=companies_cfg_file,
+                                          game_cfg_file=game_cfg_file, reusable=reuse_env)
+                env.add_phase_listener(profiler)
+                env.initialize()
+            else:
+                env.reset()
+
+            steps = 0
+            while not env.goals_completed() and steps < MAX_STEPS_PER_GAME:
+                env.step()
+                steps += 1
+
+        if not reuse_env:
+            env = None
+        del output
+        report = profiler.end_game()
+        report["duration"] = time.perf_counter() - start
+        report["llm_log_entries"] = len(student_agent.llm_interactions_log)
+
+        if clear_llm_log:
+            del student_agent.llm_interactions_log[:]
+            student_agent.token_ledger.reset()
+
+    if env is not None:
+        env.close()
+    profiler.stop()
+    return profiler.games
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play games under tracemalloc and report their memory use")
+    parser.add_argument("--games", type=int, default=3, help="number of games played one after the other")
+    parser.add_argument("--top", type=int, default=10, help="number of allocation sites reported per game")
+    parser.add_argument("--owner-cfg", default=DEFAULT_OWNER_CFG)
+    parser.add_argument("--companies-cfg", default=DEFAULT_COMPANIES_CFG)
+    parser.add_argument("--game-cfg", default=DEFAULT_GAME_CFG)
+    parser.add_argument("--clear-llm-log", action="store_true",
+                        help="empty the LLM interaction log and the token ledger after every game")
+    parser.add_argument("--reuse-env", action="store_true",
+                        help="play the games with one environment and the same agents, reset between games")
+    parser.add_argument("--verbose", action="store_true", help="do not silence the game output")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    game_reports = profile_games(args.games, args.owner_cfg, args.companies_cfg, args.game_cfg, args.top,
+                                 args.clear_llm_log, quiet=not args.verbose, reuse_env=args.reuse_env)
+    for game_report in game_reports:
+        print("\n".join(format_report(game_report)))
+        print("%i LLM log entries, %.2fs\n" % (game_report["llm_log_entries"], game_report["duration"]))
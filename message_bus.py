@@ -0,0 +1,301 @@
+"""
+Asynchronous message bus between the environment and the agents.
+
+Every registered agent gets an inbox (an asyncio queue) and an endpoint coroutine that takes the messages out of
+the inbox one at a time and runs the matching agent method in a worker thread, since agent decisions block on LLM
+calls. An agent therefore handles its messages in order, while different agents work at the same time on one
+event loop, which runs in a background thread of the environment.
+
+`AuctionAnnouncement`s and `NegotiationMessage`s are routed to the agent method that handles them (`decide_bid`,
+`respond_to_offer`, `notify_partner_response`). The environment can send them to many agents at once with
+`MessageBus.deliver` and await all the replies, each with a timeout: a company that does not answer in time gets
+the default reply (no bid, no concession) instead of blocking the others. Its late reply is discarded on its side too:
+a message still in the inbox when the timeout expires is dropped, and an agent that was still deciding is told with
+`CompanyAgent.notify_reply_discarded` once it answered, before it handles its next message.
+
+The environment only deals with `BusOwnerAgent` / `BusCompanyAgent` proxies returned by `MessageBus.register`.
+They have the interface of the wrapped agents and send every call through the inbox of the agent.
+
+Enabled with `message_bus: true` in game.cfg, `reply_timeout` gives the seconds a company has to answer.
+"""
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from base import Agent
+from agents import HouseOwnerAgent, CompanyAgent
+from communication import NegotiationMessage, AuctionAnnouncement
+
+logger = logging.getLogger("message_bus")
+
+# Max. number of agent methods that can run at the same time
+BUS_WORKER_THREADS = 64
+
+# Reply used when a company does not answer an announcement / an offer in time: it does not bid, or it does not
+# concede (the environment keeps its previous counter offer, or its auction price in round 0)
+NO_BID = False
+NO_CONCESSION = None
+
+
+def _announcement_handler(agent: CompanyAgent, announcement: AuctionAnnouncement) -> bool:
+    return agent.decide_bid(announcement.auction_item, announcement.round, announcement.price)
+
+
+def _negotiation_handler(agent: Agent, msg: NegotiationMessage) -> Optional[float]:
+    if isinstance(agent, HouseOwnerAgent):
+        agent.notify_partner_response(msg)
+        return None
+    return agent.respond_to_offer(msg)
+
+
+def _discard_handler(agent: CompanyAgent, msg: Any) -> None:
+    agent.notify_reply_discarded(msg)
+
+
+MESSAGE_HANDLERS: Dict[type, Callable[[Agent, Any], Any]] = {
+    AuctionAnnouncement: _announcement_handler,
+    NegotiationMessage: _negotiation_handler,
+}
+
+
+class Envelope(object):
+    """
+    Content of an inbox: the function to run on the agent, its arguments, and the future receiving the result
+    (None for notifications that expect no reply). An envelope expires when its reply came too late to be used:
+    `discard` is then run on the agent, with the same arguments, if the agent already handled it.
+    """
+    def __init__(self, handler: Callable[..., Any], args: tuple, reply: Optional[asyncio.Future] = None,
+                 discard: Optional[Callable[..., Any]] = None):
+        self.handler = handler
+        self.args = args
+        self.reply = reply
+        self.discard = discard
+        self.expired = False
+
+
+class MessageBus(object):
+    """
+    Routes messages and calls from the environment to per-agent inboxes, served on an event loop running in a
+    background thread. All the public methods are meant to be called from the environment threads.
+    """
+
+    def __init__(self, num_workers: int = BUS_WORKER_THREADS):
+        self._agents: Dict[str, Agent] = {}
+        self._inboxes: Dict[str, asyncio.Queue] = {}
+        self._endpoints: List[asyncio.Task] = []
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="bus-agent")
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="message-bus", daemon=True)
+        self._thread.start()
+
+    def register(self, agent: Agent) -> Agent:
+        """
+        Creates the inbox and endpoint of an agent
+        :return: the proxy through which the environment talks to the agent
+        """
+        def start_endpoint():
+            self._inboxes[agent.name] = asyncio.Queue()
+            self._endpoints.append(self._loop.create_task(self._serve(agent, self._inboxes[agent.name])))
+
+        self._agents[agent.name] = agent
+        asyncio.run_coroutine_threadsafe(self._run_in_loop(start_endpoint), self._loop).result()
+
+        if isinstance(agent, HouseOwnerAgent):
+            return BusOwnerAgent(agent, self)
+        return BusCompanyAgent(agent, self)
+
+    @staticmethod
+    async def _run_in_loop(function: Callable[[], None]) -> None:
+        function()
+
+    async def _serve(self, agent: Agent, inbox: asyncio.Queue) -> None:
+        """
+        Endpoint of an agent: handles the messages of its inbox one at a time
+        """
+        while True:
+            envelope: Envelope = await inbox.get()
+            if envelope is None:
+                break
+            if envelope.expired:
+                # the default reply was used in its place, the agent never sees the message
+                continue
+
+            try:
+                result = await self._loop.run_in_executor(self._executor,
+                                                          functools.partial(envelope.handler, agent, *envelope.args))
+            except Exception as e:
+                if envelope.reply is None:
+                    logger.exception("Agent %s failed to handle a notification" % agent.name)
+                elif not envelope.reply.done():
+                    envelope.reply.set_exception(e)
+            else:
+                if envelope.reply is not None and not envelope.reply.done():
+                    envelope.reply.set_result(result)
+
+            if envelope.expired and envelope.discard is not None:
+                try:
+                    await self._loop.run_in_executor(self._executor,
+                                                     functools.partial(envelope.discard, agent, *envelope.args))
+                except Exception:
+                    logger.exception("Agent %s failed to discard a late reply" % agent.name)
+
+    async def _request(self, receiver: str, handler: Callable[..., Any], args: tuple,
+                       timeout: Optional[float] = None, default: Any = None,
+                       discard: Optional[Callable[..., Any]] = None) -> Any:
+        reply = self._loop.create_future()
+        envelope = Envelope(handler, args, reply, discard)
+        self._inboxes[receiver].put_nowait(envelope)
+
+        if timeout is None:
+            return await reply
+
+        try:
+            # shielded, so that the late reply still completes (and is dropped) instead of cancelling the call
+            return await asyncio.wait_for(asyncio.shield(reply), timeout)
+        except asyncio.TimeoutError:
+            envelope.expired = True
+            logger.warning("%s did not answer within %ss, using the default reply %s" % (receiver, timeout, default))
+            return default
+
+    def call(self, receiver: str, method: str, *args, timeout: Optional[float] = None, default: Any = None) -> Any:
+        """
+        Calls a method of an agent through its inbox and waits for the result
+        """
+        handler = functools.partial(_call_method, method)
+        return asyncio.run_coroutine_threadsafe(self._request(receiver, handler, args, timeout, default),
+                                                self._loop).result()
+
+    def post(self, receiver: str, method: str, *args) -> None:
+        """
+        Queues a call to a method of an agent without waiting for it, e.g. for notifications. The agent still
+        handles it before any later message.
+        """
+        envelope = Envelope(functools.partial(_call_method, method), args)
+        self._loop.call_soon_threadsafe(self._inboxes[receiver].put_nowait, envelope)
+
+    def deliver(self, messages: List[Any], timeout: Optional[float] = None, default: Any = None) -> List[Any]:
+        """
+        Sends messages (`AuctionAnnouncement`s, `NegotiationMessage`s) to their receivers at the same time
+        :param messages: the messages to deliver
+        :param timeout: seconds each receiver has to answer, no limit if None
+        :param default: reply used for the receivers that did not answer in time, which are told to discard their
+        late reply
+        :return: the replies, in the order of the messages
+        """
+        async def deliver_all():
+            return await asyncio.gather(*(self._request(msg.receiver, MESSAGE_HANDLERS[type(msg)], (msg,),
+                                                        timeout, default, _discard_handler) for msg in messages))
+
+        return asyncio.run_coroutine_threadsafe(deliver_all(), self._loop).result()
+
+    def close(self) -> None:
+        """
+        Stops the endpoints, once the agents have handled the messages still in their inboxes (e.g. the last
+        notifications), and the event loop
+        """
+        if not self._loop.is_running():
+            return
+
+        async def drain():
+            for inbox in self._inboxes.values():
+                inbox.put_nowait(None)
+            await asyncio.gather(*self._endpoints)
+
+        asyncio.run_coroutine_threadsafe(drain(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown(wait=False)
+
+
+def _call_method(method: str, agent: Agent, *args) -> Any:
+    return getattr(agent, method)(*args)
+
+
+class BusOwnerAgent(HouseOwnerAgent):
+    """
+    Proxy of a house owner agent registered on a message bus
+    """
+    def __init__(self, agent: HouseOwnerAgent, bus: MessageBus):
+        Agent.__init__(self, agent.name)
+        self.role = agent.role
+        self.budget_dict = agent.budget_dict
+        self.agent = agent
+        self._bus = bus
+
+    def configure(self, options: Dict[str, Any]) -> None:
+        self._bus.call(self.name, "configure", options)
+
+    def reset(self) -> None:
+        self._bus.call(self.name, "reset")
+
+    def notify_item_feasibility(self, feasibility: Dict[str, Dict[str, Any]]) -> None:
+        self._bus.post(self.name, "notify_item_feasibility", feasibility)
+
+    def propose_item_budget(self, auction_item: str, auction_round: int) -> float:
+        return self._bus.call(self.name, "propose_item_budget", auction_item, auction_round)
+
+    def notify_auction_round_result(self, auction_item: str, auction_round: int, responding_agents: List[str]) -> None:
+        self._bus.post(self.name, "notify_auction_round_result", auction_item, auction_round, responding_agents)
+
+    def provide_negotiation_offer(self, negotiation_item: str, partner_agent: str, negotiation_round: int) -> float:
+        return self._bus.call(self.name, "provide_negotiation_offer", negotiation_item, partner_agent,
+                              negotiation_round)
+
+    def expected_partner_responses(self, negotiation_item: str, partner_agent: str,
+                                   negotiation_round: int) -> List[float]:
+        return self._bus.call(self.name, "expected_partner_responses", negotiation_item, partner_agent,
+                              negotiation_round)
+
+    def speculate_negotiation_offer(self, negotiation_item: str, partner_agent: str, negotiation_round: int,
+                                    expected_response: float) -> None:
+        # not through the inbox, so that the offers for several partners are prepared at the same time: the owner
+        # handled its earlier messages before answering expected_partner_responses, and speculation leaves its
+        # negotiation state untouched
+        self.agent.speculate_negotiation_offer(negotiation_item, partner_agent, negotiation_round, expected_response)
+
+    def notify_partner_response(self, response_msg: NegotiationMessage) -> None:
+        self._bus.post(self.name, "notify_partner_response", response_msg)
+
+    def notify_negotiation_winner(self, negotiation_item: str, winning_agent: str, winning_offer: float) -> None:
+        self._bus.post(self.name, "notify_negotiation_winner", negotiation_item, winning_agent, winning_offer)
+
+
+class BusCompanyAgent(CompanyAgent):
+    """
+    Proxy of a company agent registered on a message bus
+    """
+    def __init__(self, agent: CompanyAgent, bus: MessageBus):
+        Agent.__init__(self, agent.name)
+        self.role = agent.role
+        self.specialties = agent.specialties
+        self.agent = agent
+        self._bus = bus
+
+    def configure(self, options: Dict[str, Any]) -> None:
+        self._bus.call(self.name, "configure", options)
+
+    def reset(self) -> None:
+        self._bus.call(self.name, "reset")
+
+    def decide_bid(self, auction_item: str, auction_round: int, item_budget: float) -> bool:
+        return self._bus.call(self.name, "decide_bid", auction_item, auction_round, item_budget)
+
+    def notify_won_auction(self, auction_item: str, auction_round: int, num_selected: int) -> None:
+        self._bus.post(self.name, "notify_won_auction", auction_item, auction_round, num_selected)
+
+    def respond_to_offer(self, initiator_msg: NegotiationMessage) -> float:
+        return self._bus.call(self.name, "respond_to_offer", initiator_msg)
+
+    def notify_contract_assigned(self, construction_item: str, price: float) -> None:
+        self._bus.post(self.name, "notify_contract_assigned", construction_item, price)
+
+    def notify_negotiation_lost(self, construction_item: str) -> None:
+        self._bus.post(self.name, "notify_negotiation_lost", construction_item)
+
+    def notify_reply_discarded(self, message: Any) -> None:
+        self._bus.post(self.name, "notify_reply_discarded", message)
@@ -0,0 +1,188 @@
+"""
+Columnar trace of the negotiation histories.
+
+Every message of every `MonotonicConcessionNegotiation` becomes one row with the typed columns:
+
+    game (str), conversation_id (str), item (str), round (int32), sender (str), offer (float64),
+    protocol_ok (bool), negotiation_ok (bool), agreement (bool), partial (bool)
+
+`protocol_ok` tells whether the message respects the monotonic concession protocol: an initiator offer strictly
+higher, or a partner counter offer strictly lower, than the previous message of the same sender. `negotiation_ok`
+tells whether the whole negotiation did, i.e. whether the environment did not fail it for a violation. `agreement` is set on the message that
+closed the conversation the environment assigned the item with (`MonotonicConcessionNegotiation.closing_message`).
+`partial` marks the rows of conversations whose first rounds left the history window (`negotiation_history` in
+game.cfg): only their last messages are traced, and the protocol checks start from the first message kept.
+
+String columns are dictionary-encoded: the file holds an int32 code column and the array of distinct values
+(`<column>_values`). Traces are saved as compressed NumPy `.npz` files, which load as plain arrays:
+
+    trace = load_trace("negotiations.npz")
+    agreed = trace["agreement"]
+    print(np.mean(trace["offer"][agreed]))
+
+Traces are written by `environment.py --negotiation-trace FILE` and `tournament.py --negotiation-trace FILE`.
+    python negotiation_trace.py summary negotiations.npz
+"""
+import argparse
+from array import array
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from communication import MonotonicConcessionNegotiation, INITIATOR, PARTNER
+
+STRING_COLUMNS = ("game", "conversation_id", "item", "sender")
+VALUES_SUFFIX = "_values"
+
+
+class NegotiationTrace(object):
+    """
+    Accumulates negotiation rows in typed column buffers
+    """
+
+    def __init__(self):
+        self._vocabularies: Dict[str, Dict[str, int]] = {column: {} for column in STRING_COLUMNS}
+        self._codes: Dict[str, array] = {column: array("i") for column in STRING_COLUMNS}
+        self._round = array("i")
+        self._offer = array("d")
+        self._protocol_ok = array("b")
+        self._negotiation_ok = array("b")
+        self._agreement = array("b")
+        self._partial = array("b")
+
+    def __len__(self) -> int:
+        return len(self._round)
+
+    def _encode(self, column: str, value: str) -> None:
+        vocabulary = self._vocabularies[column]
+        code = vocabulary.get(value)
+        if code is None:
+            code = vocabulary[value] = len(vocabulary)
+        self._codes[column].append(code)
+
+    def add_row(self, game: str, conversation_id: str, item: str, round_num: int, sender: str, offer: float,
+                protocol_ok: bool, negotiation_ok: bool, agreement: bool, partial: bool = False) -> None:
+        self._encode("game", game)
+        self._encode("conversation_id", conversation_id)
+        self._encode("item", item)
+        self._encode("sender", sender)
+        self._round.append(round_num)
+        self._offer.append(offer)
+        self._protocol_ok.append(protocol_ok)
+        self._negotiation_ok.append(negotiation_ok)
+        self._agreement.append(agreement)
+        self._partial.append(partial)
+
+    def add_negotiation(self, negotiation: MonotonicConcessionNegotiation, game: str = "") -> None:
+        """
+        Adds the rows of all the messages of a negotiation, in the order they were sent (only the last ones, marked
+        as partial, when the negotiation keeps a limited history window)
+        """
+        closing_msg = negotiation.closing_message()
+        partial = negotiation.is_partial()
+        negotiation_ok = not negotiation.failed
+        previous_initiator_msg, previous_partner_msg = None, None
+        for initiator_msg in negotiation.negotiation_history[INITIATOR]:
+            protocol_ok = previous_initiator_msg is None or initiator_msg.offer > previous_initiator_msg.offer
+            self.add_row(game, negotiation.conversation_id, negotiation.negotiation_item, initiator_msg.round,
+                         initiator_msg.sender, initiator_msg.offer, protocol_ok, negotiation_ok,
+                         initiator_msg is closing_msg, partial)
+
+            partner_msg = negotiation.message(PARTNER, initiator_msg.round)
+            if partner_msg is not None:
+                protocol_ok = previous_partner_msg is None or partner_msg.offer < previous_partner_msg.offer
+                self.add_row(game, negotiation.conversation_id, negotiation.negotiation_item, partner_msg.round,
+                             partner_msg.sender, partner_msg.offer, protocol_ok, negotiation_ok,
+                             partner_msg is closing_msg, partial)
+                previous_partner_msg = partner_msg
+            previous_initiator_msg = initiator_msg
+
+    def add_negotiations(self, negotiations: Iterable[MonotonicConcessionNegotiation], game: str = "") -> None:
+        for negotiation in negotiations:
+            self.add_negotiation(negotiation, game)
+
+    def merge(self, other: "NegotiationTrace") -> None:
+        """
+        Appends the rows of another trace, e.g. the trace of a game played in a worker process
+        """
+        for column in STRING_COLUMNS:
+            other_values = list(other._vocabularies[column])
+            for code in other._codes[column]:
+                self._encode(column, other_values[code])
+        self._round.extend(other._round)
+        self._offer.extend(other._offer)
+        self._protocol_ok.extend(other._protocol_ok)
+        self._negotiation_ok.extend(other._negotiation_ok)
+        self._agreement.extend(other._agreement)
+        self._partial.extend(other._partial)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """
+        :return: the encoded columns, as stored in the .npz file
+        """
+        columns = {}
+        for column in STRING_COLUMNS:
+            columns[column] = np.array(self._codes[column], dtype=np.int32)
+            columns[column + VALUES_SUFFIX] = np.array(list(self._vocabularies[column]), dtype=str)
+        columns["round"] = np.array(self._round, dtype=np.int32)
+        columns["offer"] = np.array(self._offer, dtype=np.float64)
+        columns["protocol_ok"] = np.array(self._protocol_ok, dtype=bool)
+        columns["negotiation_ok"] = np.array(self._negotiation_ok, dtype=bool)
+        columns["agreement"] = np.array(self._agreement, dtype=bool)
+        columns["partial"] = np.array(self._partial, dtype=bool)
+        return columns
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, **self.columns())
+
+
+def load_trace(path: str, decode: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Loads a negotiation trace
+    :param decode: if True, string columns are decoded to arrays of strings, otherwise they are left as int32
+    codes next to their `<column>_values` arrays
+    :return: dict mapping column names to arrays
+    """
+    with np.load(path) as data:
+        columns = {name: data[name] for name in data.files}
+
+    if decode:
+        for column in STRING_COLUMNS:
+            columns[column] = columns.pop(column + VALUES_SUFFIX)[columns[column]]
+    return columns
+
+
+def summary(columns: Dict[str, np.ndarray]) -> List[str]:
+    """
+    Per item: number of conversations, agreement rate, mean agreed price, protocol violations and partial
+    conversations
+    """
+    lines = ["%-25s %8s %10s %12s %10s %8s" % ("item", "convs", "agreed %", "mean price", "violations", "partial")]
+    # conversation ids repeat from one game to the next
+    conversation_keys = np.char.add(np.char.add(columns["game"], "|"), columns["conversation_id"])
+    # traces saved before the partial column have complete conversations only
+    partial = columns.get("partial", np.zeros(len(columns["round"]), dtype=bool))
+    items, item_codes = np.unique(columns["item"], return_inverse=True)
+    for code, item in enumerate(items):
+        rows = item_codes == code
+        conversations = np.unique(conversation_keys[rows])
+        agreed = rows & columns["agreement"]
+        violating = np.unique(conversation_keys[rows & ~columns["protocol_ok"]])
+        partial_conversations = np.unique(conversation_keys[rows & partial])
+        lines.append("%-25s %8i %10.1f %12.2f %10i %8i" % (item, len(conversations),
+                                                      100.0 * np.count_nonzero(agreed) / max(len(conversations), 1),
+                                                      columns["offer"][agreed].mean() if agreed.any() else 0.0,
+                                                      len(violating), len(partial_conversations)))
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect columnar negotiation traces")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary_cmd = commands.add_parser("summary")
+    summary_cmd.add_argument("trace")
+    args = parser.parse_args()
+
+    trace_columns = load_trace(args.trace)
+    print("%i messages, %i games" % (len(trace_columns["round"]), len(np.unique(trace_columns["game"]))))
+    print("\n".join(summary(trace_columns)))
@@ -0,0 +1,259 @@
+"""
+Performance regression gate.
+
+Plays a standard set of game scenarios with the deterministic stub LLM backend (`llm_backend: "stub"`, no API
+calls) and compares them with the baseline committed in `perf_baseline.json`:
+  - relative_time: duration of a game, from the creation of the environment to its end, divided by the duration of
+    a fixed reference workload timed in the same process right before it, so that the baseline does not depend on
+    the speed of the machine
+  - peak_memory: peak memory traced by tracemalloc during a game (bytes)
+  - llm_calls: number of agent decisions that went to the LLM backend
+  - steps: number of environment steps
+
+Every game must also end with all the construction items contracted: "long" plays the repository configuration
+with `LONG_NEGOTIATION_ROUNDS` negotiation rounds and a history window of 2, so that long-horizon negotiations are
+checked to actually complete.
+
+Every scenario is timed `--repeats` times (without tracing, which slows the game down; short games are timed in
+batches of games, each batch after its own reference run) and played `--memory-repeats` times under tracemalloc. A metric regresses when its mean grows by more than `--threshold`
+(relative) over the baseline and its 95% confidence interval lies entirely above the one of the baseline, so that
+noise in the timings does not fail the gate. LLM calls and steps are deterministic: any increase beyond
+`--calls-threshold` fails the gate.
+
+    python perf_gate.py                      # exit code 1 on regressions
+    python perf_gate.py --update-baseline    # measure and write perf_baseline.json
+
+The ratios still vary a little with the CPU and the Python version, which the default threshold allows for.
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from config_loader import load_config, OWNER_CONFIG, COMPANIES_CONFIG, GAME_CONFIG
+from scaling_benchmark import generate_scenario, build_game_cfg, write_scenario
+
+DEFAULT_BASELINE = "perf_baseline.json"
+DEFAULT_THRESHOLD = 0.20
+MAX_STEPS_PER_GAME = 10000
+
+# games shorter than that are timed in batches of games lasting at least that long, so that timer resolution and
+# scheduling noise do not dominate the measurement
+MIN_SAMPLE_SECONDS = 0.2
+
+# iterations of the reference workload, ~10 ms
+REFERENCE_ITERATIONS = 1000
+
+TIMED_METRICS = ("relative_time",)
+TRACED_METRICS = ("peak_memory",)
+COUNT_METRICS = ("llm_calls", "steps")
+
+# negotiation rounds of the "long" scenario
+LONG_NEGOTIATION_ROUNDS = 500
+
+# (name, number of companies, number of items); "default" and "long" play the configuration of the repository
+STANDARD_SCENARIOS: List[Tuple[str, int, int]] = [
+    ("default", 0, 0),
+    ("long", 0, 0),
+    ("medium", 1000, 8),
+    ("large", 5000, 16),
+]
+
+# two-sided 95% Student t quantiles by degrees of freedom, the normal quantile beyond
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+        12: 2.179, 15: 2.131, 20: 2.086, 30: 2.042}
+
+
+def confidence_interval(samples: List[float]) -> Tuple[float, float]:
+    """
+    :return: mean and half width of the 95% confidence interval of the mean of the samples
+    """
+    mean = statistics.fmean(samples)
+    if len(samples) < 2:
+        return mean, 0.0
+
+    dof = len(samples) - 1
+    t_value = next((T_95[d] for d in sorted(T_95) if d >= dof), 1.96)
+    return mean, t_value * statistics.stdev(samples) / math.sqrt(len(samples))
+
+
+def write_scenarios(directory: str) -> Dict[str, Tuple[str, str, str]]:
+    """
+    Writes the configuration files of the standard scenarios, all with the stub LLM backend
+    :return: dict mapping each scenario to the paths of its owner, companies and game configuration files
+    """
+    scenarios = {}
+    for name, num_companies, num_items in STANDARD_SCENARIOS:
+        if name in ("default", "long"):
+            owner_cfg = load_config("config-ACME-project.cfg", OWNER_CONFIG)
+            companies_cfg = load_config("config-companies.cfg", COMPANIES_CONFIG)
+            game_cfg = dict(load_config("game.cfg", GAME_CONFIG), llm_backend="stub")
+            if name == "long":
+                game_cfg.update(nr_negotiation_rounds=LONG_NEGOTIATION_ROUNDS, negotiation_history=2)
+        else:
+            owner_cfg, companies_cfg = generate_scenario(num_companies, num_items)
+            game_cfg = build_game_cfg([comp["name"] for comp in companies_cfg["companies"]])
+        scenarios[name] = write_scenario(os.path.join(directory, name), owner_cfg, companies_cfg, game_cfg)
+    return scenarios
+
+
+def play_game(paths: Tuple[str, str, str], traced: bool) -> Dict[str, float]:
+    """
+    :raise RuntimeError: if the game does not contract every construction item
+    """
+    from environment import BuildingEnvironment
+    from agents import student_agent
+
+    del student_agent.llm_interactions_log[:]
+    gc.collect()
+
+    if traced:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        env = BuildingEnvironment(*paths)
+        env.initialize()
+        steps = 0
+        while not env.goals_completed() and steps < MAX_STEPS_PER_GAME:
+            env.step()
+            steps += 1
+    measurement = {"wall_time": time.perf_counter() - start, "steps": steps,
+                   "llm_calls": sum(1 for entry in student_agent.llm_interactions_log if not entry.get("surrogate"))}
+    if traced:
+        measurement["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    if not env.game_results()["successful"]:
+        raise RuntimeError("The game of %s failed after %i steps" % (os.path.dirname(paths[0]), steps))
+
+    del student_agent.llm_interactions_log[:]
+    student_agent.token_ledger.reset()
+    return measurement
+
+
+def reference_time() -> float:
+    """
+    Times a fixed workload of the kind a game does (dicts, string formatting, JSON), in the same process as the
+    games, as the unit of their relative time
+    :return: the shortest of three runs of the workload (seconds), the least disturbed one
+    """
+    durations = []
+    for _ in range(3):
+        start = time.perf_counter()
+        for i in range(REFERENCE_ITERATIONS):
+            message = {"item": "item_%i" % (i % 16), "round": i % 3, "offer": i * 0.75}
+            json.loads(json.dumps(message))
+            "%s offers %.2f in round %i" % (message["item"], message["offer"], message["round"])
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def play_batch(paths: Tuple[str, str, str], batch_size: int) -> Dict[str, float]:
+    """
+    :return: the measurement of the last game of the batch, with the mean wall time of its games relative to the
+    reference workload timed right before the batch
+    """
+    reference = reference_time()
+    games = [play_game(paths, traced=False) for _ in range(batch_size)]
+    return dict(games[-1], relative_time=statistics.fmean(game["wall_time"] for game in games) / reference)
+
+
+def measure(repeats: int, memory_repeats: int) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    :return: for every scenario and metric, the mean, the half width of its 95% confidence interval and the number
+    of samples
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="perf_gate_") as tmp_dir:
+        for name, paths in write_scenarios(tmp_dir).items():
+            # one untimed game first, so that imports and caches are warm
+            warmup = play_game(paths, traced=False)
+            batch_size = max(1, math.ceil(MIN_SAMPLE_SECONDS / warmup["wall_time"]))
+            timed = [play_batch(paths, batch_size) for _ in range(repeats)]
+            traced = [play_game(paths, traced=True) for _ in range(memory_repeats)]
+
+            results[name] = {}
+            for metric, runs in ([(m, timed) for m in TIMED_METRICS + COUNT_METRICS] +
+                                 [(m, traced) for m in TRACED_METRICS]):
+                mean, half_width = confidence_interval([run[metric] for run in runs])
+                results[name][metric] = {"mean": mean, "ci": half_width, "n": len(runs)}
+            print("%s: %.3f +/- %.3f reference runs" % (name, results[name]["relative_time"]["mean"],
+                                                        results[name]["relative_time"]["ci"]), flush=True)
+    return results
+
+
+def compare(baseline: Dict[str, Dict[str, Dict[str, float]]], current: Dict[str, Dict[str, Dict[str, float]]],
+            threshold: float, calls_threshold: float) -> Tuple[List[str], bool]:
+    """
+    :return: the lines of the comparison report and whether a metric regressed
+    """
+    lines = ["%-10s %-13s %24s %24s %9s  %s" % ("scenario", "metric", "baseline", "current", "change", "status")]
+    regressed = False
+    for scenario, metrics in current.items():
+        for metric, now in metrics.items():
+            before = baseline.get(scenario, {}).get(metric)
+            if before is None:
+                lines.append("%-10s %-13s %24s %17.4g +/- %-4.2g %9s  new" % (scenario, metric, "-", now["mean"],
+                                                                              now["ci"], "-"))
+                continue
+
+            change = (now["mean"] - before["mean"]) / before["mean"] if before["mean"] else 0.0
+            if metric in COUNT_METRICS:
+                worse = change > calls_threshold
+            else:
+                worse = change > threshold and now["mean"] - now["ci"] > before["mean"] + before["ci"]
+            better = change < -threshold and now["mean"] + now["ci"] < before["mean"] - before["ci"]
+
+            status = "REGRESSION" if worse else ("improved" if better else "ok")
+            regressed = regressed or worse
+            lines.append("%-10s %-13s %14.4g +/- %-7.2g %14.4g +/- %-7.2g %+8.1f%%  %s" % (
+                scenario, metric, before["mean"], before["ci"], now["mean"], now["ci"], 100 * change, status))
+    return lines, regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail when the standard game scenarios got slower than the baseline")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--repeats", type=int, default=7, help="timed games per scenario")
+    parser.add_argument("--memory-repeats", type=int, default=2, help="games per scenario under tracemalloc")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative increase of game time / memory counted as a regression")
+    parser.add_argument("--calls-threshold", type=float, default=0.0,
+                        help="relative increase of LLM calls / steps counted as a regression")
+    parser.add_argument("--update-baseline", action="store_true", help="write the measurements as the new baseline")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    measurements = measure(args.repeats, args.memory_repeats)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": "%s, Python %s" % (platform.platform(), platform.python_version()),
+                       "scenarios": measurements}, f, indent=2)
+            f.write("\n")
+        print("Baseline written to %s" % args.baseline)
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at %s, run with --update-baseline first" % args.baseline)
+        sys.exit(2)
+
+    with open(args.baseline) as f:
+        baseline_data = json.load(f)
+
+    report, has_regression = compare(baseline_data["scenarios"], measurements, args.threshold, args.calls_threshold)
+    print("Baseline measured on %s" % baseline_data.get("machine", "an unknown machine"))
+    print("\n".join(report))
+    sys.exit(1 if has_regression else 0)
@@ -0,0 +1,353 @@
+"""
+Agents hosted out of the environment process.
+
+An agent server hosts agents in its own process and answers requests sent over `multiprocessing.connection`
+sockets. Requests and replies are pickled tuples, carrying the `NegotiationMessage`s and the arguments of the
+agent calls. Every connection hosts one agent, created by the first request of the connection, and is served by
+its own thread of the server.
+
+The environment talks to a hosted agent through a `RemoteOwnerAgent` / `RemoteCompanyAgent` proxy, which has the
+`HouseOwnerAgent` / `CompanyAgent` interface. In game.cfg, an `agents` entry chooses where its agents run with
+`host`:
+  - "local" (default): in the environment process
+  - "process": in one of the `agent_workers` worker processes started by the environment (round robin)
+  - "<host>:<port>": in an agent server started on another host with
+        AGENT_SERVER_AUTHKEY=<secret> python remote_agents.py serve --host 0.0.0.0 --port 6000
+
+Requests are unpickled by the server, so whoever knows the key can run code on the agent host: the server refuses to
+start without AGENT_SERVER_AUTHKEY, and only listens on the loopback interface unless given another `--host`.
+
+The LLM interactions of a hosted agent are logged in its server process. The environment collects them at the end
+of the game, so `llm_interactions_log` and the token ledger still cover every agent.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import threading
+import traceback
+from multiprocessing.connection import Listener, Client, Connection
+from typing import Any, Dict, List, Optional, Tuple
+
+from agents import HouseOwnerAgent, CompanyAgent, load_agent_class
+from communication import NegotiationMessage
+
+logger = logging.getLogger("remote_agents")
+
+LOCAL_HOST = "local"
+PROCESS_HOST = "process"
+
+AUTHKEY_VARIABLE = "AGENT_SERVER_AUTHKEY"
+
+# request kinds
+CREATE = "create"
+CALL = "call"
+POST = "post"
+COLLECT_INTERACTIONS = "collect_interactions"
+CLOSE = "close"
+
+# reply status
+OK = "ok"
+ERROR = "error"
+
+
+class RemoteAgentError(Exception):
+    """
+    Raised by a proxy when the hosted agent raised an exception, or when no authentication key is set
+    """
+    pass
+
+
+def server_authkey() -> bytes:
+    """
+    :return: the key shared by the agent servers and the environments that use them
+    :raise RemoteAgentError: if AGENT_SERVER_AUTHKEY is not set
+    """
+    authkey = os.environ.get(AUTHKEY_VARIABLE, "")
+    if not authkey:
+        raise RemoteAgentError("%s must be set to a secret shared by the agent servers and the environment"
+                               % AUTHKEY_VARIABLE)
+    return authkey.encode()
+
+
+def parse_address(host: str) -> Tuple[str, int]:
+    hostname, port = host.rsplit(":", 1)
+    return hostname, int(port)
+
+
+class AgentServer(object):
+    """
+    Hosts agents for remote environments, one agent per connection
+    """
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes):
+        self._listener = Listener(address, authkey=authkey)
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._listener.address
+
+    def serve_forever(self) -> None:
+        while True:
+            connection = self._listener.accept()
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    @staticmethod
+    def _serve(connection: Connection) -> None:
+        agent = None
+        while True:
+            try:
+                request = connection.recv()
+            except EOFError:
+                break
+
+            kind = request[0]
+            if kind == CLOSE:
+                break
+
+            try:
+                if kind == CREATE:
+                    agent = AgentServer._create_agent(*request[1:])
+                    result = agent.name
+                elif kind == COLLECT_INTERACTIONS:
+                    result = AgentServer._collect_interactions(agent.name)
+                else:
+                    method, args = request[1:]
+                    result = getattr(agent, method)(*args)
+            except Exception:
+                if kind == POST:
+                    # the agent is None if the request came before (or instead of) a successful CREATE
+                    logger.exception("Agent %s failed to handle %s" % (agent.name if agent else None, request[1]))
+                else:
+                    connection.send((ERROR, traceback.format_exc()))
+                continue
+
+            if kind != POST:
+                connection.send((OK, result))
+
+        connection.close()
+
+    @staticmethod
+    def _create_agent(module_name: str, class_name: str, role: str, init_arg: List[Dict[str, Any]],
+                      options: Dict[str, Any]):
+        agent = load_agent_class(module_name, class_name)(role, init_arg)
+        agent.configure(options)
+        return agent
+
+    @staticmethod
+    def _collect_interactions(agent_name: str) -> List[Dict[str, Any]]:
+        """
+        Takes the LLM interactions of an agent out of the interaction log of the server process
+        """
+        from agents.student_agent import llm_interactions_log
+
+        entries = [entry for entry in llm_interactions_log if entry.get("agent_name") == agent_name]
+        llm_interactions_log[:] = [entry for entry in llm_interactions_log if entry.get("agent_name") != agent_name]
+        return entries
+
+
+class RemoteAgentConnection(object):
+    """
+    Client side of the connection to a hosted agent. Calls from several threads (e.g. with simultaneous items)
+    are serialized.
+    """
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes):
+        self._connection = Client(address, authkey=authkey)
+        self._lock = threading.Lock()
+
+    def request(self, *request) -> Any:
+        with self._lock:
+            self._connection.send(request)
+            status, result = self._connection.recv()
+
+        if status == ERROR:
+            raise RemoteAgentError(result)
+        return result
+
+    def call(self, method: str, *args) -> Any:
+        return self.request(CALL, method, args)
+
+    def post(self, method: str, *args) -> None:
+        """
+        Sends a call that expects no reply, e.g. a notification
+        """
+        with self._lock:
+            self._connection.send((POST, method, args))
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.send((CLOSE,))
+            self._connection.close()
+
+
+class RemoteOwnerAgent(HouseOwnerAgent):
+    """
+    Proxy of a house owner agent hosted by an agent server
+    """
+    def __init__(self, remote: RemoteAgentConnection, name: str, role: str, budget_list: List[Dict[str, Any]]):
+        super(RemoteOwnerAgent, self).__init__(role, budget_list)
+        self.name = name
+        self.remote = remote
+
+    def reset(self) -> None:
+        self.remote.call("reset")
+
+    def notify_item_feasibility(self, feasibility: Dict[str, Dict[str, Any]]) -> None:
+        self.remote.post("notify_item_feasibility", feasibility)
+
+    def propose_item_budget(self, auction_item: str, auction_round: int) -> float:
+        return self.remote.call("propose_item_budget", auction_item, auction_round)
+
+    def notify_auction_round_result(self, auction_item: str, auction_round: int, responding_agents: List[str]) -> None:
+        self.remote.post("notify_auction_round_result", auction_item, auction_round, responding_agents)
+
+    def provide_negotiation_offer(self, negotiation_item: str, partner_agent: str, negotiation_round: int) -> float:
+        return self.remote.call("provide_negotiation_offer", negotiation_item, partner_agent, negotiation_round)
+
+    def expected_partner_responses(self, negotiation_item: str, partner_agent: str,
+                                   negotiation_round: int) -> List[float]:
+        return self.remote.call("expected_partner_responses", negotiation_item, partner_agent, negotiation_round)
+
+    def speculate_negotiation_offer(self, negotiation_item: str, partner_agent: str, negotiation_round: int,
+                                    expected_response: float) -> None:
+        self.remote.call("speculate_negotiation_offer", negotiation_item, partner_agent, negotiation_round,
+                         expected_response)
+
+    def notify_partner_response(self, response_msg: NegotiationMessage) -> None:
+        self.remote.post("notify_partner_response", response_msg)
+
+    def notify_negotiation_winner(self, negotiation_item: str, winning_agent: str, winning_offer: float) -> None:
+        self.remote.post("notify_negotiation_winner", negotiation_item, winning_agent, winning_offer)
+
+
+class RemoteCompanyAgent(CompanyAgent):
+    """
+    Proxy of a company agent hosted by an agent server
+    """
+    def __init__(self, remote: RemoteAgentConnection, name: str, role: str, specialties: List[Dict[str, Any]]):
+        super(RemoteCompanyAgent, self).__init__(role, specialties)
+        self.name = name
+        self.remote = remote
+
+    def reset(self) -> None:
+        self.remote.call("reset")
+
+    def decide_bid(self, auction_item: str, auction_round: int, item_budget: float) -> bool:
+        return self.remote.call("decide_bid", auction_item, auction_round, item_budget)
+
+    def notify_won_auction(self, auction_item: str, auction_round: int, num_selected: int) -> None:
+        self.remote.post("notify_won_auction", auction_item, auction_round, num_selected)
+
+    def respond_to_offer(self, initiator_msg: NegotiationMessage) -> float:
+        return self.remote.call("respond_to_offer", initiator_msg)
+
+    def notify_contract_assigned(self, construction_item: str, price: float) -> None:
+        self.remote.post("notify_contract_assigned", construction_item, price)
+
+    def notify_negotiation_lost(self, construction_item: str) -> None:
+        self.remote.post("notify_negotiation_lost", construction_item)
+
+    def notify_reply_discarded(self, message: Any) -> None:
+        self.remote.post("notify_reply_discarded", message)
+
+
+def _run_worker(address_pipe: Connection, authkey: bytes) -> None:
+    server = AgentServer(("127.0.0.1", 0), authkey)
+    address_pipe.send(server.address)
+    address_pipe.close()
+    server.serve_forever()
+
+
+class AgentHosts(object):
+    """
+    Creates the hosted agents of a game: in worker processes started on demand, or on remote agent servers
+    """
+
+    def __init__(self, num_workers: int):
+        self._num_workers = num_workers
+        self._workers: List[multiprocessing.Process] = []
+        self._worker_addresses: List[Tuple[str, int]] = []
+        self._worker_authkey = os.urandom(16)
+        self._next_worker = 0
+        self.agents: List[Any] = []
+
+    def _start_workers(self) -> None:
+        if self._num_workers < 1:
+            raise ValueError("Agents with host '%s' need agent_workers >= 1" % PROCESS_HOST)
+
+        # spawn rather than fork: the environment may already run threads (message bus, simultaneous items)
+        context = multiprocessing.get_context("spawn")
+        for _ in range(self._num_workers):
+            parent_end, child_end = context.Pipe(duplex=False)
+            worker = context.Process(target=_run_worker, args=(child_end, self._worker_authkey), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+            self._worker_addresses.append(parent_end.recv())
+
+    def create_agent(self, host: str, owner: bool, module_name: str, class_name: str, role: str,
+                     init_arg: List[Dict[str, Any]], options: Dict[str, Any]):
+        """
+        Creates an agent on the given host
+        :param host: "process" for a worker process of the environment, "<host>:<port>" for an agent server
+        :param owner: True for the house owner agent, False for a company agent
+        :return: the proxy of the hosted agent
+        """
+        if host == PROCESS_HOST:
+            if not self._workers:
+                self._start_workers()
+            address, authkey = self._worker_addresses[self._next_worker], self._worker_authkey
+            self._next_worker = (self._next_worker + 1) % len(self._worker_addresses)
+        else:
+            address, authkey = parse_address(host), server_authkey()
+
+        remote = RemoteAgentConnection(address, authkey)
+        name = remote.request(CREATE, module_name, class_name, role, init_arg, options)
+        agent = RemoteOwnerAgent(remote, name, role, init_arg) if owner else \
+            RemoteCompanyAgent(remote, name, role, init_arg)
+        self.agents.append(agent)
+        return agent
+
+    def collect_interactions(self) -> List[Dict[str, Any]]:
+        """
+        :return: the LLM interactions logged by the hosted agents since the last collection
+        """
+        entries = []
+        for agent in self.agents:
+            entries.extend(agent.remote.request(COLLECT_INTERACTIONS))
+        return entries
+
+    def close(self) -> None:
+        for agent in self.agents:
+            agent.remote.close()
+        self.agents = []
+
+        for worker in self._workers:
+            worker.terminate()
+            worker.join()
+        self._workers = []
+
+
+if __name__ == "__main__":
+    import yaml
+    import logging.config
+
+    with open('logging_conf.yaml', 'r') as f:
+        logging.config.dictConfig(yaml.safe_load(f.read()))
+
+    parser = argparse.ArgumentParser(description="Host agents for environments running on other hosts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_cmd = commands.add_parser("serve")
+    serve_cmd.add_argument("--host", default="127.0.0.1",
+                           help="interface to listen on, e.g. 0.0.0.0 for all (loopback only by default)")
+    serve_cmd.add_argument("--port", type=int, default=6000)
+    args = parser.parse_args()
+
+    try:
+        authkey = server_authkey()
+    except RemoteAgentError as e:
+        parser.error(str(e))
+
+    agent_server = AgentServer((args.host, args.port), authkey)
+    print("Hosting agents on %s:%i" % agent_server.address)
+    agent_server.serve_forever()
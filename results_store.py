@@ -0,0 +1,218 @@
+"""
+SQLite store of game outcomes.
+
+Every game is one row of `games` (run, configuration hash, owner / company strategies, scenario, success, error,
+duration, LLM usage) and one row of `items` per construction item (budget, auction round and price, number of
+selected companies, negotiation winner, its cost and the final price). Both tables are indexed on the columns used
+to select games, so that aggregate queries over millions of games stay fast.
+
+Rows are buffered and written in batches, one transaction per batch:
+
+    with ResultsStore("results.sqlite") as store:
+        store.add(result)   # a result of tournament.play_game
+
+The tournament writes its games with `--results-db FILE`, `environment.py --results-db FILE` adds the game it played.
+
+    python results_store.py summary results.sqlite
+    python results_store.py query results.sqlite "SELECT winner, COUNT(*) FROM items GROUP BY winner"
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id              INTEGER PRIMARY KEY,
+    run             TEXT NOT NULL,
+    game            TEXT NOT NULL,
+    config_hash     TEXT NOT NULL,
+    owner           TEXT NOT NULL,
+    company         TEXT NOT NULL,
+    scenario        INTEGER,
+    successful      INTEGER NOT NULL,
+    error           TEXT,
+    duration        REAL NOT NULL,
+    recorded_at     REAL NOT NULL,
+    llm_calls       INTEGER,
+    input_tokens    INTEGER,
+    output_tokens   INTEGER
+);
+CREATE TABLE IF NOT EXISTS items (
+    game_id         INTEGER NOT NULL REFERENCES games(id),
+    item            TEXT NOT NULL,
+    budget          REAL,
+    auction_round   INTEGER,
+    auction_price   REAL,
+    selected        INTEGER,
+    winner          TEXT,
+    winner_cost     REAL,
+    price           REAL
+);
+CREATE INDEX IF NOT EXISTS games_run ON games(run);
+CREATE INDEX IF NOT EXISTS games_config ON games(config_hash);
+CREATE INDEX IF NOT EXISTS games_strategies ON games(owner, company);
+CREATE INDEX IF NOT EXISTS items_game ON items(game_id);
+CREATE INDEX IF NOT EXISTS items_item ON items(item, winner);
+"""
+
+GAME_COLUMNS = ("run", "game", "config_hash", "owner", "company", "scenario", "successful", "error", "duration",
+                "recorded_at", "llm_calls", "input_tokens", "output_tokens")
+ITEM_COLUMNS = ("game_id", "item", "budget", "auction_round", "auction_price", "selected", "winner", "winner_cost",
+                "price")
+
+
+def config_hash(owner_cfg: Dict[str, Any], companies_cfg: Dict[str, Any], game_cfg: Dict[str, Any]) -> str:
+    """
+    :return: hash identifying a game configuration, the same for equal configurations whatever their key order
+    """
+    canonical = json.dumps([owner_cfg, companies_cfg, game_cfg], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def strategies(game_cfg: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    :return: the "<module>:<class>" strategies of the owner and of the companies of a game configuration (the
+    company strategies joined with "," when the companies do not all use the same one)
+    """
+    owner, companies = [], []
+    for ag_data in game_cfg["agents"]:
+        spec = "%s:%s" % (ag_data["module"], ag_data["class"])
+        if "ACME" in ag_data["roles"]:
+            owner.append(spec)
+        elif spec not in companies:
+            companies.append(spec)
+    return ",".join(owner), ",".join(companies)
+
+
+class ResultsStore(object):
+    """
+    Writes game results to a SQLite database, in batches of `batch_size` games per transaction
+    """
+
+    def __init__(self, path: str, run: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        :param run: name of the batch of games, stored with every game (default: the time the store was opened)
+        """
+        self.run = run or time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.batch_size = batch_size
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(SCHEMA)
+        self._pending: List[Dict[str, Any]] = []
+
+    def __enter__(self) -> "ResultsStore":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def add(self, result: Dict[str, Any]) -> None:
+        """
+        Buffers a game result, with the fields of the results of `tournament.play_game`: owner, company, scenario,
+        successful, error, duration, results (`BuildingEnvironment.game_results`), tokens and config_hash
+        """
+        self._pending.append(result)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+
+        recorded_at = time.time()
+        with self._connection:
+            # one transaction for the whole batch
+            cursor = self._connection.cursor()
+            for result in self._pending:
+                tokens = result.get("tokens") or {}
+                cursor.execute("INSERT INTO games (%s) VALUES (%s)" % (", ".join(GAME_COLUMNS),
+                                                                       ", ".join("?" * len(GAME_COLUMNS))),
+                               (self.run, result.get("game") or _game_name(result), result["config_hash"],
+                                result["owner"], result["company"], result.get("scenario"),
+                                int(result["successful"]), result.get("error"), result["duration"], recorded_at,
+                                tokens.get("calls"), tokens.get("input_tokens"), tokens.get("output_tokens")))
+                cursor.executemany("INSERT INTO items (%s) VALUES (%s)" % (", ".join(ITEM_COLUMNS),
+                                                                           ", ".join("?" * len(ITEM_COLUMNS))),
+                                   _item_rows(cursor.lastrowid, result.get("results")))
+        self._pending = []
+
+    def query(self, sql: str, params: Iterable[Any] = ()) -> List[Tuple]:
+        self.flush()
+        return self._connection.execute(sql, tuple(params)).fetchall()
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
+
+
+def _game_name(result: Dict[str, Any]) -> str:
+    return "%s|%s|%s" % (result["owner"], result["company"], result.get("scenario"))
+
+
+def _item_rows(game_id: int, game_results: Optional[Dict[str, Any]]) -> List[Tuple]:
+    if not game_results:
+        return []
+
+    rows = []
+    for item, item_res in game_results["items"].items():
+        rows.append((game_id, item, game_results["owner_budget"].get(item), item_res["auction_round"],
+                     item_res["auction_price"], len(item_res["selected"]), item_res["winner"],
+                     item_res["winner_cost"], item_res["price"]))
+    return rows
+
+
+SUMMARY_QUERY = """
+SELECT g.owner, g.company, i.item, COUNT(*), AVG(i.price), AVG(i.budget - i.price), AVG(i.price - i.winner_cost),
+       AVG(i.auction_round)
+FROM items i JOIN games g ON g.id = i.game_id
+WHERE i.price IS NOT NULL
+GROUP BY g.owner, g.company, i.item
+ORDER BY g.owner, g.company, i.item
+"""
+
+
+def summary(store: ResultsStore) -> List[str]:
+    """
+    Per strategy pairing: games and success rate, then per item the contracts, mean price, owner savings, company
+    profit and auction round
+    """
+    items: Dict[Tuple[str, str], List[Tuple]] = {}
+    for owner, company, *item_row in store.query(SUMMARY_QUERY):
+        items.setdefault((owner, company), []).append(item_row)
+
+    lines = []
+    for owner, company, games, successful, duration in store.query(
+            "SELECT owner, company, COUNT(*), SUM(successful), AVG(duration) FROM games "
+            "GROUP BY owner, company ORDER BY owner, company"):
+        lines.append("#### %s vs %s: %i games, %.1f%% successful, %.2fs per game" %
+                     (owner, company, games, 100.0 * successful / games, duration))
+        lines.append("%-25s %10s %12s %10s %10s %8s" % ("item", "contracts", "mean price", "savings", "profit",
+                                                       "auction"))
+        for item, contracts, price, savings, profit, auction_round in items.get((owner, company), []):
+            lines.append("%-25s %10i %12.2f %10.2f %10.2f %8.2f" % (item, contracts, price, savings or 0.0,
+                                                                    profit or 0.0, auction_round))
+    return lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the SQLite store of game results")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary_cmd = commands.add_parser("summary")
+    summary_cmd.add_argument("db")
+    query_cmd = commands.add_parser("query")
+    query_cmd.add_argument("db")
+    query_cmd.add_argument("sql")
+    args = parser.parse_args()
+
+    results_store = ResultsStore(args.db)
+    try:
+        if args.command == "summary":
+            print("\n".join(summary(results_store)))
+        else:
+            for row in results_store.query(args.sql):
+                print("\t".join(str(value) for value in row))
+    finally:
+        results_store.close()
@@ -0,0 +1,229 @@
+"""
+Synthetic large-scale scenarios and scaling benchmark of `BuildingEnvironment`.
+
+`generate` writes an owner, a companies and a game configuration with any number of companies and construction
+items. Every item has a base cost drawn between `--min-base-cost` and `--max-base-cost`; company costs are drawn
+around it with the chosen distribution (uniform, normal or lognormal, of relative spread `--cost-spread`), and the
+owner budget is the base cost increased by `--budget-margin`. Every item gets at least one specialist.
+
+    python scaling_benchmark.py generate --companies 5000 --items 40 --out-dir scenarios/large
+
+`run` plays one game on generated scenarios for every (companies, items) pair of the grid, with the deterministic
+stub LLM backend (`llm_backend: "stub"`, no API calls), and reports the duration, the time per step, the time per
+agent decision and the peak traced memory. The growth exponents (log of the ratio of durations over log of the
+ratio of sizes, between consecutive sizes) tell how the game scales: ~1 is linear, ~2 is quadratic.
+
+    python scaling_benchmark.py run --companies 10 100 1000 --items 4 16
+"""
+import argparse
+import contextlib
+import io
+import logging
+import math
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List, Tuple
+
+import yaml
+
+COST_DISTRIBUTIONS = ("uniform", "normal", "lognormal")
+MAX_STEPS_PER_GAME = 100000
+
+
+def draw_cost(rng: random.Random, base_cost: float, distribution: str, spread: float) -> int:
+    if distribution == "uniform":
+        factor = rng.uniform(1 - spread, 1 + spread)
+    elif distribution == "normal":
+        factor = rng.gauss(1.0, spread / 2)
+    elif distribution == "lognormal":
+        factor = rng.lognormvariate(0.0, spread / 2)
+    else:
+        raise ValueError("Unknown cost distribution '%s', expected one of %s" % (distribution, COST_DISTRIBUTIONS))
+    return max(1, round(base_cost * factor))
+
+
+def generate_scenario(num_companies: int, num_items: int, specialties_per_company: int = 3,
+                      distribution: str = "uniform", cost_spread: float = 0.3, budget_margin: float = 0.1,
+                      min_base_cost: float = 2000, max_base_cost: float = 12000,
+                      seed: int = 0) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Builds a synthetic owner and companies configuration
+    :param specialties_per_company: number of items each company can build
+    :param cost_spread: relative spread of the company costs around the base cost of an item
+    :param budget_margin: owner budget of an item relative to its base cost (0.1 for 10% above)
+    :return: (owner configuration, companies configuration), in the format of the .cfg files
+    """
+    rng = random.Random(seed)
+    items = ["item %03i" % idx for idx in range(num_items)]
+    base_costs = {item: rng.uniform(min_base_cost, max_base_cost) for item in items}
+    owner_cfg = {"elements": [{"name": item, "budget": round(base_costs[item] * (1 + budget_margin))}
+                              for item in items]}
+
+    specialties_per_company = min(specialties_per_company, num_items)
+    companies = []
+    for idx in range(num_companies):
+        # the first companies cover the items in turn, so that no item is left without a specialist
+        specialties = {items[idx % num_items]} if idx < num_items else set()
+        specialties.update(rng.sample(items, specialties_per_company - len(specialties)))
+        companies.append({
+            "name": "C%05i" % idx,
+            "specialties": [{"specialty": item, "cost": draw_cost(rng, base_costs[item], distribution, cost_spread)}
+                            for item in sorted(specialties)],
+        })
+
+    return owner_cfg, {"companies": companies}
+
+
+def build_game_cfg(company_roles: List[str], llm_backend: str = "stub",
+                   company_spec: Tuple[str, str] = ("student_agent", "MyCompanyAgent"),
+                   owner_spec: Tuple[str, str] = ("student_agent", "MyACMEAgent")) -> Dict[str, Any]:
+    return {
+        "nr_auction_rounds": 3,
+        "nr_negotiation_rounds": 3,
+        "infeasible_items": "flag",
+        "llm_backend": llm_backend,
+        "agents": [
+            {"module": company_spec[0], "class": company_spec[1], "roles": list(company_roles)},
+            {"module": owner_spec[0], "class": owner_spec[1], "roles": ["ACME"]},
+        ],
+    }
+
+
+def write_scenario(out_dir: str, owner_cfg: Dict[str, Any], companies_cfg: Dict[str, Any],
+                   game_cfg: Dict[str, Any]) -> Tuple[str, str, str]:
+    """
+    :return: paths of the owner, companies and game configuration files written to `out_dir`
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = (os.path.join(out_dir, "config-ACME-project.cfg"), os.path.join(out_dir, "config-companies.cfg"),
+             os.path.join(out_dir, "game.cfg"))
+    for path, cfg in zip(paths, (owner_cfg, companies_cfg, game_cfg)):
+        with open(path, "w") as f:
+            yaml.safe_dump(cfg, f, sort_keys=False)
+    return paths
+
+
+def run_game(owner_cfg_file: str, companies_cfg_file: str, game_cfg_file: str) -> Dict[str, Any]:
+    """
+    Plays one game in this process and measures it
+    :return: the duration, number of steps, number of agent decisions, peak traced memory and success of the game
+    """
+    from environment import BuildingEnvironment
+    from agents import student_agent
+
+    del student_agent.llm_interactions_log[:]
+    student_agent.token_ledger.reset()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        env = BuildingEnvironment(owner_cfg_file=owner_cfg_file, companies_cfg_file=companies_cfg_file,
+                                  game_cfg_file=game_cfg_file)
+        env.initialize()
+        init_duration = time.perf_counter() - start
+
+        steps = 0
+        while not env.goals_completed() and steps < MAX_STEPS_PER_GAME:
+            env.step()
+            steps += 1
+    duration = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    decisions = len(student_agent.llm_interactions_log)
+    del student_agent.llm_interactions_log[:]
+    return {"duration": duration, "init_duration": init_duration, "steps": steps, "decisions": decisions,
+            "peak_traced": peak, "successful": env.game_results()["successful"]}
+
+
+def growth_exponent(size_before: int, size_after: int, value_before: float, value_after: float) -> float:
+    if size_after == size_before or value_before <= 0 or value_after <= 0:
+        return float("nan")
+    return math.log(value_after / value_before) / math.log(size_after / size_before)
+
+
+def run_benchmark(company_counts: List[int], item_counts: List[int], distribution: str = "uniform",
+                  cost_spread: float = 0.3, specialties_per_company: int = 3, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Plays one game per (number of companies, number of items) pair on freshly generated scenarios
+    :return: one measurement per pair, with the growth exponents of the duration and of the peak memory relative
+    to the previous number of companies (for the same number of items)
+    """
+    measurements = []
+    with tempfile.TemporaryDirectory(prefix="scaling_") as tmp_dir:
+        for num_items in item_counts:
+            previous = None
+            for num_companies in company_counts:
+                owner_cfg, companies_cfg = generate_scenario(num_companies, num_items, specialties_per_company,
+                                                             distribution, cost_spread, seed=seed)
+                game_cfg = build_game_cfg([comp["name"] for comp in companies_cfg["companies"]])
+                paths = write_scenario(os.path.join(tmp_dir, "%i_%i" % (num_companies, num_items)),
+                                       owner_cfg, companies_cfg, game_cfg)
+
+                measurement = dict(run_game(*paths), companies=num_companies, items=num_items)
+                if previous is not None:
+                    measurement["time_exponent"] = growth_exponent(previous["companies"], num_companies,
+                                                                   previous["duration"], measurement["duration"])
+                    measurement["memory_exponent"] = growth_exponent(previous["companies"], num_companies,
+                                                                     previous["peak_traced"],
+                                                                     measurement["peak_traced"])
+                measurements.append(measurement)
+                previous = measurement
+                print(format_measurement(measurement), flush=True)
+
+    return measurements
+
+
+def format_measurement(measurement: Dict[str, Any]) -> str:
+    return "%9i %6i %8s %7i %10i %10.3f %9.3f %12.1f %12.1f %10.2f %10.2f" % (
+        measurement["companies"], measurement["items"], measurement["successful"], measurement["steps"],
+        measurement["decisions"], measurement["duration"], measurement["init_duration"],
+        1e6 * measurement["duration"] / max(measurement["decisions"], 1), measurement["peak_traced"] / 2 ** 20,
+        measurement.get("time_exponent", float("nan")), measurement.get("memory_exponent", float("nan")))
+
+
+BENCHMARK_HEADER = "%9s %6s %8s %7s %10s %10s %9s %12s %12s %10s %10s" % (
+    "companies", "items", "success", "steps", "decisions", "time (s)", "init (s)", "us/decision", "peak MiB",
+    "time exp", "mem exp")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate large scenarios and measure how the game scales")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for command in ("generate", "run"):
+        cmd = commands.add_parser(command)
+        cmd.add_argument("--distribution", choices=COST_DISTRIBUTIONS, default="uniform",
+                         help="distribution of the company costs around the base cost of an item")
+        cmd.add_argument("--cost-spread", type=float, default=0.3, help="relative spread of the company costs")
+        cmd.add_argument("--specialties", type=int, default=3, help="number of items each company can build")
+        cmd.add_argument("--seed", type=int, default=0)
+
+    generate_cmd = commands.choices["generate"]
+    generate_cmd.add_argument("--companies", type=int, required=True)
+    generate_cmd.add_argument("--items", type=int, required=True)
+    generate_cmd.add_argument("--budget-margin", type=float, default=0.1,
+                              help="owner budget of an item relative to its base cost")
+    generate_cmd.add_argument("--llm-backend", default="stub", help="llm_backend of the generated game.cfg")
+    generate_cmd.add_argument("--out-dir", required=True)
+
+    run_cmd = commands.choices["run"]
+    run_cmd.add_argument("--companies", type=int, nargs="+", default=[10, 100, 1000])
+    run_cmd.add_argument("--items", type=int, nargs="+", default=[4, 16])
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        owner, companies = generate_scenario(args.companies, args.items, args.specialties, args.distribution,
+                                             args.cost_spread, args.budget_margin, seed=args.seed)
+        files = write_scenario(args.out_dir, owner, companies,
+                               build_game_cfg([comp["name"] for comp in companies["companies"]], args.llm_backend))
+        print("Scenario written to %s" % ", ".join(files))
+    else:
+        logging.disable(logging.INFO)
+        print(BENCHMARK_HEADER)
+        run_benchmark(sorted(args.companies), args.items, args.distribution, args.cost_spread, args.specialties,
+                      args.seed)
@@ -0,0 +1,204 @@
+"""
+Token accounting for the LLM calls made by the agents.
+
+Every LLM call records its input and output token counts in a `TokenLedger`, using the usage metadata returned by
+the API when available and a characters-per-token estimate otherwise. The ledger aggregates the counts per game,
+agent, stage and item, and projects the cost of running a batch of games.
+
+The same report can be built offline from interaction logs (plain or compact):
+    python token_accounting.py llm_interactions_log.jsonl --games 10000
+"""
+import argparse
+import math
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+# Average number of characters per token, for estimates when the API does not report usage
+CHARS_PER_TOKEN = 4.0
+
+# USD per million (input, output) tokens; list prices at the time of writing, override them from the command line
+MODEL_PRICING: Dict[str, Tuple[float, float]] = {
+    "gemini-2.5-flash-preview-05-20": (0.15, 0.60),
+    "gemini-1.5-flash-latest": (0.075, 0.30),
+}
+DEFAULT_MODEL = "gemini-2.5-flash-preview-05-20"
+
+LEDGER_DIMENSIONS = ("game", "agent", "stage", "item")
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def response_usage(response: Any) -> Optional[Tuple[int, int]]:
+    """
+    Reads the token usage reported by the Gemini API for a response
+    :return: (input tokens, output tokens), or None if the response carries no usage metadata
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+
+    input_tokens = getattr(usage, "prompt_token_count", None)
+    output_tokens = getattr(usage, "candidates_token_count", None)
+    if input_tokens is None or output_tokens is None:
+        return None
+
+    return int(input_tokens), int(output_tokens)
+
+
+def call_cost(input_tokens: int, output_tokens: int, model: str = DEFAULT_MODEL,
+              pricing: Dict[str, Tuple[float, float]] = None) -> float:
+    price_in, price_out = (pricing or MODEL_PRICING)[model]
+    return (input_tokens * price_in + output_tokens * price_out) / 1e6
+
+
+class TokenLedger(object):
+    """
+    Aggregates the token usage of LLM calls per (game, agent, stage, item). Calls can come from several threads,
+    e.g. with simultaneous items.
+    """
+
+    def __init__(self, model: str = DEFAULT_MODEL):
+        self.model = model
+        self.game: str = "game_0"
+        self._games: List[str] = [self.game]
+        self._totals: Dict[Tuple[str, str, str, str], Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def new_game(self, game: str = None) -> None:
+        """
+        Starts accounting the calls of a new game
+        :param game: identifier of the game, generated if not given. Without an identifier, a game that did not
+        account any call yet goes on, so that environments can call it at the start of every game
+        """
+        with self._lock:
+            if game is None and not any(key[0] == self.game for key in self._totals):
+                return
+            self.game = game if game is not None else "game_%i" % len(self._games)
+            self._games.append(self.game)
+
+    def record(self, agent_name: str, stage: str, item: str, input_tokens: int, output_tokens: int,
+               estimated: bool = False) -> None:
+        key = (self.game, agent_name, stage, item)
+        with self._lock:
+            totals = self._totals.setdefault(key, {"calls": 0, "input_tokens": 0, "output_tokens": 0,
+                                                   "estimated_calls": 0})
+            totals["calls"] += 1
+            totals["input_tokens"] += input_tokens
+            totals["output_tokens"] += output_tokens
+            if estimated:
+                totals["estimated_calls"] += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals.clear()
+            self._games = [self.game]
+
+    @property
+    def num_games(self) -> int:
+        return len(set(key[0] for key in self._totals)) or 1
+
+    def totals(self, group_by: Tuple[str, ...] = ("agent",)) -> Dict[Tuple, Dict[str, int]]:
+        """
+        :param group_by: dimensions among "game", "agent", "stage" and "item"
+        :return: dict mapping the values of the grouping dimensions to the summed counts
+        """
+        positions = [LEDGER_DIMENSIONS.index(dim) for dim in group_by]
+        grouped: Dict[Tuple, Dict[str, int]] = {}
+        with self._lock:
+            for key, totals in self._totals.items():
+                group = grouped.setdefault(tuple(key[pos] for pos in positions),
+                                           {"calls": 0, "input_tokens": 0, "output_tokens": 0, "estimated_calls": 0})
+                for name, value in totals.items():
+                    group[name] += value
+
+        return grouped
+
+    def projection(self, num_games: int, pricing: Dict[str, Tuple[float, float]] = None) -> Dict[str, float]:
+        """
+        Projects the token usage and cost of `num_games` games from the average of the games accounted so far
+        """
+        overall = self.totals(group_by=()).get((), {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+        per_game = {name: overall[name] / self.num_games for name in ("calls", "input_tokens", "output_tokens")}
+        game_cost = call_cost(per_game["input_tokens"], per_game["output_tokens"], self.model, pricing)
+
+        return {
+            "games": num_games,
+            "calls": per_game["calls"] * num_games,
+            "input_tokens": per_game["input_tokens"] * num_games,
+            "output_tokens": per_game["output_tokens"] * num_games,
+            "cost_per_game": game_cost,
+            "cost": game_cost * num_games,
+        }
+
+    def report(self, group_by: Tuple[str, ...] = ("agent", "stage"), projected_games: int = 1000,
+               pricing: Dict[str, Tuple[float, float]] = None) -> str:
+        lines = ["%-45s %7s %12s %12s %10s" % (" / ".join(group_by), "calls", "input tok", "output tok",
+                                                "cost USD")]
+        for group, totals in sorted(self.totals(group_by).items(), key=lambda kv: -kv[1]["input_tokens"]):
+            lines.append("%-45s %7i %12i %12i %10.4f" % (" / ".join(str(value) for value in group), totals["calls"],
+                                                         totals["input_tokens"], totals["output_tokens"],
+                                                         call_cost(totals["input_tokens"], totals["output_tokens"],
+                                                                   self.model, pricing)))
+
+        projection = self.projection(projected_games, pricing)
+        lines.append("Model %s, %i game(s) accounted, %.4f USD per game -> %.2f USD and %.3g input / %.3g output "
+                     "tokens for %i games" % (self.model, self.num_games, projection["cost_per_game"],
+                                              projection["cost"], projection["input_tokens"],
+                                              projection["output_tokens"], projected_games))
+        return "\n".join(lines)
+
+
+def record_log_entry(ledger: TokenLedger, entry: Dict[str, Any]) -> None:
+    """
+    Adds a logged LLM interaction to a ledger, with its recorded usage or, for older logs, estimated from the text.
+    Surrogate policy decisions, logged with "surrogate", made no LLM call and are skipped.
+    """
+    if entry.get("surrogate"):
+        return
+
+    usage = entry.get("usage")
+    if usage:
+        input_tokens, output_tokens, estimated = usage["input_tokens"], usage["output_tokens"], usage["estimated"]
+    else:
+        input_tokens = estimate_tokens(entry.get("system_prompt")) + estimate_tokens(entry.get("user_prompt"))
+        output_tokens = estimate_tokens(str(entry.get("llm_response") or ""))
+        estimated = True
+
+    ledger.record(entry.get("agent_name"), entry.get("interaction_stage"), entry.get("item_name"),
+                  input_tokens, output_tokens, estimated)
+
+
+if __name__ == "__main__":
+    from llm_log import read_log
+
+    parser = argparse.ArgumentParser(description="Token usage and cost projection from LLM interaction logs")
+    parser.add_argument("logs", nargs="+")
+    parser.add_argument("--by", default="agent,stage", help="comma separated dimensions among %s" %
+                                                             (LEDGER_DIMENSIONS,))
+    parser.add_argument("--games", type=int, default=1000, help="number of games to project the cost for")
+    parser.add_argument("--model", default=DEFAULT_MODEL, choices=sorted(MODEL_PRICING))
+    parser.add_argument("--price-in", type=float, help="USD per million input tokens")
+    parser.add_argument("--price-out", type=float, help="USD per million output tokens")
+    args = parser.parse_args()
+
+    model_pricing = dict(MODEL_PRICING)
+    if args.price_in is not None or args.price_out is not None:
+        default_in, default_out = MODEL_PRICING[args.model]
+        model_pricing[args.model] = (args.price_in if args.price_in is not None else default_in,
+                                     args.price_out if args.price_out is not None else default_out)
+
+    log_ledger = TokenLedger(args.model)
+    for log_path in args.logs:
+        # every log file is a game, unless its records name their game (as in tournament logs)
+        log_ledger.new_game(log_path)
+        for log_entry in read_log(log_path):
+            if log_entry.get("game") is not None and log_entry["game"] != log_ledger.game:
+                log_ledger.new_game(log_entry["game"])
+            record_log_entry(log_ledger, log_entry)
+
+    print(log_ledger.report(tuple(dim.strip() for dim in args.by.split(",") if dim.strip()), args.games,
+                            model_pricing))
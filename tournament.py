@@ -0,0 +1,372 @@
+"""
+Round-robin tournament harness for owner / company strategies.
+
+Every owner strategy is paired with every company strategy and each pairing is played on a set of
+cost / budget scenarios derived from the base configuration files. Games run in parallel worker processes and
+the results are aggregated into leaderboards for owner savings, company profit and failure rate.
+
+Strategies are given as "<module>:<class>", where <module> lives in the `agents` package, exactly as in game.cfg:
+
+    python tournament.py --owner student_agent:MyACMEAgent \
+                         --company student_agent:MyCompanyAgent \
+                         --scenarios 20 --workers 4
+"""
+import argparse
+import contextlib
+import copy
+import io
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+from typing import List, Dict, Any, Tuple
+
+import yaml
+
+from llm_log import CompactLogWriter
+from negotiation_trace import NegotiationTrace
+from results_store import ResultsStore, config_hash
+from token_accounting import call_cost
+
+
+DEFAULT_OWNER_CFG = "config-ACME-project.cfg"
+DEFAULT_COMPANIES_CFG = "config-companies.cfg"
+DEFAULT_GAME_CFG = "game.cfg"
+
+MAX_STEPS_PER_GAME = 1000
+
+# per worker process writer of the LLM interactions, when the tournament keeps them
+_llm_log_writer = None
+
+
+def parse_strategy(spec: str) -> Tuple[str, str]:
+    """
+    Splits a "<module>:<class>" strategy specification
+    :param spec: the strategy specification, e.g. "student_agent:MyACMEAgent"
+    :return: (module, class) tuple
+    """
+    if ":" not in spec:
+        raise ValueError("Strategy must be given as <module>:<class>, got '%s'" % spec)
+
+    module, klass = spec.split(":", 1)
+    return module, klass
+
+
+def generate_scenarios(owner_cfg: Dict[str, Any], companies_cfg: Dict[str, Any], num_scenarios: int,
+                       spread: float, seed: int) -> List[Dict[str, Any]]:
+    """
+    Builds a list of scenarios by perturbing the owner budgets and company costs of the base configuration.
+    Scenario 0 is always the unperturbed base configuration.
+    :param owner_cfg: parsed owner configuration (with an `elements` list)
+    :param companies_cfg: parsed companies configuration (with a `companies` list)
+    :param num_scenarios: number of scenarios to generate
+    :param spread: maximum relative perturbation applied to every budget and cost (e.g. 0.2 for +/-20%)
+    :param seed: random seed, so that the same scenarios can be replayed
+    :return: list of scenario dicts holding an `owner` and a `companies` configuration
+    """
+    scenarios = []
+    for idx in range(num_scenarios):
+        scenario_owner = copy.deepcopy(owner_cfg)
+        scenario_companies = copy.deepcopy(companies_cfg)
+
+        if idx > 0:
+            rng = random.Random(seed + idx)
+            for element in scenario_owner["elements"]:
+                element["budget"] = round(element["budget"] * rng.uniform(1 - spread, 1 + spread))
+
+            for company in scenario_companies["companies"]:
+                for spec in company["specialties"]:
+                    spec["cost"] = round(spec["cost"] * rng.uniform(1 - spread, 1 + spread))
+
+        scenarios.append({"id": idx, "owner": scenario_owner, "companies": scenario_companies})
+
+    return scenarios
+
+
+def build_game_cfg(base_game_cfg: Dict[str, Any], owner_spec: str, company_spec: str,
+                   company_roles: List[str]) -> Dict[str, Any]:
+    """
+    Builds a game configuration in which the owner and all the companies use the given strategies
+    """
+    owner_module, owner_class = parse_strategy(owner_spec)
+    company_module, company_class = parse_strategy(company_spec)
+
+    game_cfg = {key: value for key, value in base_game_cfg.items() if key != "agents"}
+    game_cfg["agents"] = [
+        {"module": company_module, "class": company_class, "roles": list(company_roles)},
+        {"module": owner_module, "class": owner_class, "roles": ["ACME"]},
+    ]
+    return game_cfg
+
+
+def game_id(result: Dict[str, Any]) -> str:
+    return result["owner"] + "|" + result["company"] + "|" + str(result["scenario"])
+
+
+def play_game(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Worker entry point: plays a single game for one (owner strategy, company strategy, scenario) triple
+    :param task: dict with the `owner`, `company` strategy specs, the `scenario` and the `game_cfg` to use
+    :return: the task identification together with the game results (or the error that ended the game)
+    """
+    result = {
+        "owner": task["owner"],
+        "company": task["company"],
+        "scenario": task["scenario"]["id"],
+        "successful": False,
+        "error": None,
+        "duration": 0.0,
+        "results": None,
+        "tokens": None,
+        "trace": None,
+        "config_hash": config_hash(task["scenario"]["owner"], task["scenario"]["companies"], task["game_cfg"]),
+    }
+
+    with tempfile.TemporaryDirectory(prefix="tournament_") as tmp_dir:
+        owner_file = os.path.join(tmp_dir, "owner.cfg")
+        companies_file = os.path.join(tmp_dir, "companies.cfg")
+        game_file = os.path.join(tmp_dir, "game.cfg")
+
+        for file_name, cfg in ((owner_file, task["scenario"]["owner"]),
+                               (companies_file, task["scenario"]["companies"]),
+                               (game_file, task["game_cfg"])):
+            with open(file_name, "w") as f:
+                yaml.safe_dump(cfg, f)
+
+        output = io.StringIO() if task.get("quiet", True) else sys.stdout
+        start = time.perf_counter()
+        env = None
+        try:
+            with contextlib.redirect_stdout(output):
+                from environment import BuildingEnvironment
+
+                env = BuildingEnvironment(owner_cfg_file=owner_file, companies_cfg_file=companies_file,
+                                          game_cfg_file=game_file)
+                env.initialize()
+
+                steps = 0
+                while not env.goals_completed() and steps < MAX_STEPS_PER_GAME:
+                    env.step()
+                    steps += 1
+
+            game_results = env.game_results()
+            result["successful"] = game_results["successful"]
+            result["results"] = game_results
+
+            if task.get("trace"):
+                result["trace"] = NegotiationTrace()
+                env.record_negotiations(result["trace"], game=game_id(result))
+        except Exception as e:
+            result["error"] = "%s: %s" % (e.__class__.__name__, e)
+        finally:
+            result["duration"] = time.perf_counter() - start
+            if env is not None:
+                # also when the game raised: its message bus, agent hosts and threads must not outlive it in the worker
+                env.close()
+
+            # the LLM interaction log is module global, do not let it grow across the games of a worker
+            student_agent = sys.modules.get("agents.student_agent")
+            if student_agent is not None:
+                if _llm_log_writer is not None:
+                    for entry in student_agent.llm_interactions_log:
+                        _llm_log_writer.write(dict(entry, game=game_id(result)))
+                    _llm_log_writer.flush()
+                del student_agent.llm_interactions_log[:]
+
+                result["tokens"] = student_agent.token_ledger.totals(group_by=()).get((), None)
+                student_agent.token_ledger.reset()
+
+    return result
+
+
+def _init_worker(quiet: bool, llm_log_dir: str) -> None:
+    global _llm_log_writer
+
+    if quiet:
+        logging.disable(logging.INFO)
+
+    if llm_log_dir:
+        # one compact log per worker, so that workers never write to the same file
+        log_path = os.path.join(llm_log_dir, "llm_interactions_%i.jsonl.gz" % os.getpid())
+        _llm_log_writer = CompactLogWriter(log_path, append=True)
+
+
+def build_leaderboards(game_results: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Aggregates the game results into leaderboards
+    :param game_results: list of results as returned by `play_game`
+    :return: dict with the `owners`, `companies` and `pairings` leaderboards, each sorted best first
+    """
+    owners: Dict[str, Dict[str, Any]] = {}
+    companies: Dict[str, Dict[str, Any]] = {}
+    pairings: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    for res in game_results:
+        owner_stats = owners.setdefault(res["owner"], {"strategy": res["owner"], "games": 0, "failures": 0,
+                                                       "total_savings": 0.0})
+        company_stats = companies.setdefault(res["company"], {"strategy": res["company"], "games": 0,
+                                                              "failures": 0, "total_profit": 0.0,
+                                                              "contracts": 0})
+        pairing_stats = pairings.setdefault((res["owner"], res["company"]),
+                                            {"owner": res["owner"], "company": res["company"], "games": 0,
+                                             "failures": 0})
+
+        for stats in (owner_stats, company_stats, pairing_stats):
+            stats["games"] += 1
+            if not res["successful"]:
+                stats["failures"] += 1
+
+        if not res["successful"]:
+            continue
+
+        game = res["results"]
+        for item, item_res in game["items"].items():
+            if item_res["price"] is None:
+                continue
+
+            owner_stats["total_savings"] += game["owner_budget"].get(item, 0) - item_res["price"]
+            if item_res["winner_cost"] is not None:
+                company_stats["total_profit"] += item_res["price"] - item_res["winner_cost"]
+                company_stats["contracts"] += 1
+
+    for stats_group in (owners, companies, pairings):
+        for stats in stats_group.values():
+            stats["failure_rate"] = stats["failures"] / stats["games"] if stats["games"] else 0.0
+
+    for stats in owners.values():
+        stats["avg_savings"] = stats["total_savings"] / stats["games"] if stats["games"] else 0.0
+    for stats in companies.values():
+        stats["avg_profit"] = stats["total_profit"] / stats["games"] if stats["games"] else 0.0
+
+    return {
+        "owners": sorted(owners.values(), key=lambda s: (-s["avg_savings"], s["failure_rate"])),
+        "companies": sorted(companies.values(), key=lambda s: (-s["avg_profit"], s["failure_rate"])),
+        "pairings": sorted(pairings.values(), key=lambda s: (s["failure_rate"], s["owner"], s["company"])),
+    }
+
+
+def print_leaderboards(leaderboards: Dict[str, List[Dict[str, Any]]]) -> None:
+    print("\n#### Owner leaderboard (savings) ####")
+    print("%-45s %8s %12s %10s" % ("strategy", "games", "avg savings", "fail rate"))
+    for stats in leaderboards["owners"]:
+        print("%-45s %8i %12.2f %9.1f%%" % (stats["strategy"], stats["games"], stats["avg_savings"],
+                                            100 * stats["failure_rate"]))
+
+    print("\n#### Company leaderboard (profit) ####")
+    print("%-45s %8s %12s %10s %10s" % ("strategy", "games", "avg profit", "contracts", "fail rate"))
+    for stats in leaderboards["companies"]:
+        print("%-45s %8i %12.2f %10i %9.1f%%" % (stats["strategy"], stats["games"], stats["avg_profit"],
+                                                 stats["contracts"], 100 * stats["failure_rate"]))
+
+    print("\n#### Pairings (failure rate) ####")
+    print("%-35s %-35s %8s %10s" % ("owner", "company", "games", "fail rate"))
+    for stats in leaderboards["pairings"]:
+        print("%-35s %-35s %8i %9.1f%%" % (stats["owner"], stats["company"], stats["games"],
+                                           100 * stats["failure_rate"]))
+
+
+def run_tournament(owner_specs: List[str], company_specs: List[str], num_scenarios: int = 10,
+                   spread: float = 0.2, seed: int = 0, workers: int = None,
+                   owner_cfg_file: str = DEFAULT_OWNER_CFG, companies_cfg_file: str = DEFAULT_COMPANIES_CFG,
+                   game_cfg_file: str = DEFAULT_GAME_CFG, quiet: bool = True,
+                   llm_log_dir: str = None, negotiation_trace: str = None,
+                   results_db: str = None) -> List[Dict[str, Any]]:
+    """
+    Plays every (owner strategy, company strategy) pairing on every scenario in a pool of worker processes
+    :param llm_log_dir: if given, every worker saves the LLM interactions of its games to a compact log in it
+    :param negotiation_trace: if given, the negotiation rounds of all the games are saved to this .npz file
+    :param results_db: if given, the outcome of every game is added to this SQLite results store
+    :return: the list of individual game results
+    """
+    if llm_log_dir:
+        os.makedirs(llm_log_dir, exist_ok=True)
+
+    with open(owner_cfg_file) as f:
+        owner_cfg = yaml.safe_load(f)
+    with open(companies_cfg_file) as f:
+        companies_cfg = yaml.safe_load(f)
+    with open(game_cfg_file) as f:
+        base_game_cfg = yaml.safe_load(f)
+
+    company_roles = [comp["name"] for comp in companies_cfg["companies"]]
+    scenarios = generate_scenarios(owner_cfg, companies_cfg, num_scenarios, spread, seed)
+
+    tasks = []
+    for owner_spec in owner_specs:
+        for company_spec in company_specs:
+            game_cfg = build_game_cfg(base_game_cfg, owner_spec, company_spec, company_roles)
+            for scenario in scenarios:
+                tasks.append({"owner": owner_spec, "company": company_spec, "scenario": scenario,
+                              "game_cfg": game_cfg, "quiet": quiet, "trace": bool(negotiation_trace)})
+
+    print("Running %i games (%i owner x %i company strategies x %i scenarios)" %
+          (len(tasks), len(owner_specs), len(company_specs), len(scenarios)))
+
+    results = []
+    trace = NegotiationTrace()
+    store = ResultsStore(results_db) if results_db else None
+    with Pool(processes=workers, initializer=_init_worker, initargs=(quiet, llm_log_dir)) as pool:
+        for res in pool.imap_unordered(play_game, tasks):
+            if store is not None:
+                # buffered, written in one transaction per batch of games
+                store.add(dict(res, game=game_id(res)))
+            if res["trace"] is not None:
+                # merged into the tournament trace, so that the results do not keep one trace per game
+                trace.merge(res.pop("trace"))
+            results.append(res)
+            status = "OK" if res["successful"] else ("ERROR " + res["error"] if res["error"] else "FAILED")
+            print("[%i/%i] %s vs %s, scenario %i: %s (%.2fs)" % (len(results), len(tasks), res["owner"],
+                                                                 res["company"], res["scenario"], status,
+                                                                 res["duration"]))
+
+    if store is not None:
+        store.close()
+        print("Game results saved to %s (run %s)" % (results_db, store.run))
+
+    if negotiation_trace:
+        trace.save(negotiation_trace)
+        print("Negotiation trace (%i messages) saved to %s" % (len(trace), negotiation_trace))
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Round-robin tournament between owner and company strategies")
+    parser.add_argument("--owner", action="append", required=True,
+                        help="owner strategy as <module>:<class> (can be repeated)")
+    parser.add_argument("--company", action="append", required=True,
+                        help="company strategy as <module>:<class> (can be repeated)")
+    parser.add_argument("--scenarios", type=int, default=10, help="number of cost/budget scenarios")
+    parser.add_argument("--spread", type=float, default=0.2, help="relative perturbation of budgets and costs")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the scenario generation")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: #cpus)")
+    parser.add_argument("--owner-cfg", default=DEFAULT_OWNER_CFG)
+    parser.add_argument("--companies-cfg", default=DEFAULT_COMPANIES_CFG)
+    parser.add_argument("--game-cfg", default=DEFAULT_GAME_CFG)
+    parser.add_argument("--verbose", action="store_true", help="do not silence the game output of the workers")
+    parser.add_argument("--llm-log-dir", default=None,
+                        help="directory where the workers save the LLM interactions in the compact log format")
+    parser.add_argument("--negotiation-trace", default=None,
+                        help="save the negotiation rounds of all the games as typed columns to this .npz file")
+    parser.add_argument("--results-db", default=None,
+                        help="add the outcome of every game to this SQLite results store")
+    args = parser.parse_args()
+
+    tournament_results = run_tournament(args.owner, args.company, num_scenarios=args.scenarios,
+                                        spread=args.spread, seed=args.seed, workers=args.workers,
+                                        owner_cfg_file=args.owner_cfg, companies_cfg_file=args.companies_cfg,
+                                        game_cfg_file=args.game_cfg, quiet=not args.verbose,
+                                        llm_log_dir=args.llm_log_dir,
+                                        negotiation_trace=args.negotiation_trace,
+                                        results_db=args.results_db)
+    print_leaderboards(build_leaderboards(tournament_results))
+
+    game_tokens = [res["tokens"] for res in tournament_results if res["tokens"]]
+    if game_tokens:
+        print("\nLLM usage: %i calls, %i input / %i output tokens (%.4f USD) over %i games" %
+              (sum(t["calls"] for t in game_tokens), sum(t["input_tokens"] for t in game_tokens),
+               sum(t["output_tokens"] for t in game_tokens),
+               sum(call_cost(t["input_tokens"], t["output_tokens"]) for t in game_tokens), len(game_tokens)))